@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+import threading
+from config import CACHE_DIR, RATE_LIMIT_ENABLED
+
+
+class PooledKey:
+    """One API key with its long-lived backend and quota overrides"""
+
+    def __init__(self, name, api_key, backend, rate_limits=None, scoped=False):
+        """
+        Initialize a pooled key
+
+        Args:
+            name: Name shown in statistics
+            api_key: The Gemini API key
+            backend: Backend making the requests of this key
+            rate_limits: Model -> {"rpm", "tpm"} overriding the backend's quotas
+            scoped: Keep uploads, caches and chat states of this key apart from other keys'
+        """
+        self.name = name
+        self.backend = backend
+        self.rate_limits = rate_limits or {}
+        # Identifies the key across restarts and renames without storing the key itself
+        self.fingerprint = hashlib.md5(api_key.encode()).hexdigest()[:8]
+        self.scope = self.fingerprint if scoped else ""
+        # Backends given by set_backend() are not reused for the configured keys
+        self.is_override = False
+
+    def scoped(self, value):
+        """Get the name of project-bound state (uploads, caches, chat states) for this key"""
+        return f"{value}@{self.scope}" if self.scope else value
+
+    def get_bucket(self, model):
+        """Get the rate limiter bucket of a model on this key"""
+        return f"{model}@{self.name}" if self.scope else model
+
+    def get_rate_limits(self, model):
+        """Get the quotas of a model on this key, or None if it is not limited"""
+        limits = self.backend.get_rate_limits(model) if self.backend else None
+        if RATE_LIMIT_ENABLED and model in self.rate_limits:
+            limits = {**(limits or {}), **self.rate_limits[model]}
+        return limits
+
+
+class ApiKeyPool:
+    """
+    API keys of several projects sharing the load, each profile assigned to one of them
+
+    Uploaded files and context caches belong to the project of the key that created
+    them, so a profile stays on its assigned key. Its requests only go to another key
+    while the assigned one is throttled, which primes a separate session there.
+    """
+
+    def __init__(self, rate_limiter):
+        """Initialize an empty pool, see configure()"""
+        self.rate_limiter = rate_limiter
+        self.keys = []  # PooledKey, the primary key first
+        self._assignments = {}  # Profile name -> key fingerprint
+        self._lock = threading.Lock()
+        self.stats = {"overflow_requests": 0}
+        self._load_assignments()
+
+    def _get_assignments_filepath(self):
+        """Get the file path of the persisted profile assignments"""
+        return os.path.join(CACHE_DIR, "api_key_assignments.json")
+
+    def _load_assignments(self):
+        """Load the profile assignments of earlier runs"""
+        assignments_file = self._get_assignments_filepath()
+        try:
+            if os.path.exists(assignments_file):
+                with open(assignments_file, 'r') as f:
+                    self._assignments = json.load(f)
+        except Exception as e:
+            print(f"Error loading API key assignments: {str(e)}")
+            self._assignments = {}
+
+    def _persist_assignments(self):
+        """Save the profile assignments to disk"""
+        try:
+            with open(self._get_assignments_filepath(), 'w') as f:
+                json.dump(self._assignments, f)
+        except Exception as e:
+            print(f"Error persisting API key assignments: {str(e)}")
+
+    def configure(self, key_entries, create_backend):
+        """
+        Replace the keys of the pool, keeping the backends and open connections of keys that remain
+
+        Args:
+            key_entries: List of {"name", "key", "rate_limits"} dictionaries, the primary key first
+            create_backend: Callable creating the backend of an API key
+        """
+        backends = {key.fingerprint: key.backend for key in self.keys if not key.is_override}
+        entries, seen = [], set()
+        for entry in key_entries:
+            if entry.get("key", "") not in seen:  # The same key listed twice
+                seen.add(entry.get("key", ""))
+                entries.append(entry)
+        keys, names = [], set()
+        for index, entry in enumerate(entries):
+            name = entry.get("name") or f"key{index + 1}"
+            if name in names:  # Names identify rate limiter buckets
+                name = f"{name}{index + 1}"
+            names.add(name)
+            # The primary key keeps the state it had before other keys were added
+            key = PooledKey(name, entry.get("key", ""), None,
+                            entry.get("rate_limits"), index > 0)
+            key.backend = backends.get(key.fingerprint) or create_backend(entry.get("key", ""))
+            keys.append(key)
+        with self._lock:
+            self.keys = keys
+        self.rate_limiter.set_limits_source(self.get_bucket_limits)
+
+    def use_backend(self, backend):
+        """Replace the pool with a single key served by a given backend"""
+        with self._lock:
+            self.keys = [PooledKey("default", "", backend)]
+            self.keys[0].is_override = True
+        self.rate_limiter.set_limits_source(self.get_bucket_limits)
+
+    @property
+    def primary(self):
+        """Get the primary key, or None without keys"""
+        keys = self.keys
+        return keys[0] if keys else None
+
+    def get_bucket_limits(self, bucket):
+        """Get the quotas of a rate limiter bucket, as named by PooledKey.get_bucket()"""
+        model, _, name = bucket.partition("@")
+        for key in self.keys:
+            if not name or key.name == name:
+                return key.get_rate_limits(model)
+        return None
+
+    def _get_capacity(self, key, model):
+        """Get the requests per minute a key allows on a model, unlimited keys counting as very large"""
+        limits = key.get_rate_limits(model)
+        return limits.get("rpm", 0) if limits and limits.get("rpm") else 10 ** 6
+
+    def get_home_key(self, profile_name, model):
+        """
+        Get the key a profile is assigned to, assigning new profiles to the key with the most quota per profile
+
+        Returns:
+            A PooledKey, or None without keys
+        """
+        keys = self.keys
+        if len(keys) <= 1:
+            return keys[0] if keys else None
+        with self._lock:
+            fingerprint = self._assignments.get(profile_name)
+            for key in keys:
+                if key.fingerprint == fingerprint:
+                    return key
+
+            profile_counts = {key.fingerprint: 0 for key in keys}
+            for assigned in self._assignments.values():
+                if assigned in profile_counts:
+                    profile_counts[assigned] += 1
+            home = max(keys, key=lambda key: self._get_capacity(key, model) / (1 + profile_counts[key.fingerprint]))
+            self._assignments[profile_name] = home.fingerprint
+            self._persist_assignments()
+        print(f"Profile {profile_name} assigned to API key {home.name}")
+        return home
+
+    def pick_key(self, profile_name, model):
+        """Get the key for a new generation: the profile's own key unless it is throttled and another key is not"""
+        home = self.get_home_key(profile_name, model)
+        if home is None or len(self.keys) <= 1 or not self.rate_limiter.is_throttled(home.get_bucket(model)):
+            return home
+        others = [key for key in self.keys if key is not home and key.backend is not None
+                  and not self.rate_limiter.is_throttled(key.get_bucket(model))]
+        if not others:
+            return home
+        with self._lock:
+            self.stats["overflow_requests"] += 1
+        return max(others, key=lambda key: self.rate_limiter.get_headroom(key.get_bucket(model)))
+
+    def get_stats(self):
+        """Get the assigned profile count of every key and the requests sent to a key other than the profile's own"""
+        with self._lock:
+            assignments = list(self._assignments.values())
+            stats = dict(self.stats)
+        stats["keys"] = {key.name: {"profiles": assignments.count(key.fingerprint)} for key in self.keys}
+        return stats
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Cover Letter Generator Benchmark
+--------------------------------
+Drives GeminiClient.generate_cover_letter_with_files against the offline StubBackend
+and reports time-to-first-chunk, total latency, throughput under concurrency and
+the cost of each session setup stage.
+
+Scenarios:
+    cold          Nothing cached: hash, upload, prime and save on every letter
+    warm_state    Primed chat state on disk, nothing in memory
+    warm_memory   Primed chat history already in memory
+    large_resume  Cold, with a large resume PDF to hash and upload
+    concurrent    Warm, with --concurrency letters in flight at once
+
+--serialization instead times loading and saving a primed chat history through
+the trusted format (JSON rebuilt with model_construct) against pydantic's TypeAdapter JSON validation.
+
+Every run appends one JSON line per scenario to the output file so runs can be
+compared over time. Profiles, caches and chat states live in a throwaway data
+directory, so the real ones are never touched.
+
+Examples:
+    python benchmark.py
+    python benchmark.py --scenarios cold warm_state --iterations 10
+    python benchmark.py --concurrency 8 --first-chunk-latency 0.8 --jitter 0.3
+    python benchmark.py --scenarios concurrent --concurrency 8 --quota-rpm 60
+    python benchmark.py --serialization --iterations 2000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ("cold", "warm_state", "warm_memory", "large_resume", "concurrent")
+DEFAULT_OUTPUT = "benchmark_results.jsonl"
+# GeminiClient methods timed as setup stages
+STAGE_METHODS = {
+    "_get_profile_hash": "profile_hash",
+    "_load_chat_state": "chat_state_load",
+    "_create_chat": "chats_create",
+    "_upload_profile_files": "file_upload",
+    "_save_chat_state": "chat_state_save",
+}
+BENCHMARK_JOB_DESCRIPTION = """Software Engineer ({n})
+We are looking for a software engineer to design, build and test Python services.
+You will collaborate with product and data teams, own features end to end and
+improve the performance and reliability of our systems."""
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cover letter generation pipeline against the offline stub backend.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=5,
+                        help="Letters per scenario (per worker for the concurrent scenario)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Letters in flight at once in the concurrent scenario")
+    parser.add_argument("--resume-mb", type=float, default=20.0,
+                        help="Size of the resume used by the large_resume scenario")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help="JSONL file results are appended to")
+    parser.add_argument("--serialization", action="store_true",
+                        help="Run the chat history serialization micro-benchmark instead of the scenarios")
+    parser.add_argument("--context-kb", type=float, default=50.0,
+                        help="Size of the personal context in the serialization micro-benchmark")
+    parser.add_argument("--data-dir", help="Data directory to use instead of a temporary one")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the client's diagnostic messages")
+
+    stub = parser.add_argument_group("stub backend")
+    stub.add_argument("--first-chunk-latency", type=float, default=0.4)
+    stub.add_argument("--chunk-latency", type=float, default=0.03)
+    stub.add_argument("--chunk-size", type=int, default=60)
+    stub.add_argument("--output-tokens", type=int, default=400)
+    stub.add_argument("--priming-latency", type=float, default=0.6)
+    stub.add_argument("--upload-latency", type=float, default=0.15)
+    stub.add_argument("--upload-mbps", type=float, default=5.0,
+                      help="Upload bandwidth in MiB per second")
+    stub.add_argument("--caching", action="store_true",
+                      help="Let the stub create context caches")
+    stub.add_argument("--jitter", type=float, default=0.0)
+    stub.add_argument("--tail-rate", type=float, default=0.0)
+    stub.add_argument("--error-rate", type=float, default=0.0)
+    stub.add_argument("--quota-rpm", type=int, default=0,
+                      help="Simulated requests per minute quota, 0 for none")
+    stub.add_argument("--quota-tpm", type=int, default=0,
+                      help="Simulated tokens per minute quota, 0 for none")
+    stub.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def get_stub_options(args):
+    """Get StubBackend keyword arguments from the command line"""
+    return {
+        "first_chunk_latency": args.first_chunk_latency,
+        "chunk_latency": args.chunk_latency,
+        "chunk_size": args.chunk_size,
+        "output_tokens": args.output_tokens,
+        "priming_latency": args.priming_latency,
+        "upload_latency": args.upload_latency,
+        "upload_bytes_per_second": args.upload_mbps * 1024 * 1024,
+        "supports_caching": args.caching,
+        "jitter": args.jitter,
+        "tail_rate": args.tail_rate,
+        "error_rate": args.error_rate,
+        "requests_per_minute": args.quota_rpm,
+        "tokens_per_minute": args.quota_tpm,
+        "seed": args.seed,
+    }
+
+
+def percentile(values, fraction):
+    """Get the nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(values):
+    """Summarize durations in seconds as milliseconds"""
+    if not values:
+        return None
+    return {
+        "mean": round(1000 * sum(values) / len(values), 2),
+        "p50": round(1000 * percentile(values, 0.5), 2),
+        "p95": round(1000 * percentile(values, 0.95), 2),
+        "max": round(1000 * max(values), 2),
+    }
+
+
+class TimedChat:
+    """Chat wrapper timing send_message, which on the streaming path is only the priming round trip"""
+
+    def __init__(self, chat, timer):
+        """Wrap a chat session"""
+        self._chat = chat
+        self._timer = timer
+
+    def send_message(self, *args, **kwargs):
+        """Send a message, timed as the priming stage"""
+        start = time.perf_counter()
+        try:
+            return self._chat.send_message(*args, **kwargs)
+        finally:
+            self._timer.record("priming", time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        """Delegate everything else to the wrapped chat"""
+        return getattr(self._chat, name)
+
+
+class StageTimer:
+    """Times GeminiClient setup stages by wrapping the methods that perform them"""
+
+    def __init__(self):
+        """Initialize the timer"""
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Record one duration for a stage"""
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        """Forget all recorded durations"""
+        with self._lock:
+            self.samples = {}
+
+    def _wrap(self, stage, method):
+        """Time every call of a method as a stage"""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def install(self, gemini_client):
+        """Wrap the stage methods of a GeminiClient instance"""
+        for method_name, stage in STAGE_METHODS.items():
+            setattr(gemini_client, method_name, self._wrap(
+                stage, getattr(gemini_client, method_name)))
+
+        create_chat = gemini_client._create_chat
+
+        def create_timed_chat(*args, **kwargs):
+            return TimedChat(create_chat(*args, **kwargs), self)
+        gemini_client._create_chat = create_timed_chat
+
+    def summary(self):
+        """Get count, mean and total milliseconds per stage"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": len(values),
+                    "mean": round(1000 * sum(values) / len(values), 2),
+                    "total": round(1000 * sum(values), 2),
+                }
+                for stage, values in sorted(self.samples.items())
+            }
+
+
+class Benchmark:
+    """Runs benchmark scenarios against a GeminiClient using the StubBackend"""
+
+    def __init__(self, args):
+        """Initialize the client, profile and timers in the current data directory"""
+        # Imported here so COVER_LETTER_HOME is set before config is loaded
+        from gemini_client import GeminiClient
+        from profile_manager import ProfileManager
+
+        self.args = args
+        self.stub_options = get_stub_options(args)
+        self.profile_manager = ProfileManager()
+        self.gemini_client = GeminiClient()
+        self.timer = StageTimer()
+        self.timer.install(self.gemini_client)
+        self._job_counter = 0
+
+    def _next_job_description(self):
+        """Get a distinct job description so no letter comes from the result cache"""
+        self._job_counter += 1
+        return BENCHMARK_JOB_DESCRIPTION.format(n=self._job_counter)
+
+    def _new_backend(self):
+        """Install a fresh stub backend so every scenario replays the same seed"""
+        from stub_backend import StubBackend
+        backend = StubBackend(**self.stub_options)
+        self.gemini_client.set_backend(backend)
+        return backend
+
+    def _reset_cold(self):
+        """Forget every cached session, upload and file digest"""
+        self.gemini_client.clear_caches()
+        self.gemini_client.upload_registry.clear()
+        self.gemini_client.file_hash_cache.clear()
+
+    def _reset_memory(self):
+        """Forget primed histories kept in memory, leaving chat states on disk"""
+        with self.gemini_client._chat_sessions_lock:
+            self.gemini_client.chat_sessions.clear()
+
+    def _generate(self, resume_path=None):
+        """Generate one letter, returning its timings"""
+        start = time.perf_counter()
+        first_chunk = []
+
+        def on_update(text):
+            if not first_chunk:
+                first_chunk.append(time.perf_counter())
+
+        letter = self.gemini_client.generate_cover_letter_with_files(
+            self._next_job_description(),
+            self.profile_manager.current_personal_context,
+            self.profile_manager.current_system_template,
+            resume_path,
+            update_ui_callback=on_update,
+            force_regenerate=True)
+        end = time.perf_counter()
+        return {
+            "ttfc": first_chunk[0] - start if first_chunk else None,
+            "total": end - start,
+            "ok": bool(letter) and not letter.startswith("Error generating cover letter"),
+        }
+
+    def _make_resume(self):
+        """Write a large placeholder resume PDF into the data directory"""
+        from config import FILES_DIR
+        resume_path = os.path.join(FILES_DIR, "benchmark_resume.pdf")
+        size = int(self.args.resume_mb * 1024 * 1024)
+        with open(resume_path, 'wb') as f:
+            f.write(b"%PDF-1.4\n")
+            f.write(os.urandom(max(0, size - 9)))
+        return resume_path
+
+    def run_scenario(self, scenario):
+        """Run one scenario, returning its result record"""
+        backend = self._new_backend()
+        self._reset_cold()
+        resume_path = self._make_resume() if scenario == "large_resume" else None
+        if scenario in ("warm_state", "warm_memory", "concurrent"):
+            self._generate()  # Prime once, not measured
+
+        self.timer.reset()
+        started = time.perf_counter()
+        if scenario == "concurrent":
+            count = self.args.iterations * self.args.concurrency
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+                runs = list(executor.map(lambda _: self._generate(), range(count)))
+        else:
+            runs = []
+            for _ in range(self.args.iterations):
+                if scenario in ("cold", "large_resume"):
+                    self._reset_cold()
+                elif scenario == "warm_state":
+                    self._reset_memory()
+                runs.append(self._generate(resume_path))
+        elapsed = time.perf_counter() - started
+
+        if resume_path:
+            os.remove(resume_path)
+        return {
+            "scenario": scenario,
+            "letters": len(runs),
+            "concurrency": self.args.concurrency if scenario == "concurrent" else 1,
+            "errors": sum(1 for run in runs if not run["ok"]),
+            "ttfc_ms": summarize([run["ttfc"] for run in runs if run["ttfc"] is not None]),
+            "total_ms": summarize([run["total"] for run in runs]),
+            "throughput_per_s": round(len(runs) / elapsed, 3) if elapsed else None,
+            "stages_ms": self.timer.summary(),
+            "backend_stats": dict(backend.stats),
+            "rate_limits": self.gemini_client.get_rate_limit_stats(),
+        }
+
+
+def run_serialization_benchmark(args):
+    """Time the trusted chat history format against TypeAdapter JSON, returning a result record"""
+    from google.genai import types
+    from chat_state_store import (history_adapter, encode_trusted_history,
+                                  decode_trusted_history, decode_json_history)
+
+    context = ("I build and test Python services end to end. " *
+               int(args.context_kb * 1024 / 46 + 1))[:int(args.context_kb * 1024)]
+    history = [
+        types.Content(role="user", parts=[
+            types.Part(text="sending info"),
+            types.Part(text=context),
+            types.Part(file_data=types.FileData(
+                file_uri="https://generativelanguage.googleapis.com/v1beta/files/resume",
+                mime_type="application/pdf")),
+        ]),
+        types.Content(role="model", parts=[types.Part(text="ok to proceed")]),
+    ]
+    json_history = history_adapter.dump_json(history)
+    trusted_history = encode_trusted_history(history)
+    if decode_trusted_history(trusted_history) != history or decode_json_history(json_history) != history:
+        raise RuntimeError("Serialized history does not round-trip")
+
+    def time_calls(function, data):
+        durations = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            function(data)
+            durations.append(1000 * (time.perf_counter() - start))
+        return summarize(durations)  # Milliseconds in, so the summary is in microseconds
+
+    return {
+        "scenario": "serialization",
+        "context_bytes": len(context),
+        "bytes": {"json": len(json_history), "trusted": len(trusted_history)},
+        "load_us": {"json": time_calls(decode_json_history, json_history),
+                    "trusted": time_calls(decode_trusted_history, trusted_history)},
+        "save_us": {"json": time_calls(history_adapter.dump_json, history),
+                    "trusted": time_calls(encode_trusted_history, history)},
+    }
+
+
+def format_serialization_result(result):
+    """Format a serialization result record as a short human-readable block"""
+    lines = [f"serialization: {result['context_bytes']} byte context, "
+             f"json {result['bytes']['json']} bytes, trusted {result['bytes']['trusted']} bytes"]
+    for operation in ("load_us", "save_us"):
+        json_us, trusted_us = result[operation]["json"], result[operation]["trusted"]
+        lines.append(
+            f"  {operation[:4]:<6}json p50 {json_us['p50']:.1f} us  trusted p50 {trusted_us['p50']:.1f} us"
+            f"  (speedup {json_us['mean'] / trusted_us['mean']:.1f}x)")
+    return "\n".join(lines)
+
+
+def get_commit():
+    """Get the current git commit of the code being measured, if any"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def format_result(result):
+    """Format a result record as a short human-readable block"""
+    def ms(summary, key):
+        return f"{summary[key]:.0f}" if summary else "-"
+
+    lines = [
+        f"{result['scenario']}: {result['letters']} letters, concurrency {result['concurrency']}, "
+        f"{result['errors']} errors, {result['throughput_per_s']} letters/s",
+        f"  first chunk ms  p50 {ms(result['ttfc_ms'], 'p50')}  p95 {ms(result['ttfc_ms'], 'p95')}",
+        f"  total ms        p50 {ms(result['total_ms'], 'p50')}  p95 {ms(result['total_ms'], 'p95')}",
+    ]
+    if result["backend_stats"]["quota_errors"]:
+        lines.append(f"  quota errors    {result['backend_stats']['quota_errors']}")
+    for stage, stats in result["stages_ms"].items():
+        lines.append(
+            f"  {stage:<16}{stats['count']:>4} calls  mean {stats['mean']:.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Benchmark entry point"""
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.output)
+
+    temp_dir = None
+    if args.data_dir:
+        os.environ["COVER_LETTER_HOME"] = args.data_dir
+    else:
+        temp_dir = tempfile.TemporaryDirectory(prefix="cover-letter-benchmark-")
+        os.environ["COVER_LETTER_HOME"] = temp_dir.name
+    os.environ["COVER_LETTER_BACKEND"] = "stub"
+
+    run_info = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "python": sys.version.split()[0],
+        "iterations": args.iterations,
+        "stub_backend": get_stub_options(args),
+    }
+
+    if args.serialization:
+        result = run_serialization_benchmark(args)
+        print(format_serialization_result(result))
+        with open(output_path, 'a') as f:
+            f.write(json.dumps({**run_info, **result}) + "\n")
+        print(f"Results appended to {output_path}")
+        if temp_dir:
+            temp_dir.cleanup()
+        return 0
+
+    log_target = sys.stdout if args.verbose else open(os.devnull, 'w')
+    try:
+        with contextlib.redirect_stdout(log_target):
+            benchmark = Benchmark(args)
+        for scenario in args.scenarios:
+            with contextlib.redirect_stdout(log_target):
+                result = benchmark.run_scenario(scenario)
+            print(format_result(result))
+            with open(output_path, 'a') as f:
+                f.write(json.dumps({**run_info, **result}) + "\n")
+    finally:
+        if not args.verbose:
+            log_target.close()
+        if temp_dir:
+            temp_dir.cleanup()
+
+    print(f"Results appended to {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
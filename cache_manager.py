@@ -2,7 +2,8 @@ import os
 import json
 import time
 import hashlib
-from config import CACHE_DIR, DEFAULT_CACHE_TTL
+import threading
+from config import CACHE_DIR, DEFAULT_CACHE_TTL, UNCACHEABLE_RETRY_AFTER
 
 
 class CacheManager:
@@ -21,7 +22,11 @@ class CacheManager:
         """Initialize the cache manager"""
         if not self._initialized:
             self.cache_registry = {}
+            # Cache key -> time until which no cache is created for it, as the API rejected caching
+            self.uncacheable = {}
             self.cache_ttl = DEFAULT_CACHE_TTL
+            # Caches are registered from batch, prewarm, hedge and job worker threads
+            self._lock = threading.Lock()
             self._load_cache_registry()
             self._initialized = True
 
@@ -33,19 +38,21 @@ class CacheManager:
 
     def save_cache_info(self, cache_key, cache_name, expiry_time):
         """Save cache information to registry"""
-        self.cache_registry[cache_key] = {
-            "cache_name": cache_name,
-            "expiry": expiry_time
-        }
-        # Save to disk too for persistence between app restarts
-        self._persist_cache_registry()
+        with self._lock:
+            self.cache_registry[cache_key] = {
+                "cache_name": cache_name,
+                "expiry": expiry_time
+            }
+            # Save to disk too for persistence between app restarts
+            self._persist_cache_registry()
 
     def _persist_cache_registry(self):
-        """Save registry to disk"""
+        """Save registry to disk, called with the lock held"""
         cache_file = os.path.join(CACHE_DIR, "cache_registry.json")
         try:
-            with open(cache_file, 'w') as f:
+            with open(cache_file + ".tmp", 'w') as f:
                 json.dump(self.cache_registry, f)
+            os.replace(cache_file + ".tmp", cache_file)
         except Exception as e:
             # Silently fail for cache registry persistence issues
             print(f"Error persisting cache registry: {str(e)}")
@@ -64,6 +71,46 @@ class CacheManager:
             print(f"Error loading cache registry: {str(e)}")
             self.cache_registry = {}
 
+        uncacheable_file = os.path.join(CACHE_DIR, "uncacheable_caches.json")
+        try:
+            if os.path.exists(uncacheable_file):
+                with open(uncacheable_file, 'r') as f:
+                    current_time = time.time()
+                    self.uncacheable = {
+                        k: until for k, until in json.load(f).items() if until > current_time
+                    }
+        except Exception as e:
+            print(f"Error loading uncacheable caches: {str(e)}")
+            self.uncacheable = {}
+
+    def _persist_uncacheable(self):
+        """Save the uncacheable keys to disk, called with the lock held"""
+        uncacheable_file = os.path.join(CACHE_DIR, "uncacheable_caches.json")
+        try:
+            with open(uncacheable_file + ".tmp", 'w') as f:
+                json.dump(self.uncacheable, f)
+            os.replace(uncacheable_file + ".tmp", uncacheable_file)
+        except Exception as e:
+            print(f"Error persisting uncacheable caches: {str(e)}")
+
+    def mark_uncacheable(self, cache_key, permanent=True):
+        """
+        Stop creating caches for a key after the API rejected one
+
+        Args:
+            cache_key: The key the cache was requested for
+            permanent: True if the model or context size rules caching out, so it is only retried
+                after UNCACHEABLE_RETRY_AFTER, False for failures that may pass within a cache TTL
+        """
+        with self._lock:
+            self.uncacheable[cache_key] = time.time() + (
+                UNCACHEABLE_RETRY_AFTER if permanent else self.cache_ttl)
+            self._persist_uncacheable()
+
+    def is_uncacheable(self, cache_key):
+        """Check whether creating a cache for a key is known to fail"""
+        return self.uncacheable.get(cache_key, 0) > time.time()
+
     def _clean_expired_caches(self):
         """Remove expired caches from registry"""
         current_time = time.time()
@@ -76,39 +123,55 @@ class CacheManager:
         """Check if we have a valid cache for this key and return config if found"""
         current_time = time.time()
 
-        if cache_key in self.cache_registry:
-            cache_info = self.cache_registry[cache_key]
+        cache_info = self.cache_registry.get(cache_key)
+        if cache_info is not None:
             if cache_info["expiry"] > current_time:
                 # Cache is valid, return its name
                 return cache_info["cache_name"]
 
         return None
 
+    def remove_cache(self, cache_key):
+        """Forget a cache the API no longer has, returning True if it was registered"""
+        with self._lock:
+            if self.cache_registry.pop(cache_key, None) is None:
+                return False
+            self._persist_cache_registry()
+        return True
+
     def set_cache_ttl(self, ttl):
         """Set the cache Time-To-Live in seconds"""
         self.cache_ttl = ttl
 
-    def delete_all_caches(self, api_client=None):
-        """Delete all caches through API and clear local registry"""
-        if api_client:
-            # Try to delete caches via API
-            for cache_key, info in list(self.cache_registry.items()):
+    def delete_all_caches(self, *backends):
+        """Delete all caches through the generation backends of every API key and clear local registry"""
+        for backend in backends:
+            if backend is None:
+                continue
+            # Try to delete caches via API, each backend only finds the caches of its own project
+            with self._lock:
+                registered = list(self.cache_registry.items())
+            for cache_key, info in registered:
                 if "cache_name" in info:
                     try:
-                        api_client.caches.delete(name=info["cache_name"])
+                        backend.delete_cache(info["cache_name"])
                     except Exception:
                         pass  # Ignore errors for individual cache deletions
 
-        # Clear local registry regardless of API success
-        self.cache_registry = {}
+        with self._lock:
+            # Clear local registry regardless of API success
+            self.cache_registry = {}
+            # Caching may work with another backend
+            self.uncacheable = {}
+            self._persist_uncacheable()
 
-        # Clear stored registry
-        cache_file = os.path.join(CACHE_DIR, "cache_registry.json")
-        if os.path.exists(cache_file):
-            try:
-                os.remove(cache_file)
-            except Exception:
-                pass
+            # Clear stored registry
+            cache_file = os.path.join(CACHE_DIR, "cache_registry.json")
+            if os.path.exists(cache_file):
+                try:
+                    os.remove(cache_file)
+                except Exception:
+                    pass
 
         return True
 
@@ -126,7 +189,9 @@ class CacheManager:
         current_time = time.time()
         active_caches = []
 
-        for cache_key, info in self.cache_registry.items():
+        with self._lock:
+            registered = list(self.cache_registry.items())
+        for cache_key, info in registered:
             if "expiry" in info and info["expiry"] > current_time:
                 time_left = info["expiry"] - current_time
                 active_caches.append({
@@ -0,0 +1,296 @@
+import os
+import time
+import zlib
+import base64
+import typing
+import functools
+import sqlite3
+import datetime
+import threading
+from enum import Enum
+import pydantic
+import pydantic_core
+from pydantic import BaseModel, TypeAdapter
+from google.genai import types
+from google.genai import version as genai_version
+from config import CHAT_STATE_MAX_BYTES, CHAT_STATE_COMPRESSION
+
+# Histories of unknown origin, e.g. migrated JSON files, are validated by pydantic on load
+JSON_FORMAT = "json"
+# Histories this app dumped from validated Content load without revalidation. They are plain
+# JSON, so a tampered file yields wrong data at worst, never code execution. The tag ties
+# them to the library versions that wrote them, other ones are treated as missing
+TRUSTED_FORMAT = f"json-trusted:{genai_version.__version__}:{pydantic.VERSION}"
+
+history_adapter = TypeAdapter(list[types.Content])
+
+
+def _find_type(annotation, base):
+    """Get the first class in a type annotation that subclasses base, or None"""
+    if isinstance(annotation, type):
+        return annotation if issubclass(annotation, base) else None
+    for argument in typing.get_args(annotation):
+        found = _find_type(argument, base)
+        if found is not None:
+            return found
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_field_kinds(model):
+    """Get how each field of a model is rebuilt from JSON: (kind, class) with kind "model", "bytes", "datetime", "enum" or None"""
+    kinds = {}
+    for name, field in model.model_fields.items():
+        nested = _find_type(field.annotation, BaseModel)
+        if nested is not None:
+            kinds[name] = ("model", nested)
+        elif _find_type(field.annotation, bytes) is not None:
+            kinds[name] = ("bytes", None)
+        elif _find_type(field.annotation, datetime.datetime) is not None:
+            kinds[name] = ("datetime", None)
+        elif _find_type(field.annotation, Enum) is not None:
+            kinds[name] = ("enum", _find_type(field.annotation, Enum))
+        else:
+            kinds[name] = (None, None)
+    return kinds
+
+
+def _construct_value(kind, cls, value):
+    """Rebuild a JSON value as the type of its field, without validation"""
+    if kind is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [_construct_value(kind, cls, item) for item in value]
+    if kind == "model":
+        return _construct_model(cls, value) if isinstance(value, dict) else value
+    if not isinstance(value, str):
+        return value
+    if kind == "bytes":  # Dumped as base64, standard or URL-safe
+        return base64.b64decode(value.replace("-", "+").replace("_", "/"))
+    if kind == "datetime":
+        return datetime.datetime.fromisoformat(value)
+    try:
+        return cls(value)
+    except ValueError:
+        return value  # Fields that also accept plain strings
+
+
+def _construct_model(model, data):
+    """Rebuild a model from its JSON dump with model_construct, which skips validation"""
+    kinds = _get_field_kinds(model)
+    return model.model_construct(**{name: _construct_value(*kinds[name], value)
+                                    for name, value in data.items() if name in kinds})
+
+
+def encode_trusted_history(history):
+    """Serialize a validated chat history in the trusted format"""
+    return history_adapter.dump_json(history, exclude_none=True)
+
+
+def decode_trusted_history(data):
+    """Deserialize a chat history this app wrote in the trusted format, skipping validation"""
+    return [_construct_model(types.Content, content) for content in pydantic_core.from_json(data)]
+
+
+def decode_json_history(data):
+    """Deserialize and strictly validate a JSON chat history"""
+    return history_adapter.validate_json(data)
+
+
+class ChatStateStore:
+    """Stores primed chat histories by profile hash in a single SQLite database"""
+
+    _instance = None
+
+    def __new__(cls, state_dir):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(ChatStateStore, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, state_dir):
+        """Open the database in the chat state directory, migrating older per-profile JSON files"""
+        if not self._initialized:
+            self.state_dir = state_dir
+            if not os.path.exists(state_dir):
+                os.makedirs(state_dir)
+            self.max_bytes = CHAT_STATE_MAX_BYTES
+            self.compression = CHAT_STATE_COMPRESSION
+            self._lock = threading.Lock()
+            self._conn = self._connect()
+            self._migrate_json_states()
+            self._initialized = True
+
+    def _get_db_filepath(self):
+        """Get the file path of the database"""
+        return os.path.join(self.state_dir, "chat_states.db")
+
+    def _connect(self):
+        """Open the database in WAL mode and create the schema"""
+        conn = sqlite3.connect(self._get_db_filepath(),
+                               check_same_thread=False, isolation_level=None)
+        # WAL keeps loads from waiting on a save, NORMAL sync is safe with WAL
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_states (
+                profile_hash TEXT PRIMARY KEY,
+                history BLOB NOT NULL,
+                compressed INTEGER NOT NULL,
+                format TEXT NOT NULL DEFAULT 'json',
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_states)")]
+        if "format" not in columns:  # Databases written before the trusted format
+            conn.execute(
+                "ALTER TABLE chat_states ADD COLUMN format TEXT NOT NULL DEFAULT 'json'")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS chat_states_last_used ON chat_states (last_used)")
+        # JSON state files already imported, they are left in place
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS migrated_files (filename TEXT PRIMARY KEY)")
+        return conn
+
+    def _migrate_json_states(self):
+        """Import chat states saved as one JSON file per profile hash into the database, once per file"""
+        try:
+            with self._lock:
+                migrated_files = {row[0] for row in self._conn.execute(
+                    "SELECT filename FROM migrated_files")}
+            filenames = [name for name in os.listdir(self.state_dir)
+                         if name.endswith('.json') and name not in migrated_files]
+        except Exception as e:
+            print(f"Error listing chat state files: {str(e)}")
+            return
+
+        migrated = 0
+        for filename in filenames:
+            filepath = os.path.join(self.state_dir, filename)
+            try:
+                with open(filepath, 'rb') as f:
+                    json_history = f.read()
+                self.save(filename[:-len('.json')], json_history, JSON_FORMAT,
+                          last_used=os.path.getmtime(filepath))
+                # The files may be tracked or shared, so they are recorded rather than deleted
+                with self._lock:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO migrated_files (filename) VALUES (?)", (filename,))
+                migrated += 1
+            except Exception as e:
+                print(f"Error migrating chat state file {filename}: {str(e)}")
+        if migrated:
+            print(f"Migrated {migrated} chat state files")
+
+    def load(self, profile_hash):
+        """
+        Get the serialized chat history of a profile hash and mark it as recently used
+
+        Returns:
+            Tuple of the history as bytes and its format, or None if no state is saved
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, compressed, format FROM chat_states WHERE profile_hash = ?",
+                (profile_hash,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE chat_states SET last_used = ? WHERE profile_hash = ?",
+                (time.time(), profile_hash))
+        history, compressed, data_format = row
+        return (zlib.decompress(history) if compressed else bytes(history)), data_format
+
+    def load_history(self, profile_hash):
+        """
+        Get the chat history of a profile hash as Content objects
+
+        Trusted histories are rebuilt without validation, JSON ones of unknown origin are
+        validated and saved again in the trusted format so the next load skips validation.
+
+        Returns:
+            List of Content, or None if no usable state is saved
+        """
+        stored = self.load(profile_hash)
+        if stored is None:
+            return None
+        data, data_format = stored
+        if data_format == TRUSTED_FORMAT:
+            return decode_trusted_history(data)
+        if data_format != JSON_FORMAT:
+            return None  # Written by other library versions, or pickled by older releases
+        history = decode_json_history(data)
+        self.save_history(profile_hash, history)
+        return history
+
+    def save_history(self, profile_hash, history):
+        """
+        Store a validated chat history in the trusted format
+
+        Returns:
+            Number of bytes stored
+        """
+        return self.save(profile_hash, encode_trusted_history(history), TRUSTED_FORMAT)
+
+    def save(self, profile_hash, data, data_format, last_used=None):
+        """
+        Store the serialized chat history of a profile hash
+
+        Args:
+            profile_hash: Hash of the profile, template, rules and resume
+            data: Serialized history as bytes
+            data_format: JSON_FORMAT or TRUSTED_FORMAT
+            last_used: Last use timestamp, defaults to now
+
+        Returns:
+            Number of bytes stored
+        """
+        history = zlib.compress(data) if self.compression else data
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO chat_states (profile_hash, history, compressed, format, size, created, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (profile_hash) DO UPDATE SET
+                       history = excluded.history, compressed = excluded.compressed,
+                       format = excluded.format, size = excluded.size, last_used = excluded.last_used""",
+                (profile_hash, history, int(self.compression), data_format, len(history), now, last_used or now))
+            self._evict(keep=profile_hash)
+        return len(history)
+
+    def _evict(self, keep):
+        """Remove least recently used states other than the one just saved until the store fits its size cap"""
+        total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM chat_states").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        evicted = []
+        for profile_hash, size in self._conn.execute(
+                "SELECT profile_hash, size FROM chat_states WHERE profile_hash != ? ORDER BY last_used",
+                (keep,)).fetchall():
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((profile_hash,))
+            total_size -= size
+        if not evicted:
+            return
+        self._conn.executemany(
+            "DELETE FROM chat_states WHERE profile_hash = ?", evicted)
+        print(f"Evicted {len(evicted)} chat states above the size cap")
+
+    def get_stats(self):
+        """Get the number of saved states and their stored size in bytes"""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chat_states").fetchone()
+        return {"states": count, "bytes": size, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        """Delete all saved chat states"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chat_states")
+            self._conn.execute("VACUUM")  # Give the space back to the file system
+        return True
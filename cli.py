@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Cover Letter Generator Command Line
+-----------------------------------
+Generates cover letters without the GUI, reusing the saved profiles and settings.
+
+Examples:
+    python cli.py --profile Default job.txt
+    cat job.txt | python cli.py -
+    python cli.py --jsonl jobs.jsonl --output-dir letters/ --concurrency 4
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import contextlib
+
+# Prefix of the text GeminiClient returns when generation and its fallback both failed
+ERROR_PREFIX = "Error generating cover letter:"
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Generate cover letters with Google Gemini without the GUI.")
+    parser.add_argument("job_files", nargs="*", metavar="JOB_FILE",
+                        help="Text file with a job description, or - to read one from stdin")
+    parser.add_argument("--jsonl", metavar="PATH",
+                        help='JSONL file (or - for stdin) with one {"id": ..., "job_description": ...} object per line')
+    parser.add_argument("--profile", help="Profile to use (defaults to Default)")
+    parser.add_argument("--model", help="Model to use (defaults to the profile's model)")
+    parser.add_argument("--resume", help="Resume PDF to use instead of the profile's resume")
+    parser.add_argument("--output-dir", metavar="DIR",
+                        help="Write one .docx file per job description into DIR instead of streaming to stdout")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Overwrite existing .docx files instead of adding a number to the name")
+    parser.add_argument("--concurrency", type=int,
+                        help="Number of letters generated at once with --output-dir (defaults to the batch_concurrency setting)")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="Ignore previously generated letters for identical inputs")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Hide progress and diagnostic messages")
+    return parser.parse_args(argv)
+
+
+def read_job_descriptions(args):
+    """Collect (name, job description) pairs from files, stdin and JSONL"""
+    jobs = []
+    for path in args.job_files:
+        if path == "-":
+            jobs.append(("stdin", sys.stdin.read()))
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                jobs.append(
+                    (os.path.splitext(os.path.basename(path))[0], f.read()))
+
+    if args.jsonl:
+        jsonl_file = sys.stdin if args.jsonl == "-" else open(
+            args.jsonl, 'r', encoding='utf-8')
+        try:
+            for line_number, line in enumerate(jsonl_file, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                name = str(record.get("id", f"job_{line_number}"))
+                jobs.append((name, record["job_description"]))
+        finally:
+            if jsonl_file is not sys.stdin:
+                jsonl_file.close()
+
+    return [(name, text) for name, text in jobs if text.strip()]
+
+
+def save_to_word(content, output_dir, name, overwrite=False):
+    """Save a cover letter to a Word file named after its job, returning the file path"""
+    from docx import Document  # Only needed when writing files
+
+    base_name = re.sub(r"[^\w.-]+", "_", name).strip("._") or "CoverLetter"
+    filepath = os.path.join(output_dir, f"{base_name}.docx")
+    counter = 1
+    while os.path.exists(filepath) and not overwrite:
+        filepath = os.path.join(output_dir, f"{base_name}_{counter}.docx")
+        counter += 1
+
+    doc = Document()
+    doc.add_paragraph(content)
+    doc.save(filepath)
+    return filepath
+
+
+def run(args, out):
+    """Generate the requested cover letters, writing letters or file paths to out"""
+    jobs = read_job_descriptions(args)
+    if not jobs:
+        print("No job descriptions given. Pass files, - for stdin, or --jsonl.", file=sys.stderr)
+        return 2
+
+    # Imported here so --help and argument errors do not pay for the SDK import
+    from profile_manager import ProfileManager
+    from gemini_client import GeminiClient
+
+    profile_manager = ProfileManager()
+    if args.profile and not profile_manager.set_current_profile(args.profile):
+        print(f"Profile not found: {args.profile}", file=sys.stderr)
+        return 2
+
+    gemini_client = GeminiClient()
+    if gemini_client.backend is None:
+        print("API key is missing! Add one in the Settings tab or settings.json.", file=sys.stderr)
+        return 2
+    gemini_client.update_model(args.model or profile_manager.current_model)
+
+    resume_path = args.resume or profile_manager.current_resume_path
+    if resume_path and not os.path.exists(resume_path):
+        print(f"Resume not found, continuing without it: {resume_path}", file=sys.stderr)
+        resume_path = None
+
+    personal_context = profile_manager.current_personal_context
+    system_template = profile_manager.current_system_template
+    exit_code = 0
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        results = gemini_client.generate_cover_letters_batch(
+            [text for _, text in jobs], personal_context, system_template, resume_path,
+            max_concurrency=args.concurrency, force_regenerate=args.regenerate)
+        for index, cover_letter in results:
+            name = jobs[index][0]
+            if not cover_letter or cover_letter.startswith(ERROR_PREFIX):
+                print(f"{name}: {cover_letter or 'empty response'}", file=sys.stderr)
+                exit_code = 1
+                continue
+            filepath = save_to_word(
+                cover_letter, args.output_dir, name, args.overwrite)
+            out.write(filepath + "\n")
+            out.flush()
+        return exit_code
+
+    for name, text in jobs:
+        if len(jobs) > 1:
+            out.write(f"===== {name} =====\n")
+        try:
+            for piece in gemini_client.stream_cover_letter(
+                    text, personal_context, system_template, resume_path, force_regenerate=args.regenerate):
+                out.write(piece)
+                out.flush()
+        except Exception as e:
+            print(f"{name}: {ERROR_PREFIX} {str(e)}", file=sys.stderr)
+            exit_code = 1
+        out.write("\n")
+        out.flush()
+    return exit_code
+
+
+def main(argv=None):
+    """Command line entry point"""
+    args = parse_args(argv)
+    out = sys.stdout
+    # Keep stdout for letters only, client diagnostics go to stderr
+    log_target = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        with contextlib.redirect_stdout(log_target):
+            return run(args, out)
+    finally:
+        if args.quiet:
+            log_target.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
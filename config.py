@@ -3,7 +3,11 @@ import json
 import sys
 
 # Determine the base directory dynamically based on whether the script is frozen (built as an executable)
-if getattr(sys, 'frozen', False):
+# COVER_LETTER_HOME overrides it, e.g. to keep benchmark data out of the real profiles and caches
+if os.environ.get("COVER_LETTER_HOME"):
+    BASE_DIR = os.path.abspath(os.environ["COVER_LETTER_HOME"])
+    os.makedirs(BASE_DIR, exist_ok=True)
+elif getattr(sys, 'frozen', False):
     BASE_DIR = os.path.dirname(sys.executable)  # Directory of the executable
 else:
     BASE_DIR = os.path.dirname(os.path.abspath(
@@ -33,7 +37,8 @@ def load_settings():
                     "gemini-2.5-pro-preview-05-06",
                     "gemini-2.5-flash-preview-04-17"
                 ],
-                "custom_models": []
+                "custom_models": [],
+                "batch_concurrency": 4
             }
             with open(SETTINGS_FILE, 'w') as f:
                 json.dump(default_settings, f, indent=4)
@@ -52,10 +57,31 @@ SETTINGS = load_settings()
 
 # API Configuration
 GEMINI_API_KEY = SETTINGS.get("api_key", "")
+# More keys, each from its own Google Cloud project with its own quotas, that share the load:
+# [{"name": "team", "key": "...", "rate_limits": {"gemini-2.0-flash": {"rpm": 2000, "tpm": 4000000}}}]
+EXTRA_API_KEYS = SETTINGS.get("api_keys", [])
 DEFAULT_GEMINI_MODEL = "gemini-2.0-flash"  # Default model if none selected
 DEFAULT_MODELS = SETTINGS.get("default_models", ["gemini-2.0-flash"])
 CUSTOM_MODELS = SETTINGS.get("custom_models", [])
 ALL_MODELS = DEFAULT_MODELS + CUSTOM_MODELS
+# Maximum number of cover letters generated in parallel by batch runs
+BATCH_CONCURRENCY = SETTINGS.get("batch_concurrency", 4)
+# Generation backend: "genai" for the Gemini API or "stub" for the offline StubBackend
+GENERATION_BACKEND = os.environ.get(
+    "COVER_LETTER_BACKEND") or SETTINGS.get("backend", "genai")
+# Keyword arguments for the StubBackend (latency, chunk sizes, error rate, seed, ...)
+STUB_BACKEND_OPTIONS = SETTINGS.get("stub_backend", {})
+
+# HTTP connections of each API key are kept open and reused by later requests, so
+# concurrent generations pay the TLS handshake once per connection instead of per request
+HTTP_MAX_CONNECTIONS = SETTINGS.get("http_max_connections", 20)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = SETTINGS.get("http_max_keepalive_connections", 20)
+# Seconds an idle connection stays open
+HTTP_KEEPALIVE_EXPIRY = SETTINGS.get("http_keepalive_expiry", 120)
+# Multiplex concurrent requests over one connection, needs the h2 package (pip install "httpx[http2]")
+HTTP2_ENABLED = SETTINGS.get("http2", False)
+# Seconds to connect or to wait for the next piece of a response, unset to keep the SDK's default of waiting
+HTTP_TIMEOUT = SETTINGS.get("http_timeout")
 
 # Save settings to file
 
@@ -64,9 +90,10 @@ def save_settings(settings):
     try:
         with open(SETTINGS_FILE, 'w') as f:
             json.dump(settings, f, indent=4)
-        global SETTINGS, GEMINI_API_KEY, ALL_MODELS, CUSTOM_MODELS
+        global SETTINGS, GEMINI_API_KEY, EXTRA_API_KEYS, ALL_MODELS, CUSTOM_MODELS
         SETTINGS = settings
         GEMINI_API_KEY = settings.get("api_key", "")
+        EXTRA_API_KEYS = settings.get("api_keys", [])
         CUSTOM_MODELS = settings.get("custom_models", [])
         ALL_MODELS = settings.get("default_models", []) + CUSTOM_MODELS
         return True
@@ -81,6 +108,91 @@ CACHE_DIR = os.path.join(BASE_DIR, "cache")
 
 # Default cache TTL in seconds (59 minutes)
 DEFAULT_CACHE_TTL = 59 * 60
+# Seconds before context caching is tried again for a model or context that rejected it
+UNCACHEABLE_RETRY_AFTER = 24 * 60 * 60
+
+# Maximum number of primed chat histories kept in memory (least recently used are evicted)
+MAX_PRIMED_CHAT_SESSIONS = 8
+
+# Size cap of the generated cover letter cache (least recently used letters are evicted)
+RESULT_CACHE_MAX_BYTES = 20 * 1024 * 1024
+# Seconds between saves of the result cache's last-used times, which cache hits only update in memory
+RESULT_CACHE_TOUCH_INTERVAL = 60
+# Seconds between saves of the token usage ledger, which responses only update in memory
+USAGE_LEDGER_PERSIST_INTERVAL = 30
+
+# Size cap of the saved chat states (least recently used are evicted)
+CHAT_STATE_MAX_BYTES = 50 * 1024 * 1024
+# zlib-compress saved chat histories, which are mostly repeated profile text
+CHAT_STATE_COMPRESSION = SETTINGS.get("compress_chat_states", True)
+
+# Estimated similarity (0-1) above which an earlier job description counts as a near-duplicate
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Personal contexts above this many estimated tokens are not sent whole: each generation
+# sends only the sections most relevant to the job description, up to the budget
+CONTEXT_PRUNING_ENABLED = SETTINGS.get("context_pruning", True)
+CONTEXT_TOKEN_BUDGET = SETTINGS.get("context_token_budget", 4000)
+
+# Match the job description against the skills found in the personal context before
+# generating, and send the overlap with the job description
+SKILL_OVERLAP_ENABLED = SETTINGS.get("skill_overlap", True)
+
+# Generations queued on disk (cache/job_queue.db) are run by this many background workers,
+# and interrupted ones are picked up again at the next start
+JOB_QUEUE_WORKERS = SETTINGS.get("job_queue_workers", 2)
+# Attempts per queued job, retried after JOB_RETRY_DELAY seconds, doubling every attempt
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+# Seconds between the heartbeats a process writes for the jobs it runs. Running jobs without a
+# heartbeat for JOB_STALE_AFTER seconds belonged to a process that exited and are queued again
+JOB_HEARTBEAT_INTERVAL = 15
+JOB_STALE_AFTER = 60
+
+# Hedged streaming: if the first chunk is later than a deadline learned from recent
+# first-chunk latencies, a second request is raced against the first
+HEDGE_ENABLED = SETTINGS.get("hedged_requests", True)
+# Model for the second request, empty to retry on the same model
+HEDGE_FALLBACK_MODEL = SETTINGS.get("hedge_fallback_model", "")
+# Percentile of recent first-chunk latencies used as the deadline, so about 5% of requests are hedged
+HEDGE_PERCENTILE = 0.95
+# Deadline in seconds until enough latencies were observed, and the bounds of the learned one
+HEDGE_DEFAULT_DEADLINE = 8.0
+HEDGE_MIN_DEADLINE = 1.0
+HEDGE_MAX_DEADLINE = 30.0
+# First-chunk latencies observed per model before the learned deadline is used
+HEDGE_MIN_SAMPLES = 10
+# Seconds between saves of the learned first-chunk latencies, which requests only update in memory
+HEDGE_LATENCY_PERSIST_INTERVAL = 60
+
+# Requests and tokens per minute allowed per model, set in settings as
+# "rate_limits": {"gemini-2.0-flash": {"rpm": 15, "tpm": 1000000}}. Models without quotas
+# are not paced, quota errors only make them back off and halve their concurrency
+MODEL_RATE_LIMITS = SETTINGS.get("rate_limits", {})
+RATE_LIMIT_ENABLED = SETTINGS.get("rate_limiting", True)
+# Seconds of quota a model may use in one burst, the buckets refill continuously
+RATE_LIMIT_BURST_SECONDS = 10
+# Requests in flight per model: halved on every quota error and grown by one per
+# window of successful requests, up to the maximum
+RATE_LIMIT_MAX_CONCURRENCY = SETTINGS.get("max_concurrency_per_model", 8)
+# Pause after a quota error when the API suggests no delay, doubling on consecutive errors
+RATE_LIMIT_BASE_BACKOFF = 2.0
+RATE_LIMIT_MAX_BACKOFF = 60.0
+# Retries of a request rejected for quota before the error is raised
+RATE_LIMIT_MAX_RETRIES = 4
+# Output tokens assumed per request until actual usage is reported
+RATE_LIMIT_OUTPUT_TOKENS = 1000
+
+# Prepare the chat session in the background when the profile or resume changes or a job
+# description is pasted, waiting this many seconds for rapid changes to settle
+PREWARM_ENABLED = SETTINGS.get("prewarm_sessions", True)
+PREWARM_DEBOUNCE_SECONDS = 1.5
+
+# Timing spans of the generation pipeline, written to cache/traces/trace.jsonl
+TRACING_ENABLED = SETTINGS.get("tracing", True)
+# Size at which the trace file is rotated, and number of rotated files kept
+TRACE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_BACKUP_COUNT = 3
 
 # Create directories if they don't exist
 for directory in [PROFILES_DIR, FILES_DIR, CACHE_DIR]:
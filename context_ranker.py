@@ -0,0 +1,206 @@
+import re
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Rough token estimate used for budgets, Gemini averages about 4 characters per token
+CHARS_PER_TOKEN = 4
+# Blocks longer than this many tokens are split at line breaks into several sections
+MAX_SECTION_TOKENS = 250
+# Section indexes kept for recently used personal contexts
+INDEX_CACHE_SIZE = 8
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words, keeping names like c++, c#, node.js and asp.net in one piece
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[+#]+|(?:\.[a-z0-9]+)+)?")
+STOP_WORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers him his how i if in into is it its itself just me more
+most my myself no nor not now of off on once only or other our ours out over own same she
+should so some such than that the their theirs them then there these they this those through
+to too under until up very was we were what when where which while who whom why will with
+would you your yours
+""".split())
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def tokenize(text):
+    """Split text into lowercase terms without stop words"""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOP_WORDS]
+
+
+def split_sections(text):
+    """Split a personal context into sections at blank lines, keeping headings with their paragraph"""
+    blocks = [block.strip() for block in re.split(r"\n\s*\n", text) if block.strip()]
+    merged = []
+    for block in blocks:
+        if merged and merged[-1].lstrip().startswith("#") and "\n" not in merged[-1]:
+            merged[-1] += "\n" + block  # A heading on its own belongs to the next block
+        else:
+            merged.append(block)
+
+    sections = []
+    for block in merged:
+        if estimate_tokens(block) <= MAX_SECTION_TOKENS:
+            sections.append(block)
+            continue
+        current = []
+        for line in block.splitlines():
+            if current and estimate_tokens("\n".join(current + [line])) > MAX_SECTION_TOKENS:
+                sections.append("\n".join(current))
+                current = []
+            current.append(line)
+        if current:
+            sections.append("\n".join(current))
+    return sections
+
+
+class _SectionIndex:
+    """Terms of every section of one personal context, as flat arrays for vectorized scoring"""
+
+    def __init__(self, text):
+        """Split and tokenize a personal context"""
+        self.sections = split_sections(text)
+        # Counted with the blank line that separates kept sections
+        self.section_tokens = np.array(
+            [estimate_tokens(section + "\n\n") for section in self.sections], dtype=np.int64)
+        self.vocabulary = {}
+        term_lists = [tokenize(section) for section in self.sections]
+        self.lengths = np.array([len(terms) for terms in term_lists], dtype=np.float64)
+        # One entry per term occurrence: its vocabulary id and the section it is in
+        self.term_ids = np.fromiter(
+            (self.vocabulary.setdefault(term, len(self.vocabulary))
+             for terms in term_lists for term in terms),
+            dtype=np.int64, count=int(self.lengths.sum()))
+        self.section_ids = np.repeat(
+            np.arange(len(self.sections)), self.lengths.astype(np.int64))
+
+        # Inverse document frequency of every term
+        vocabulary_size = max(1, len(self.vocabulary))
+        pairs = np.unique(self.section_ids * vocabulary_size + self.term_ids)
+        document_frequency = np.bincount(
+            pairs % vocabulary_size, minlength=vocabulary_size)
+        section_count = len(self.sections)
+        self.idf = np.log1p(
+            (section_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = self.lengths.mean() if section_count and self.lengths.sum() else 1.0
+        self.length_norm = BM25_K1 * \
+            (1 - BM25_B + BM25_B * self.lengths / average_length)
+
+    def score(self, query_terms):
+        """Get the BM25 score of every section for a list of query terms"""
+        query_ids = np.array(sorted({self.vocabulary[term] for term in query_terms
+                                     if term in self.vocabulary}), dtype=np.int64)
+        section_count = len(self.sections)
+        if not len(query_ids) or not len(self.term_ids):
+            return np.zeros(section_count)
+
+        # Column of each term occurrence in the section x query term frequency matrix, -1 if not queried
+        query_position = np.full(len(self.vocabulary), -1, dtype=np.int64)
+        query_position[query_ids] = np.arange(len(query_ids))
+        positions = query_position[self.term_ids]
+        matched = positions >= 0
+        term_frequency = np.bincount(
+            self.section_ids[matched] * len(query_ids) + positions[matched],
+            minlength=section_count * len(query_ids)).reshape(section_count, len(query_ids))
+
+        saturated = term_frequency * (BM25_K1 + 1) / \
+            (term_frequency + self.length_norm[:, None])
+        return saturated @ self.idf[query_ids]
+
+
+class ContextRanker:
+    """Keeps the personal context sections most relevant to a job description within a token budget"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(ContextRanker, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the ranker"""
+        if not self._initialized:
+            self._indexes = OrderedDict()  # Context digest -> _SectionIndex, least recently used first
+            self._lock = threading.Lock()
+            self.stats = {"pruned": 0, "context_tokens": 0, "tokens_saved": 0}
+            self._initialized = True
+
+    def _get_index(self, text):
+        """Get the section index of a personal context, building it on first use"""
+        digest = hashlib.md5(text.encode()).hexdigest()
+        with self._lock:
+            index = self._indexes.get(digest)
+            if index is not None:
+                self._indexes.move_to_end(digest)
+                return index
+
+        index = _SectionIndex(text)
+        with self._lock:
+            self._indexes[digest] = index
+            while len(self._indexes) > INDEX_CACHE_SIZE:
+                self._indexes.popitem(last=False)
+        return index
+
+    def prune(self, text, job_description, token_budget):
+        """
+        Keep the sections of a personal context that best match a job description
+
+        Sections are ranked by BM25 score, ties keeping their original order, and taken
+        while they fit the budget. The kept sections are returned in their original order.
+
+        Args:
+            text: Personal context
+            job_description: The job description text
+            token_budget: Estimated tokens the kept sections may use
+
+        Returns:
+            Tuple of the pruned context and a report with section and token counts
+        """
+        started = time.perf_counter()
+        index = self._get_index(text)
+        scores = index.score(tokenize(job_description))
+
+        # Highest score first, earlier sections first among equal scores
+        order = np.lexsort((np.arange(len(scores)), -scores))
+        kept = np.zeros(len(scores), dtype=bool)
+        remaining = token_budget
+        for position in order:
+            if index.section_tokens[position] <= remaining:
+                kept[position] = True
+                remaining -= index.section_tokens[position]
+
+        pruned = "\n\n".join(section for section, keep in zip(index.sections, kept) if keep)
+        context_tokens = estimate_tokens(text)
+        sent_tokens = estimate_tokens(pruned)
+        report = {
+            "sections": len(index.sections),
+            "kept_sections": int(kept.sum()),
+            "context_tokens": context_tokens,
+            "sent_tokens": sent_tokens,
+            "tokens_saved": max(0, context_tokens - sent_tokens),
+            "ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        with self._lock:
+            self.stats["pruned"] += 1
+            self.stats["context_tokens"] += context_tokens
+            self.stats["tokens_saved"] += report["tokens_saved"]
+        return pruned, report
+
+    def get_stats(self):
+        """Get the number of pruned contexts and the estimated tokens they saved"""
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,67 @@
+import os
+import hashlib
+import threading
+
+# Read files in 1 MiB blocks so large resumes are never fully loaded just to hash them
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class FileHashCache:
+    """Memoizes file digests, re-hashing a file only when its size, mtime or inode change"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(FileHashCache, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the file hash cache"""
+        if not self._initialized:
+            self._digests = {}  # Absolute path -> (stat signature, MD5 hex digest)
+            self._lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self._initialized = True
+
+    def get_digest(self, file_path):
+        """Get the MD5 hex digest of a file, hashing it only if it changed since the last call"""
+        key = os.path.abspath(file_path)
+        stat = os.stat(key)
+        signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        with self._lock:
+            entry = self._digests.get(key)
+            if entry and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+
+        file_hash = hashlib.md5()
+        with open(key, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                file_hash.update(block)
+        digest = file_hash.hexdigest()
+
+        with self._lock:
+            self._digests[key] = (signature, digest)
+            self.misses += 1
+        return digest
+
+    def get_stats(self):
+        """Get hit/miss counters for the cache"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._digests)
+            }
+
+    def clear(self):
+        """Forget all cached digests and reset the counters"""
+        with self._lock:
+            self._digests = {}
+            self.hits = 0
+            self.misses = 0
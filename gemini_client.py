@@ -1,20 +1,46 @@
 import os
-from google import genai
 from google.genai import types
-from pydantic import TypeAdapter
 import hashlib
 import io
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
 
-from config import GEMINI_API_KEY
+from config import (GEMINI_API_KEY, EXTRA_API_KEYS, BATCH_CONCURRENCY, MAX_PRIMED_CHAT_SESSIONS, NEAR_DUPLICATE_THRESHOLD, GENERATION_BACKEND,
+                    STUB_BACKEND_OPTIONS, HEDGE_ENABLED, HEDGE_FALLBACK_MODEL, CONTEXT_PRUNING_ENABLED, CONTEXT_TOKEN_BUDGET,
+                    SKILL_OVERLAP_ENABLED)
+from generation_backend import create_backend
 from local_storage_manager import LocalStorageManager
 from cache_manager import CacheManager
+from upload_registry import UploadRegistry
+from chat_state_store import ChatStateStore
+from file_hash_cache import FileHashCache
+from result_cache import ResultCache
+from near_duplicate_index import NearDuplicateIndex
+from tracing import Tracer
+from usage_ledger import UsageLedger
+from latency_tracker import FirstChunkLatencyTracker
+from session_prewarmer import SessionPrewarmer
+from single_flight import SingleFlight
+from context_ranker import ContextRanker, CHARS_PER_TOKEN, estimate_tokens
+from rate_limiter import RateLimiter
+from api_key_pool import ApiKeyPool
+from http_transport import ConnectionMetrics
+from skill_index import SkillIndex
 from profile_manager import ProfileManager, PERSONAL_CONTEXT_DIR
 
 
 CHAT_STATE_DIR = os.path.join(os.path.dirname(
-    PERSONAL_CONTEXT_DIR), 'chat_states')  # Directory for chat state storage
-if not os.path.exists(CHAT_STATE_DIR):
-    os.makedirs(CHAT_STATE_DIR)
+    PERSONAL_CONTEXT_DIR), 'chat_states')  # Directory of the chat state database
+
+# Seconds before server-side expiry at which a context cache is no longer used
+CACHE_EXPIRY_MARGIN = 60
+# Lifetime assumed for uploaded files when the API does not report one (Gemini keeps them 48 hours)
+DEFAULT_UPLOAD_TTL = 48 * 60 * 60
+# Seconds before server-side expiry at which an uploaded file is uploaded again
+UPLOAD_EXPIRY_MARGIN = 60 * 60
 
 
 class GeminiClient:
@@ -34,22 +60,73 @@ class GeminiClient:
         if not self._initialized:
             self.profile_manager = ProfileManager()
             self.api_key = GEMINI_API_KEY
+            self.extra_api_keys = EXTRA_API_KEYS
 
             if not self.api_key:
                 print("API key is missing! Please add an API key in the settings.")
                 self.api_key = None  # Allow initialization to proceed without crashing
 
             self.model = self.profile_manager.current_model
-            self.client = genai.Client(
-                api_key=self.api_key) if self.api_key else None
+            # Per-model request and token quotas of each API key
+            self.rate_limiter = RateLimiter()
+            # Chats, uploads, caches and generation go through the backend of a profile's key, see set_backend()
+            self.key_pool = ApiKeyPool(self.rate_limiter)
+            self._configure_keys()
             self.storage_manager = LocalStorageManager()
             self.cache_manager = CacheManager()
-            # TypeAdapter for chat history serialization
-            self.history_adapter = TypeAdapter(list[types.Content])
+            self.upload_registry = UploadRegistry()
+            # Saved primed chat histories, see _save_chat_state()
+            self.chat_state_store = ChatStateStore(CHAT_STATE_DIR)
+            # Memoized file digests, see get_hash_cache_stats()
+            self.file_hash_cache = FileHashCache()
+            self.result_cache = ResultCache()
+            self.near_duplicate_index = NearDuplicateIndex()
+            # Picks the personal context sections sent with each job description, see _build_job_message()
+            self.context_ranker = ContextRanker()
+            # Profile skill vocabularies matched against each job description
+            self.skill_index = SkillIndex()
+            self.tracer = Tracer()
+            self.usage_ledger = UsageLedger()
+            # Learned first-chunk deadlines for hedged streaming
+            self.latency_tracker = FirstChunkLatencyTracker()
 
-            self.chat_sessions = {}  # Dictionary to store chat sessions by profile hash
+            # Primed chat histories by profile hash, least recently used first
+            self.chat_sessions = OrderedDict()
+            self._chat_sessions_lock = threading.Lock()
+            self.prewarmer = SessionPrewarmer(self)
+            # In-flight session initializations by profile hash and model
+            self.session_flights = SingleFlight()
             self._initialized = True
 
+    def _configure_keys(self):
+        """Create one long-lived backend for the API key and for every key listed under api_keys in settings"""
+        key_entries = [{"name": "default", "key": self.api_key or ""}] if self.api_key or not self.extra_api_keys else []
+        self.key_pool.configure(key_entries + self.extra_api_keys, lambda api_key: create_backend(
+            GENERATION_BACKEND, api_key, STUB_BACKEND_OPTIONS))
+
+    @property
+    def backend(self):
+        """Get the backend of the primary API key, None without a key"""
+        key = self.key_pool.primary
+        return key.backend if key else None
+
+    def _get_key(self, key=None, profile_name=None, model=None):
+        """Get the given key or the one assigned to a profile, the current one by default"""
+        return key or self.key_pool.get_home_key(
+            profile_name or self.profile_manager.current_profile_name, model or self.model)
+
+    @staticmethod
+    def _estimate_message_tokens(message):
+        """Estimate the input tokens of the text of a message, files are covered by the limiter's usage average"""
+        items = message if isinstance(message, list) else [message]
+        return sum(estimate_tokens(item) for item in items if isinstance(item, str))
+
+    def _send_message(self, chat, message, model=None, key=None):
+        """Send a chat message within the rate limits of its model on the key the chat was created with"""
+        model = model or self.model
+        return self.rate_limiter.call(self._get_key(key, model=model).get_bucket(model),
+                                      lambda: chat.send_message(message=message), self._estimate_message_tokens(message))
+
     def _get_profile_hash(self, profile_name, system_template, system_core_rules, resume_path=None):
         """Generate a unique hash for the profile and resume combination"""
 
@@ -62,88 +139,259 @@ class GeminiClient:
         # Add hash of the personal context file if it exists
         if os.path.exists(personal_context_file):
             try:
-                with open(personal_context_file, 'rb') as f:
-                    file_content = f.read()
-                    file_hash = hashlib.md5(file_content).hexdigest()[:8]
-                    content += file_hash
+                file_hash = self.file_hash_cache.get_digest(
+                    personal_context_file)[:8]
+                content += file_hash
             except Exception as e:
                 print(f"Error hashing personal context file: {str(e)}")
+        # Sessions of pruned contexts are primed without the personal context file
+        if self._prunes_personal_context(profile_name):
+            content += f"pruned{CONTEXT_TOKEN_BUDGET}"
         # Add resume hash to ensure different resumes create different sessions
         if resume_path and os.path.exists(resume_path):
             try:
-                with open(resume_path, 'rb') as f:
-                    resume_content = f.read()
-                    resume_hash = hashlib.md5(resume_content).hexdigest()[:8]
-                    content += resume_hash
+                resume_hash = self.file_hash_cache.get_digest(resume_path)[:8]
+                content += resume_hash
             except Exception as e:
                 print(f"Error hashing resume file: {str(e)}")
 
         return hashlib.md5(content.encode()).hexdigest()
 
-    def _get_chat_state_filepath(self, profile_hash):
-        """Get the filepath for saving chat state"""
-        return os.path.join(CHAT_STATE_DIR, f"{profile_hash}.json")
+    def _prunes_personal_context(self, profile_name):
+        """Check whether a profile's personal context is too large to send whole"""
+        if not CONTEXT_PRUNING_ENABLED:
+            return False
+        personal_context_file = os.path.join(
+            PERSONAL_CONTEXT_DIR, f"{profile_name}.txt")
+        try:  # File size is enough to tell, the ranker estimates tokens the same way
+            return os.path.getsize(personal_context_file) / CHARS_PER_TOKEN > CONTEXT_TOKEN_BUDGET
+        except OSError:
+            return False
 
-    def _save_chat_state(self, profile_hash, chat):
-        """Save chat state to a file for later retrieval"""
+    def _build_job_message(self, job_description, system_core_rules, profile_name=None):
+        """
+        Get the message asking for a cover letter
+
+        If the personal context is too large to send whole, the message also carries
+        the sections most relevant to the job description, since the session was
+        primed without them. The skills the job description shares with the
+        profile are listed after the job description.
+        """
+        profile_name = profile_name or self.profile_manager.current_profile_name
+        prune_context = self._prunes_personal_context(profile_name)
+        message = [job_description, system_core_rules]
+        if not prune_context and not SKILL_OVERLAP_ENABLED:
+            return message
+
+        personal_context_file = os.path.join(
+            PERSONAL_CONTEXT_DIR, f"{profile_name}.txt")
         try:
-            chat_history = chat.get_history()
-            # Only save if we have a successful initialization (at least 2 messages)
-            if len(chat_history) >= 2:
-                # Convert to a JSON list using the TypeAdapter
-                json_history = self.history_adapter.dump_json(chat_history)
-                filepath = self._get_chat_state_filepath(
-                    profile_hash)  # Save to a file
-                with open(filepath, 'wb') as f:
-                    f.write(json_history)
-
-                print(f"Chat state saved for profile: {profile_hash[:8]}")
-                return True
-        except Exception as e:
-            print(f"Error saving chat state: {str(e)}")
+            with open(personal_context_file, 'r', encoding='utf-8') as f:
+                personal_context = f.read()
+        except OSError:
+            personal_context = ""  # Nothing to match or prune
 
-        return False
+        if SKILL_OVERLAP_ENABLED:
+            with self.tracer.span("skills.match") as span:
+                overlap_summary, counts = self.skill_index.summarize_overlap(
+                    personal_context, job_description)
+                span.set_attributes(**counts)
+            if overlap_summary:
+                message.insert(1, overlap_summary)
 
-    def _load_chat_state(self, profile_hash, system_template, system_core_rules):
-        """Load chat state from file if available"""
-        filepath = self._get_chat_state_filepath(profile_hash)
+        if prune_context:
+            with self.tracer.span("context.prune") as span:
+                relevant_context, report = self.context_ranker.prune(
+                    personal_context, job_description, CONTEXT_TOKEN_BUDGET)
+                span.set_attributes(**report)
+            print(f"Sending {report['kept_sections']} of {report['sections']} personal context sections, "
+                  f"about {report['tokens_saved']} tokens saved")
+            message.insert(
+                0, f"Information about me relevant to this job:\n{relevant_context}")
+        return message
 
-        try:
-            if os.path.exists(filepath):
-                with open(filepath, 'rb') as f:
-                    json_history = f.read()
-
-                # Convert the JSON back to the Pydantic schema
-                history = self.history_adapter.validate_json(json_history)
-                combined_system_instructions = system_template + system_core_rules
-
-                chat = self.client.chats.create(
-                    model=self.model,
-                    config=types.GenerateContentConfig(
-                        system_instruction=combined_system_instructions
-                    ),
-                    history=history,
-                )
+    def get_rate_limit_stats(self):
+        """Get the quotas, concurrency limit and quota errors per model"""
+        return self.rate_limiter.get_stats()
 
-                print(f"Chat state loaded for profile: {profile_hash[:8]}")
-                return chat
-        except Exception as e:
-            print(f"Error loading chat state: {str(e)}")
+    def get_api_key_stats(self):
+        """Get the profiles assigned to each API key and the requests that overflowed to another key"""
+        return self.key_pool.get_stats()
 
-        return None
+    def get_connection_stats(self):
+        """Get the HTTP requests sent to the Gemini API and how many of them reused an open connection"""
+        return ConnectionMetrics().get_stats()
 
-    def _initialize_chat_session(self, system_template, system_core_rules, resume_path=None):
-        """Initialize a chat session with context from personal profile and resume"""
-        profile_name = self.profile_manager.current_profile_name  # Get the current profile name to identify the personal context file
+    def get_context_pruning_stats(self):
+        """Get the number of pruned personal contexts and the estimated tokens saved"""
+        return self.context_ranker.get_stats()
+
+    def get_hash_cache_stats(self):
+        """Get hit/miss counters of the memoized profile file hashes"""
+        return self.file_hash_cache.get_stats()
+
+    def _save_chat_state(self, profile_hash, chat):
+        """Save chat state to the chat state store for later retrieval"""
+        with self.tracer.span("chat_state.save", profile_hash=profile_hash[:8]) as span:
+            try:
+                chat_history = chat.get_history()
+                # Only save if we have a successful initialization (at least 2 messages)
+                if len(chat_history) >= 2:
+                    # The history comes from the SDK, so it is stored in the trusted format
+                    stored_bytes = self.chat_state_store.save_history(
+                        profile_hash, chat_history)
+
+                    span.set_attribute("stored_bytes", stored_bytes)
+                    print(f"Chat state saved for profile: {profile_hash[:8]}")
+                    return True
+            except Exception as e:
+                print(f"Error saving chat state: {str(e)}")
+
+            return False
+
+    def _load_chat_state(self, profile_hash):
+        """Load a primed chat history from the chat state store if available"""
+        with self.tracer.span("chat_state.load", profile_hash=profile_hash[:8], hit=False) as span:
+            try:
+                history = self.chat_state_store.load_history(profile_hash)
+                if history is not None:
+                    span.set_attribute("hit", True)
+                    print(f"Chat state loaded for profile: {profile_hash[:8]}")
+                    return history
+            except Exception as e:
+                print(f"Error loading chat state: {str(e)}")
+
+            return None
+
+    def _get_primed_history(self, profile_hash):
+        """Get a primed chat history from memory and mark it as recently used"""
+        with self._chat_sessions_lock:
+            history = self.chat_sessions.get(profile_hash)
+            if history is not None:
+                self.chat_sessions.move_to_end(profile_hash)
+            return history
+
+    def _store_primed_history(self, profile_hash, history):
+        """Keep a primed chat history in memory, evicting the least recently used ones"""
+        with self._chat_sessions_lock:
+            self.chat_sessions[profile_hash] = list(history)
+            self.chat_sessions.move_to_end(profile_hash)
+            while len(self.chat_sessions) > MAX_PRIMED_CHAT_SESSIONS:
+                self.chat_sessions.popitem(last=False)
+
+    def _has_warm_session(self, profile_hash, model=None, profile_name=None):
+        """Check whether a session for a profile hash can start without an API round trip"""
+        profile_hash = self._get_key(profile_name=profile_name, model=model).scoped(profile_hash)
+        with self._chat_sessions_lock:
+            if profile_hash in self.chat_sessions:
+                return True
+        return self.cache_manager.get_cache_config(self._get_context_cache_key(profile_hash, model)) is not None
+
+    def prewarm_session(self, resume_path=None):
+        """Prepare the current profile's chat session in the background so the next generation skips setup"""
+        return self.prewarmer.request(resume_path)
+
+    def cancel_prewarm(self):
+        """Drop a prewarm that has not started yet"""
+        self.prewarmer.cancel()
+
+    def _create_chat(self, system_template, system_core_rules, history=None, model=None, key=None):
+        """Create a chat session, optionally starting from a copy of a primed history"""
+        combined_system_instructions = system_template + system_core_rules
+        return self._get_key(key, model=model).backend.create_chat(
+            model=model or self.model,
+            config=types.GenerateContentConfig(
+                system_instruction=combined_system_instructions
+            ),
+            # Copy so messages sent on this chat never leak into the pooled history
+            history=list(history) if history else None,
+        )
+
+    def _initialize_chat_session(self, system_template, system_core_rules, resume_path=None, model=None, profile_name=None,
+                                 key=None):
+        """
+        Initialize a chat session with context from personal profile and resume, on the current model and profile unless others are given
+
+        Concurrent calls for the same profile hash and model share one initialization:
+        the first uploads and primes, the others wait and start their own chat from its result.
+        Sessions are created on the given API key, the profile's own key by default.
+        """
+        model = model or self.model
+        # The profile name identifies the personal context file
+        profile_name = profile_name or self.profile_manager.current_profile_name
         profile_hash = self._get_profile_hash(
             profile_name, system_template, system_core_rules, resume_path)
+        key = self._get_key(key, profile_name, model)
+        # Uploads and caches belong to the key's project, so each key primes its own session
+        session_hash = key.scoped(profile_hash)
 
-        # Try to load existing chat state from file
-        chat = self._load_chat_state(
-            profile_hash, system_template, system_core_rules)
-        if chat:
-            print(f"Using saved initial state for profile: {profile_hash[:8]}")
+        with self.tracer.span("session.init", profile_hash=profile_hash[:8], model=model) as span:
+            chat = self._create_warm_chat(
+                session_hash, system_template, system_core_rules, model, span, key)
+            if chat is not None:
+                return chat, profile_hash
+
+            (chat, primed), shared = self.session_flights.do(
+                f"{session_hash}:{model}", lambda: self._prime_chat_session(
+                    profile_name, session_hash, system_template, system_core_rules, resume_path, model, span, key))
+            if shared:  # The chat belongs to the caller that initialized, start our own from its result
+                span.set_attributes(source="shared", cache_hit=True)
+                print(f"Using session initialized by a concurrent request for profile: {profile_hash[:8]}")
+                kind, value = primed
+                if kind == "cache":
+                    chat = self._create_cached_chat(value, model, key)
+                else:
+                    chat = self._create_chat(
+                        system_template, system_core_rules, value, model, key)
             return chat, profile_hash
+
+    def _create_warm_chat(self, profile_hash, system_template, system_core_rules, model, span, key=None):
+        """Start a chat from a live context cache or a primed history in memory, or return None"""
+        # Reuse a live context cache for this profile and model if we have one
+        cache_name = self.cache_manager.get_cache_config(
+            self._get_context_cache_key(profile_hash, model))
+        if cache_name:
+            span.set_attributes(source="context_cache", cache_hit=True)
+            print(f"Using context cache for profile: {profile_hash[:8]}")
+            return self._create_cached_chat(cache_name, model, key)
+
+        # Primed histories are plain contents, so they can start a chat on any model
+        history = self._get_primed_history(profile_hash)
+        if history is not None:
+            span.set_attributes(source="memory", cache_hit=True)
+            print(f"Using in-memory primed state for profile: {profile_hash[:8]}")
+            return self._create_chat(system_template, system_core_rules, history, model, key)
+        return None
+
+    def _prime_chat_session(self, profile_name, profile_hash, system_template, system_core_rules, resume_path, model, span,
+                            key=None):
+        """
+        Create a context cache, load a saved chat state or prime a new chat
+
+        Returns:
+            Tuple of the chat and how to start another one from the same state,
+            ("cache", cache name) or ("history", primed history)
+        """
+        cache_key = self._get_context_cache_key(profile_hash, model)
+        files_to_send = None
+        if not self.cache_manager.is_uncacheable(cache_key):
+            # Cache the context so it is not billed as input on every session
+            files_to_send = self._upload_profile_files(
+                profile_name, resume_path, key)
+            cache_name = self._create_context_cache(
+                cache_key, profile_hash, system_template, system_core_rules, files_to_send, model, key)
+            if cache_name:
+                span.set_attributes(source="new_context_cache", cache_hit=False)
+                return self._create_cached_chat(cache_name, model, key), ("cache", cache_name)
+
+        # Otherwise try to load existing chat state from file
+        history = self._load_chat_state(profile_hash)
+        if history is not None:
+            self._store_primed_history(profile_hash, history)
+            span.set_attributes(source="disk", cache_hit=True)
+            print(f"Using saved initial state for profile: {profile_hash[:8]}")
+            return self._create_chat(system_template, system_core_rules, history, model, key), ("history", history)
+        span.set_attributes(source="primed", cache_hit=False)
         print(f"Creating new chat session for profile: {profile_hash[:8]}")
 
         combined_system_instructions = system_template + system_core_rules
@@ -151,28 +399,62 @@ class GeminiClient:
         print(f"Combined system instructions: {combined_system_instructions}")
         print("=================================Combined System Instructions=================================\n\n\n")
 
-        chat = self.client.chats.create(  # Create a new chat session if loading failed
-            model=self.model,
-            config=types.GenerateContentConfig(
-                system_instruction=combined_system_instructions
-            ),
-        )
+        # Create a new chat session if nothing was primed yet
+        chat = self._create_chat(
+            system_template, system_core_rules, model=model, key=key)
+
+        context_message = f"sending info"
+        if files_to_send is None:
+            files_to_send = self._upload_profile_files(
+                profile_name, resume_path, key)
+
+        try:  # Send the context message and files to the chat
+            with self.tracer.span("session.prime", files=len(files_to_send)):
+                if files_to_send:
+                    response = self._send_message(
+                        chat, [context_message] + files_to_send, model, key)
+                else:
+                    response = self._send_message(
+                        chat, context_message, model, key)
+            self._record_usage(response.usage_metadata, model, profile_name)
 
+            print(f"Response from AI: {response.text}")
+            print(f"sent files: {files_to_send}")
+            print("Profile context loaded into chat session")
+
+            # This is the state we'll return to after each generation
+            self._save_chat_state(profile_hash, chat)
+            primed_history = chat.get_history()
+            if len(primed_history) >= 2:
+                self._store_primed_history(profile_hash, primed_history)
+
+        except Exception as e:
+            print(f"Error sending files to chat: {str(e)}")
+            # Reused uploads may have been deleted remotely, upload them again next time
+            self.upload_registry.forget_uploads(
+                file.name for file in files_to_send)
+            # Fallback to just sending text
+            with self.tracer.span("session.prime", files=0, fallback=True):
+                response = self._send_message(chat, context_message, model, key)
+            self._record_usage(response.usage_metadata, model, profile_name)
+            print(f"Response from AI: {response.text}")
+
+        return chat, ("history", list(chat.get_history()))
+
+    def _upload_profile_files(self, profile_name, resume_path=None, key=None):
+        """Upload the personal context file and resume PDF with an API key, returning the uploaded file objects"""
         personal_context_file = os.path.join(
             # Get personal context from file
             PERSONAL_CONTEXT_DIR, f"{profile_name}.txt")
-        context_message = f"sending info"
         files_to_send = []
 
-        # Add personal context file if it exists
-        if os.path.exists(personal_context_file):
+        # Add personal context file if it exists, large ones are sent per generation instead
+        if self._prunes_personal_context(profile_name):
+            print(f"Personal context is sent in relevant sections per generation: {personal_context_file}")
+        elif os.path.exists(personal_context_file):
             try:
-                with open(personal_context_file, 'rb') as file:
-                    personal_context_io = io.BytesIO(file.read())
-                personal_context_file_obj = self.client.files.upload(
-                    file=personal_context_io,
-                    config=dict(mime_type='text/plain')
-                )
+                personal_context_file_obj = self._upload_file(
+                    personal_context_file, 'text/plain', key)
                 files_to_send.append(personal_context_file_obj)
                 print(
                     f"Personal context file attached: {personal_context_file}")
@@ -182,39 +464,426 @@ class GeminiClient:
         # Add resume content if available
         if resume_path and os.path.exists(resume_path) and resume_path.lower().endswith('.pdf'):
             try:
-                with open(resume_path, 'rb') as file:
-                    doc_io = io.BytesIO(file.read())
-                sample_pdf = self.client.files.upload(
-                    file=doc_io,
-                    config=dict(mime_type='application/pdf')
-                )
+                sample_pdf = self._upload_file(resume_path, 'application/pdf', key)
                 files_to_send.append(sample_pdf)
                 print(f"Resume file attached: {resume_path}")
             except Exception as e:
                 print(f"Error attaching resume file: {str(e)}")
 
-        try:  # Send the context message and files to the chat
-            if files_to_send:
-                response = chat.send_message(
-                    message=[context_message] + files_to_send
-                )
-            else:
-                response = chat.send_message(context_message)
+        return files_to_send
 
-            print(f"Response from AI: {response.text}")
-            print(f"sent files: {files_to_send}")
-            print("Profile context loaded into chat session")
+    def _upload_file(self, file_path, mime_type, key=None):
+        """Upload a file, reusing an earlier upload of identical content with the same key until it expires"""
+        key = self._get_key(key)
+        with self.tracer.span("upload_file", mime_type=mime_type) as span:
+            # Files belong to the project of the key that uploaded them
+            content_hash = key.scoped(
+                self.file_hash_cache.get_digest(file_path))
 
-            # This is the state we'll return to after each generation
-            self._save_chat_state(profile_hash, chat)
+            upload = self.upload_registry.get_upload(content_hash)
+            if upload:
+                span.set_attributes(reused=True, bytes_uploaded=0)
+                print(f"Reusing uploaded file {upload['name']} for: {file_path}")
+                return types.File(name=upload["name"], uri=upload["uri"], mime_type=upload["mime_type"])
 
+            with open(file_path, 'rb') as file:
+                content = file.read()
+            uploaded_file = key.backend.upload_file(
+                io.BytesIO(content), mime_type)
+            span.set_attributes(reused=False, bytes_uploaded=len(content))
+            if uploaded_file.expiration_time:
+                expiry_time = uploaded_file.expiration_time.timestamp()
+            else:
+                expiry_time = time.time() + DEFAULT_UPLOAD_TTL
+            # Leave enough time for a session to finish using the file
+            self.upload_registry.save_upload(
+                content_hash, uploaded_file.name, uploaded_file.uri,
+                uploaded_file.mime_type or mime_type, expiry_time - UPLOAD_EXPIRY_MARGIN)
+            return uploaded_file
+
+    def _get_context_cache_key(self, profile_hash, model=None):
+        """Get the cache registry key for a profile hash on a model (the current one by default)"""
+        # Cached content is bound to the model it was created for
+        return self.cache_manager.get_cache_key(f"{profile_hash}:{model or self.model}")
+
+    def _create_context_cache(self, cache_key, profile_hash, system_template, system_core_rules, files_to_send, model=None,
+                              key=None):
+        """Create a Gemini context cache holding the system instruction, personal context and resume"""
+        model = model or self.model
+        key = self._get_key(key, model=model)
+        file_parts = [types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type)
+                      for file in files_to_send]
+        try:
+            with self.tracer.span("context_cache.create", profile_hash=profile_hash[:8], model=model):
+                cache = key.backend.create_cache(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"cover-letter-{profile_hash[:8]}",
+                        system_instruction=system_template + system_core_rules,
+                        # Same exchange a primed chat session starts from, without the round trip
+                        contents=[
+                            types.Content(role="user", parts=[
+                                types.Part.from_text(text="sending info")] + file_parts),
+                            types.Content(role="model", parts=[
+                                types.Part.from_text(text="ok to proceed")]),
+                        ],
+                        ttl=self.cache_manager.ttl_string,
+                    )
+                )
         except Exception as e:
-            print(f"Error sending files to chat: {str(e)}")
-            # Fallback to just sending text
-            response = chat.send_message(context_message)
-            print(f"Response from AI: {response.text}")
+            # Model does not support caching or the context is below its minimum size
+            print(f"Context caching unavailable, using chat priming: {str(e)}")
+            # Remembered across restarts, so later sessions go straight to the saved chat state
+            self.cache_manager.mark_uncacheable(cache_key, permanent=getattr(e, "code", None) == 400)
+            return None
+
+        # Stop using the cache slightly before the server expires it
+        expiry_time = time.time() + self.cache_manager.ttl_seconds - CACHE_EXPIRY_MARGIN
+        self.cache_manager.save_cache_info(cache_key, cache.name, expiry_time)
+        print(f"Context cache created for profile: {profile_hash[:8]}")
+        return cache.name
+
+    def _forget_dead_context_cache(self, error, profile_name, system_template, system_core_rules, resume_path, model, key):
+        """
+        Drop the registered context cache of a profile after the API reported it missing or inaccessible
+
+        Caches can be deleted server-side or belong to a previous backend, and would otherwise
+        fail every generation for the profile until they expire locally.
+
+        Returns:
+            True if a registered cache was dropped, so initializing the session again primes a new one
+        """
+        if getattr(error, "code", None) not in (403, 404):
+            return False
+        profile_hash = self._get_profile_hash(
+            profile_name, system_template, system_core_rules, resume_path)
+        if not self.cache_manager.remove_cache(self._get_context_cache_key(key.scoped(profile_hash), model)):
+            return False
+        print(f"Context cache of profile {profile_hash[:8]} is gone, priming a new session")
+        return True
+
+    def _create_cached_chat(self, cache_name, model=None, key=None):
+        """Create a chat session that references a context cache of the key that created it"""
+        return self._get_key(key, model=model).backend.create_chat(
+            model=model or self.model,
+            config=types.GenerateContentConfig(cached_content=cache_name),
+        )
+
+    def _record_usage(self, usage_metadata, model=None, profile_name=None):
+        """Add the token usage of a response to the usage ledger"""
+        if usage_metadata is not None:
+            self.usage_ledger.record(
+                profile_name or self.profile_manager.current_profile_name, model or self.model, usage_metadata)
+
+    def _stream_chat(self, chat, message, model=None, profile_name=None, key=None, on_start=None, cancel=None):
+        """
+        Yield the text of each streamed chunk as it arrives
+
+        Args:
+            on_start: Optional callable run when the request is sent
+            cancel: Optional event that, once set, keeps a request that is still waiting for quota from being sent
+        """
+        model = model or self.model
+
+        def send():
+            if cancel is not None and cancel.is_set():
+                raise CancelledError("Cancelled before the request was sent")
+            return chat.send_message_stream(message=message)
+
+        stream_response = self.rate_limiter.stream(
+            self._get_key(key, profile_name, model).get_bucket(model), send,
+            self._estimate_message_tokens(message), on_start)
+        usage_metadata = None
+        for chunk in stream_response:  # Process each chunk as it arrives
+            # Counts are cumulative, the last chunk reporting usage has the totals
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if chunk.text:
+                yield chunk.text
+        self._record_usage(usage_metadata, model, profile_name)
+
+    def _stream_chat_hedged(self, chat, job_description, system_template, system_core_rules, resume_path=None, outcome=None,
+                            model=None, profile_name=None, key=None):
+        """
+        Stream a chat reply, racing a second request if the first chunk is later than the learned deadline
+
+        The second request runs on a new session on the hedge fallback model (or the
+        same model). Whichever stream produces text first is used and the other is
+        cancelled at its next chunk.
+
+        Args:
+            outcome: Optional dictionary that receives the winning "model" and whether the request was "hedged"
+            model: Model the chat runs on, the current one by default
+            profile_name: Profile the chat was initialized for, the current one by default
+            key: API key the chat was created with, the profile's own key by default
+
+        Yields:
+            The text of each chunk of the winning stream
+        """
+        outcome = outcome if outcome is not None else {}
+        primary_model = model or self.model
+        outcome.update(model=primary_model, hedged=False)
+        message = self._build_job_message(
+            job_description, system_core_rules, profile_name)
+        hedge_model = HEDGE_FALLBACK_MODEL or primary_model
+        deadline = self.latency_tracker.get_deadline(
+            primary_model) if HEDGE_ENABLED else None
+        parent_span = self.tracer.current_span()
+        events = queue.Queue()  # (attempt index, "text" | "done" | "error", value)
+        # {"model", "started": time the request was sent or None, "cancel": event}
+        attempts = []
+
+        def run_attempt(index, model, start_stream):
+            attempt = attempts[index]
+            cancel = attempt["cancel"]
+            with self.tracer.span("generate.attempt", parent=parent_span, model=model, attempt=index):
+                stream = None
+                try:
+                    if cancel.is_set():
+                        return  # Lost the race before anything was sent
+                    # Latency is measured from when the request is sent, not while it waits for quota
+                    stream = start_stream(
+                        lambda: attempt.update(started=time.perf_counter()), cancel)
+                    if stream is None:
+                        return  # Lost the race while its session was initialized
+                    for text in stream:
+                        if cancel.is_set():
+                            break  # Lost the race, stop reading the stream
+                        events.put((index, "text", text))
+                    else:
+                        events.put((index, "done", None))
+                except Exception as e:
+                    events.put((index, "error", e))
+                finally:
+                    if stream is not None:
+                        stream.close()
+
+        def launch(model, start_stream):
+            attempts.append({"model": model, "started": None, "cancel": threading.Event()})
+            threading.Thread(target=run_attempt, args=(len(attempts) - 1, model, start_stream),
+                             name="cover-letter-attempt", daemon=True).start()
+
+        def start_hedge(hedge_key, on_start, cancel):
+            hedge_chat, _ = self._initialize_chat_session(
+                system_template, system_core_rules, resume_path, model=hedge_model, profile_name=profile_name,
+                key=hedge_key)
+            if cancel.is_set():
+                return None
+            return self._stream_chat(hedge_chat, message, hedge_model, profile_name, hedge_key, on_start, cancel)
+
+        launch(primary_model, lambda on_start, cancel: self._stream_chat(
+            chat, message, primary_model, profile_name, key, on_start, cancel))
+        hedge_deadline = deadline
+        try:
+            errors = []
+            while True:  # Wait for the first attempt to produce text
+                try:
+                    index, kind, value = events.get(
+                        timeout=deadline if len(attempts) == 1 else None)
+                except queue.Empty:
+                    # The hedge may go to another key if the profile's own key is saturated
+                    hedge_key = self.key_pool.pick_key(
+                        profile_name or self.profile_manager.current_profile_name, hedge_model)
+                    if self.rate_limiter.is_throttled(hedge_key.get_bucket(hedge_model)):
+                        # A second request would only wait for the same quota
+                        print(f"No first chunk after {deadline:.1f}s, not hedging while {hedge_model} is rate limited")
+                        deadline = None
+                        continue
+                    print(f"No first chunk after {deadline:.1f}s, hedging on {hedge_model}")
+                    launch(hedge_model, lambda on_start, cancel: start_hedge(hedge_key, on_start, cancel))
+                    continue
+                if kind != "error":
+                    break
+                errors.append(value)
+                if len(errors) == len(attempts):
+                    raise errors[0]
+
+            winner = index
+            now = time.perf_counter()
+            model = attempts[winner]["model"]
+            self.latency_tracker.record(model, now - attempts[winner]["started"])
+            if winner != 0:
+                # The primary was slower than the deadline, leaving it out would lower the next deadlines
+                primary = attempts[0]
+                elapsed = now - primary["started"] if primary["started"] is not None else 0.0
+                self.latency_tracker.record(primary_model, max(hedge_deadline, elapsed))
+            for other, attempt in enumerate(attempts):
+                if other != winner:
+                    attempt["cancel"].set()
+            outcome.update(model=model, hedged=len(attempts) > 1)
+
+            while kind == "text":
+                yield value
+                index, kind, value = events.get()
+                while index != winner:  # Ignore whatever the cancelled attempt still sends
+                    index, kind, value = events.get()
+            if kind == "error":
+                raise value
+        finally:
+            # Also stops every attempt if the consumer abandons the stream
+            for attempt in attempts:
+                attempt["cancel"].set()
+
+    def _generate_without_chat(self, job_description, personal_context, system_template, system_core_rules,
+                               model=None, profile_name=None, key=None):
+        """Generate a cover letter with a direct API call without chat history"""
+        model = model or self.model
+        key = self._get_key(key, profile_name, model)
+        system_instruction = system_template.format(
+            personal_context=personal_context)
+        system_instruction += system_core_rules
+
+        with self.tracer.span("generate.direct", model=model):
+            response = self.rate_limiter.call(key.get_bucket(model), lambda: key.backend.generate_content(
+                model=model,
+                contents=[job_description, system_core_rules],
+                config=types.GenerateContentConfig(
+                    system_instruction=system_instruction,
+                    response_mime_type="text/plain",
+                )
+            ), estimate_tokens(system_instruction + job_description + system_core_rules))
+        self._record_usage(response.usage_metadata, model, profile_name)
+        return response.text
+
+    def _get_result_key(self, job_description, system_template, system_core_rules, resume_path=None, model=None, profile_name=None):
+        """Get the result cache key for a job description on a profile and model, the current ones by default"""
+        profile_hash = self._get_profile_hash(
+            profile_name or self.profile_manager.current_profile_name, system_template, system_core_rules, resume_path)
+        return self.result_cache.get_result_key(profile_hash, model or self.model, system_core_rules, job_description)
+
+    def get_cached_cover_letter(self, job_description, system_template, resume_path=None):
+        """Get a previously generated cover letter for identical inputs, or None"""
+        system_core_rules = self.profile_manager.current_system_core_rules
+        result_key = self._get_result_key(
+            job_description, system_template, system_core_rules, resume_path)
+        return self.result_cache.get_letter(result_key)
+
+    def find_similar_cover_letter(self, job_description, system_template, resume_path=None, threshold=NEAR_DUPLICATE_THRESHOLD):
+        """
+        Find a letter generated earlier for a near-duplicate job description on the current profile
+
+        Returns:
+            Dictionary with the cover letter and the estimated similarity (0-1), or None
+        """
+        system_core_rules = self.profile_manager.current_system_core_rules
+        profile_hash = self._get_profile_hash(
+            self.profile_manager.current_profile_name, system_template, system_core_rules, resume_path)
 
-        return chat, profile_hash
+        for result_key, similarity in self.near_duplicate_index.find_similar(profile_hash, job_description, threshold):
+            cover_letter = self.result_cache.get_letter(result_key)
+            if cover_letter is not None:
+                return {"cover_letter": cover_letter, "similarity": similarity}
+            # The letter was evicted from the result cache
+            self.near_duplicate_index.remove(result_key)
+        return None
+
+    def _remember_cover_letter(self, profile_hash, result_key, job_description, cover_letter):
+        """Cache a generated letter and index its job description for near-duplicate lookups"""
+        if self.result_cache.save_letter(result_key, cover_letter):
+            self.near_duplicate_index.add(
+                profile_hash, result_key, job_description)
+
+    def _get_system_core_rules(self, profile_name):
+        """Get the system core rules of a profile"""
+        if profile_name == self.profile_manager.current_profile_name:
+            return self.profile_manager.current_system_core_rules
+        profile_data = self.profile_manager.load_profile(profile_name)
+        return profile_data["system_core_rules"] if profile_data else ""
+
+    def stream_cover_letter(self, job_description, personal_context, system_template, resume_path=None, force_regenerate=False,
+                            profile_name=None, model=None):
+        """
+        Stream a cover letter using chat-based context
+
+        If the chat session fails before any text arrives, the resume is dropped and
+        then a direct API call without chat history is made, as in generate_cover_letter_with_files.
+
+        Args:
+            job_description: The job description text
+            personal_context: The user's personal context
+            system_template: The system instruction template
+            resume_path: Optional path to a resume PDF file
+            force_regenerate: Generate a new letter even if one is cached for these inputs
+            profile_name: Profile to generate for, the current one by default
+            model: Model to generate with, the current one by default
+
+        Yields:
+            Only the newly generated text of each chunk
+        """
+        profile_name = profile_name or self.profile_manager.current_profile_name
+        model = model or self.model
+        system_core_rules = self._get_system_core_rules(profile_name)
+        with self.tracer.span("generate", model=model, resume=bool(resume_path)) as span:
+            result_key = self._get_result_key(
+                job_description, system_template, system_core_rules, resume_path, model, profile_name)
+            if not force_regenerate:
+                cover_letter = self.result_cache.get_letter(result_key)
+                if cover_letter is not None:
+                    span.set_attribute("result_cache", "hit")
+                    print(f"Using cached cover letter: {result_key[:8]}")
+                    yield cover_letter
+                    return
+            span.set_attribute(
+                "result_cache", "skipped" if force_regenerate else "miss")
+
+            started = False
+            key = self.key_pool.pick_key(profile_name, model)
+            span.set_attribute("api_key", key.name)
+            try:
+                chat, profile_hash = self._initialize_chat_session(
+                    system_template, system_core_rules, resume_path, model, profile_name, key)
+                span.set_attribute("profile_hash", profile_hash[:8])
+                pieces = []
+                outcome = {}
+                with self.tracer.span("generate.stream") as stream_span:
+                    for text in self._stream_chat_hedged(
+                            chat, job_description, system_template, system_core_rules, resume_path, outcome,
+                            model, profile_name, key):
+                        if not started:
+                            stream_span.set_attribute(
+                                "first_chunk_ms", round(stream_span.elapsed_ms(), 1))
+                        started = True
+                        pieces.append(text)
+                        stream_span.set_attribute("chunk_count", len(pieces))
+                        yield text
+                    stream_span.set_attributes(**outcome)
+                if pieces:
+                    if outcome["model"] != model:  # The hedge on the fallback model won
+                        result_key = self._get_result_key(
+                            job_description, system_template, system_core_rules, resume_path, outcome["model"], profile_name)
+                    self._remember_cover_letter(
+                        profile_hash, result_key, job_description, "".join(pieces))
+                return
+            except Exception as e:
+                if started:
+                    raise  # Text was already delivered, retrying would duplicate it
+                print(f"Error streaming cover letter with chat: {str(e)}")
+                if self._forget_dead_context_cache(
+                        e, profile_name, system_template, system_core_rules, resume_path, model, key):
+                    span.set_attribute("fallback", "new_session")
+                    yield from self.stream_cover_letter(job_description, personal_context, system_template, resume_path,
+                                                        force_regenerate, profile_name, model)
+                    return
+
+            span.set_attribute("fallback", "without_resume" if resume_path else "direct")
+            if resume_path:  # Fall back to the chat session without the resume
+                yield from self.stream_cover_letter(job_description, personal_context, system_template, force_regenerate=force_regenerate,
+                                                    profile_name=profile_name, model=model)
+            else:
+                yield self._generate_without_chat(job_description, personal_context, system_template, system_core_rules,
+                                                  model, profile_name, key)
+
+    def _collect_stream(self, stream, update_ui_callback):
+        """Consume a cover letter stream, passing the text so far to a callback"""
+        cover_letter = ""
+        try:
+            for text in stream:
+                cover_letter += text
+                # Update the UI with the current text
+                update_ui_callback(cover_letter)
+        except Exception as e:
+            print(f"Error streaming cover letter: {str(e)}")
+            return f"Error generating cover letter: {str(e)}"
+        return cover_letter
 
     def generate_cover_letter(self, job_description, personal_context, system_template, update_ui_callback=None):
         """
@@ -229,51 +898,35 @@ class GeminiClient:
         Returns:
             The generated cover letter text
         """
-        try:
-            # Get system core rules from the profile manager
-            system_core_rules = self.profile_manager.current_system_core_rules
+        if update_ui_callback:  # Stream the response to the UI
+            return self._collect_stream(
+                self.stream_cover_letter(job_description, personal_context, system_template), update_ui_callback)
+
+        # Get system core rules from the profile manager
+        system_core_rules = self.profile_manager.current_system_core_rules
+        key = self.key_pool.pick_key(self.profile_manager.current_profile_name, self.model)
+        try:  # Non-streaming version (original behavior)
             chat, profile_hash = self._initialize_chat_session(
-                system_template, system_core_rules)
-
-            if update_ui_callback:
-                stream_response = chat.send_message_stream(
-                    # Stream the response to the UI
-                    message=[job_description, system_core_rules])
-                cover_letter = ""
-
-                for chunk in stream_response:
-                    if chunk.text:
-                        cover_letter += chunk.text
-                        # Update the UI with the current text
-                        update_ui_callback(cover_letter)
-                return cover_letter
-            else:  # Non-streaming version (original behavior)
-                response = chat.send_message(
-                    message=[job_description, system_core_rules])
-                return response.text
+                system_template, system_core_rules, key=key)
+            response = self._send_message(
+                chat, self._build_job_message(job_description, system_core_rules), key=key)
+            self._record_usage(response.usage_metadata)
+            return response.text
 
         except Exception as e:
             print(f"Error generating cover letter with chat: {str(e)}")
-
-            system_instruction = system_template.format(
-                personal_context=personal_context)
-            system_instruction += self.profile_manager.current_system_core_rules
+            if self._forget_dead_context_cache(e, self.profile_manager.current_profile_name, system_template,
+                                               system_core_rules, None, self.model, key):
+                return self.generate_cover_letter(job_description, personal_context, system_template)
 
             try:  # Make direct API call without chat history
-                response = self.client.models.generate_content(
-                    model=self.model,
-                    contents=[job_description, system_core_rules],
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_instruction,
-                        response_mime_type="text/plain",
-                    )
-                )
-                return response.text
+                return self._generate_without_chat(job_description, personal_context, system_template, system_core_rules,
+                                                   key=key)
             except Exception as fallback_error:
                 print(f"Error in fallback generation: {str(fallback_error)}")
                 return f"Error generating cover letter: {str(e)}\nFallback error: {str(fallback_error)}"
 
-    def generate_cover_letter_with_files(self, job_description, personal_context, system_template, resume_path=None, update_ui_callback=None):
+    def generate_cover_letter_with_files(self, job_description, personal_context, system_template, resume_path=None, update_ui_callback=None, force_regenerate=False):
         """
         Generate a cover letter using chat-based context with resume
 
@@ -283,65 +936,145 @@ class GeminiClient:
             system_template: The system instruction template
             resume_path: Path to a resume PDF file
             update_ui_callback: Optional callback function to update UI with streaming responses
+            force_regenerate: Generate a new letter even if one is cached for these inputs
 
         Returns:
             The generated cover letter text
         """
-        try:
-            system_core_rules = self.profile_manager.current_system_core_rules
+        if update_ui_callback:  # Stream the response to the UI
+            return self._collect_stream(
+                self.stream_cover_letter(job_description, personal_context, system_template, resume_path, force_regenerate), update_ui_callback)
+
+        system_core_rules = self.profile_manager.current_system_core_rules
+        key = self.key_pool.pick_key(self.profile_manager.current_profile_name, self.model)
+        try:  # Non-streaming version (original behavior)
+            result_key = self._get_result_key(
+                job_description, system_template, system_core_rules, resume_path)
+            if not force_regenerate:
+                cover_letter = self.result_cache.get_letter(result_key)
+                if cover_letter is not None:
+                    print(f"Using cached cover letter: {result_key[:8]}")
+                    return cover_letter
+
             chat, profile_hash = self._initialize_chat_session(
-                system_template, system_core_rules, resume_path)
-
-            if update_ui_callback:
-                stream_response = chat.send_message_stream(
-                    # Stream the response to the UI
-                    message=[job_description, system_core_rules])
-                cover_letter = ""
-
-                for chunk in stream_response:  # Process each chunk as it arrives
-                    if chunk.text:
-                        cover_letter += chunk.text
-                        # Update the UI with the current text
-                        update_ui_callback(cover_letter)
-                return cover_letter
-            else:  # Non-streaming version (original behavior)
-                response = chat.send_message(
-                    message=[job_description, system_core_rules])
-                return response.text
+                system_template, system_core_rules, resume_path, key=key)
+            response = self._send_message(
+                chat, self._build_job_message(job_description, system_core_rules), key=key)
+            self._record_usage(response.usage_metadata)
+            if response.text:
+                self._remember_cover_letter(
+                    profile_hash, result_key, job_description, response.text)
+            return response.text
 
         except Exception as e:
             print(
                 f"Error generating cover letter with chat and files: {str(e)}")
-            # Fall back to the standard approach without chat
-            return self.generate_cover_letter(job_description, personal_context, system_template, update_ui_callback)
+            if self._forget_dead_context_cache(e, self.profile_manager.current_profile_name, system_template,
+                                               system_core_rules, resume_path, self.model, key):
+                return self.generate_cover_letter_with_files(job_description, personal_context, system_template,
+                                                             resume_path, force_regenerate=force_regenerate)
+            if resume_path:  # Fall back to the chat session without the resume
+                return self.generate_cover_letter(job_description, personal_context, system_template)
+
+            # generate_cover_letter would initialize the same session again
+            try:  # Make direct API call without chat history
+                return self._generate_without_chat(job_description, personal_context, system_template, system_core_rules,
+                                                   key=key)
+            except Exception as fallback_error:
+                print(f"Error in fallback generation: {str(fallback_error)}")
+                return f"Error generating cover letter: {str(e)}\nFallback error: {str(fallback_error)}"
+
+    def generate_cover_letters_batch(self, job_descriptions, personal_context, system_template, resume_path=None, max_concurrency=None, force_regenerate=False):
+        """
+        Generate cover letters for many job descriptions concurrently
+
+        Args:
+            job_descriptions: List of job description texts
+            personal_context: The user's personal context
+            system_template: The system instruction template
+            resume_path: Path to a resume PDF file
+            max_concurrency: Maximum number of generations running at once (defaults to the batch_concurrency setting)
+            force_regenerate: Generate new letters even if some are cached for these inputs
+
+        Yields:
+            (index, cover_letter) tuples in completion order, where index is the
+            position of the job description in job_descriptions
+        """
+        max_concurrency = max(1, int(max_concurrency or BATCH_CONCURRENCY))
+        executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="cover-letter-batch")
+        futures = {}
+        try:
+            for index, job_description in enumerate(job_descriptions):
+                future = executor.submit(
+                    self.generate_cover_letter_with_files, job_description, personal_context, system_template, resume_path,
+                    force_regenerate=force_regenerate)
+                futures[future] = index
+
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # Drop queued work if the caller stops consuming results early
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
 
     def clear_chats(self):
         """Clear all chat sessions from memory and storage"""
-        self.chat_sessions = {}
+        with self._chat_sessions_lock:
+            self.chat_sessions.clear()
 
         try:  # Also delete saved chat states
-            for file in os.listdir(CHAT_STATE_DIR):
-                if file.endswith('.json'):
-                    os.remove(os.path.join(CHAT_STATE_DIR, file))
+            self.chat_state_store.clear()
             print("All saved chat states cleared")
         except Exception as e:
-            print(f"Error clearing chat state files: {str(e)}")
+            print(f"Error clearing saved chat states: {str(e)}")
 
         return True
 
-    def update_api_key(self, new_key):
-        """Update the API key and reinitialize the client"""
+    def clear_caches(self):
+        """Delete all context caches, cached cover letters and chat sessions"""
+        # Each key's project holds its own caches
+        self.cache_manager.delete_all_caches(*(key.backend for key in self.key_pool.keys))
+        self.result_cache.clear()
+        self.near_duplicate_index.clear()
+        return self.clear_chats()
+
+    def update_api_key(self, new_key, extra_keys=None):
+        """
+        Update the API keys, creating new clients only for keys that changed
+
+        Args:
+            new_key: The primary API key
+            extra_keys: The api_keys entries of the saved settings, None to keep the current ones
+        """
         try:
+            key_changed = new_key != self.api_key
             self.api_key = new_key
-            self.client = genai.Client(api_key=self.api_key)
+            if extra_keys is not None:
+                self.extra_api_keys = extra_keys
+            # Also forgets the backoff learned for the previous keys
+            self._configure_keys()
+            if key_changed:  # Uploaded files belong to the project of the previous key
+                self.upload_registry.clear()
             print("API key updated successfully.")
             return True
         except Exception as e:
             print(f"Error updating API key: {str(e)}")
             return False
 
+    def set_backend(self, backend):
+        """Replace the generation backend, e.g. with a StubBackend for offline tests and benchmarks"""
+        self.key_pool.use_backend(backend)
+        # Sessions, caches and uploads of the previous backend cannot be used with the new one
+        with self._chat_sessions_lock:
+            self.chat_sessions.clear()
+        self.cache_manager.delete_all_caches()
+        self.upload_registry.clear()
+
     def update_model(self, new_model):
         """Update the model being used"""
         self.model = new_model
         # Clear chat sessions to ensure the new model is used
-        self.chat_sessions = {}
+        with self._chat_sessions_lock:
+            self.chat_sessions.clear()
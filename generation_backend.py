@@ -0,0 +1,84 @@
+from google import genai
+from config import RATE_LIMIT_ENABLED, MODEL_RATE_LIMITS
+from http_transport import get_http_options
+
+
+class GenerationBackend:
+    """Interface GeminiClient uses to reach a model: chats, uploads, context caches and direct generation"""
+
+    def create_chat(self, model, config, history=None):
+        """Create a chat session supporting send_message, send_message_stream and get_history"""
+        raise NotImplementedError
+
+    def upload_file(self, file, mime_type):
+        """Upload a file-like object, returning a types.File"""
+        raise NotImplementedError
+
+    def create_cache(self, model, config):
+        """Create a context cache from a types.CreateCachedContentConfig, returning a types.CachedContent"""
+        raise NotImplementedError
+
+    def delete_cache(self, name):
+        """Delete a context cache by name"""
+        raise NotImplementedError
+
+    def generate_content(self, model, contents, config):
+        """Generate a response without chat history, returning a types.GenerateContentResponse"""
+        raise NotImplementedError
+
+    def get_rate_limits(self, model):
+        """Get the {"rpm", "tpm"} quotas of a model, or None if requests are not limited"""
+        return None
+
+
+class GenaiBackend(GenerationBackend):
+    """Backend that calls the Gemini API through the google-genai SDK"""
+
+    def __init__(self, api_key):
+        """Initialize the SDK client on a pool of kept-alive connections"""
+        self.client = genai.Client(
+            api_key=api_key, http_options=get_http_options())
+
+    def create_chat(self, model, config, history=None):
+        """Create a chat session supporting send_message, send_message_stream and get_history"""
+        return self.client.chats.create(model=model, config=config, history=history)
+
+    def upload_file(self, file, mime_type):
+        """Upload a file-like object, returning a types.File"""
+        return self.client.files.upload(file=file, config=dict(mime_type=mime_type))
+
+    def create_cache(self, model, config):
+        """Create a context cache from a types.CreateCachedContentConfig, returning a types.CachedContent"""
+        return self.client.caches.create(model=model, config=config)
+
+    def delete_cache(self, name):
+        """Delete a context cache by name"""
+        self.client.caches.delete(name=name)
+
+    def generate_content(self, model, contents, config):
+        """Generate a response without chat history, returning a types.GenerateContentResponse"""
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    def get_rate_limits(self, model):
+        """Get the {"rpm", "tpm"} quotas of a model from settings, or None if none are set"""
+        if not RATE_LIMIT_ENABLED:
+            return None
+        return MODEL_RATE_LIMITS.get(model)
+
+
+def create_backend(backend_name, api_key, stub_options=None):
+    """
+    Create the backend selected in settings
+
+    Args:
+        backend_name: "genai" for the Gemini API or "stub" for the offline StubBackend
+        api_key: Gemini API key, the genai backend is not created without one
+        stub_options: Keyword arguments for StubBackend
+
+    Returns:
+        A GenerationBackend, or None if the Gemini API was selected without an API key
+    """
+    if backend_name == "stub":
+        from stub_backend import StubBackend  # Only needed offline
+        return StubBackend(**(stub_options or {}))
+    return GenaiBackend(api_key) if api_key else None
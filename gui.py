@@ -1,14 +1,71 @@
 import tkinter as tk
 from tkinter import scrolledtext, ttk, messagebox, simpledialog, filedialog
 import threading
+import queue
 import os
+import time
 import tkinter.filedialog as filedialog
 from docx import Document
 
 from profile_manager import ProfileManager
 from gemini_client import GeminiClient
+from job_queue import JobRunner, INTERACTIVE_PRIORITY
+from tracing import Tracer
 from config import GEMINI_API_KEY, DEFAULT_GEMINI_MODEL, load_settings, save_settings
 
+# Interval at which streamed text is flushed into text widgets (about one frame at 60 Hz)
+STREAM_FRAME_INTERVAL_MS = 16
+
+
+class StreamingTextRenderer:
+    """Appends streamed text to a text widget, batching pieces from worker threads once per frame on the Tk thread"""
+
+    def __init__(self, root, text_widget, frame_interval_ms=STREAM_FRAME_INTERVAL_MS):
+        """Initialize the renderer"""
+        self.root = root
+        self.text_widget = text_widget
+        self.frame_interval_ms = frame_interval_ms
+        self._pending = queue.SimpleQueue()
+        self._after_id = None
+        self._cleared = False
+
+    def put(self, text):
+        """Queue text for display - safe to call from any thread"""
+        self._pending.put(text)
+
+    def start(self):
+        """Start flushing queued text once per frame - call on the Tk thread"""
+        self._after_id = self.root.after(self.frame_interval_ms, self._on_frame)
+
+    def stop(self):
+        """Flush any remaining text and stop - call on the Tk thread"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self._flush()
+
+    def _on_frame(self):
+        """Flush queued text and schedule the next frame"""
+        self._flush()
+        self._after_id = self.root.after(self.frame_interval_ms, self._on_frame)
+
+    def _flush(self):
+        """Append all queued text to the widget in a single insert"""
+        pieces = []
+        while True:
+            try:
+                pieces.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        if not pieces:
+            return
+
+        self.text_widget.config(state=tk.NORMAL)
+        if not self._cleared:  # Replace the placeholder on the first text
+            self.text_widget.delete("1.0", tk.END)
+            self._cleared = True
+        self.text_widget.insert(tk.END, "".join(pieces))
+
 
 class TabBase:
     """Base class for all tabs in the application"""
@@ -129,6 +186,10 @@ class MainTab(TabBase):
         self.app = app
         self.profile_manager = ProfileManager()
         self.gemini_client = GeminiClient()
+        self.tracer = Tracer()
+        # Generations run as queued jobs that survive closing the app
+        self.job_runner = JobRunner(self.gemini_client)
+        self.job_runner.start()
 
         # Create frames for input and output
         self.input_frame = tk.Frame(self.frame, padx=10, pady=10)
@@ -165,6 +226,9 @@ class MainTab(TabBase):
             self.input_frame, height=10, width=80, wrap=tk.WORD, font=("Arial", 10))
         self.job_desc_input.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
         self._add_context_menu(self.job_desc_input)
+        # Prewarm the session when a job description first lands in the input
+        self._job_desc_had_text = False
+        self.job_desc_input.bind("<<Modified>>", self._on_job_desc_modified)
 
         # Resume selection
         self.resume_selection_frame = tk.Frame(self.input_frame)
@@ -212,6 +276,20 @@ class MainTab(TabBase):
                                          command=self._on_generate, bg="#4CAF50", fg="white", font=("Arial", 12, "bold"), height=2)
         self.generate_button.pack(side=tk.LEFT)
 
+        # Bypass the cache of previously generated letters
+        self.force_regenerate_var = tk.BooleanVar(value=False)
+        self.force_regenerate_check = tk.Checkbutton(
+            generate_frame, text="Regenerate", variable=self.force_regenerate_var)
+        self.force_regenerate_check.pack(side=tk.LEFT, padx=(10, 0))
+
+        # Queue the job description to be generated in the background
+        self.queue_button = tk.Button(generate_frame, text="Add to Queue",
+                                      command=self._on_add_to_queue, bg="#2196F3", fg="white", font=("Arial", 10))
+        self.queue_button.pack(side=tk.LEFT, padx=(10, 0))
+        self.view_queue_button = tk.Button(generate_frame, text="Job Queue",
+                                           command=self._view_job_queue, bg="#2196F3", fg="white", font=("Arial", 10))
+        self.view_queue_button.pack(side=tk.LEFT, padx=(5, 0))
+
         # Status label for generation and file operations
         self.status_label = tk.Label(generate_frame, text="Ready", font=(
             "Arial", 10, "bold"), padx=10, fg="#4CAF50")
@@ -254,6 +332,7 @@ class MainTab(TabBase):
             self.custom_resume_frame.pack(fill=tk.X, pady=(0, 5))
         else:
             self.custom_resume_frame.pack_forget()
+        self.prewarm_session()
 
     def _browse_custom_resume(self):
         """Browse for custom resume file"""
@@ -263,6 +342,31 @@ class MainTab(TabBase):
         )
         if file_path:
             self.custom_resume_path_var.set(file_path)
+            self.prewarm_session()
+
+    def _get_selected_resume_path(self):
+        """Get the resume chosen for generation, or None"""
+        if self.resume_option_var.get() == "profile":
+            return self.profile_manager.current_resume_path
+        elif self.resume_option_var.get() == "custom":
+            custom_path = self.custom_resume_path_var.get().strip()
+            if custom_path and os.path.exists(custom_path):
+                return custom_path
+        return None
+
+    def prewarm_session(self):
+        """Prepare the chat session for the current profile and resume in the background"""
+        self.gemini_client.prewarm_session(self._get_selected_resume_path())
+
+    def _on_job_desc_modified(self, event=None):
+        """Prewarm the session when text lands in an empty job description input"""
+        if not self.job_desc_input.edit_modified():
+            return
+        self.job_desc_input.edit_modified(False)
+        has_text = self.job_desc_input.compare("end-1c", "!=", "1.0")
+        if has_text and not self._job_desc_had_text:
+            self.prewarm_session()
+        self._job_desc_had_text = has_text
 
     def _copy_to_clipboard(self):
         """Copy output text to clipboard"""
@@ -297,16 +401,40 @@ class MainTab(TabBase):
                 3000, lambda: self.job_desc_warning.pack_forget())
             return
 
-        # Get resume path if available
-        resume_path = None
-        if self.resume_option_var.get() == "profile":
-            resume_path = self.profile_manager.current_resume_path
-        elif self.resume_option_var.get() == "custom":
-            custom_path = self.custom_resume_path_var.get().strip()
-            if custom_path and os.path.exists(custom_path):
-                resume_path = custom_path
-        # Generate the cover letter directly
-        self._generate_cover_letter(job_description, resume_path)
+        # The generation prepares its own session from here
+        self.gemini_client.cancel_prewarm()
+        with self.tracer.span("gui.on_generate", job_chars=len(job_description)) as span:
+            # Get resume path if available
+            resume_path = self._get_selected_resume_path()
+            if not self.force_regenerate_var.get() and self._offer_similar_cover_letter(job_description, resume_path):
+                span.set_attribute("similar_letter_used", True)
+                return
+            # Generate the cover letter directly
+            self._generate_cover_letter(job_description, resume_path)
+
+    def _offer_similar_cover_letter(self, job_description, resume_path):
+        """Offer the letter of a near-duplicate earlier posting instead of generating, returns True if used"""
+        system_template = self.profile_manager.current_system_template
+        if self.gemini_client.get_cached_cover_letter(job_description, system_template, resume_path) is not None:
+            return False  # Identical inputs, the generation itself loads the cached letter
+
+        similar = self.gemini_client.find_similar_cover_letter(
+            job_description, system_template, resume_path)
+        if not similar:
+            return False
+
+        use_earlier = messagebox.askyesno(
+            "Similar Job Found",
+            f"A very similar job description ({int(similar['similarity'] * 100)}% match) was used before.\n\n"
+            "Show the cover letter generated for it instead of generating a new one?")
+        if not use_earlier:
+            return False
+
+        self.output_text.config(state=tk.NORMAL)
+        self._update_output(similar["cover_letter"])
+        self.status_label.config(
+            text="Showing the cover letter of a similar earlier job. Tick 'Regenerate' for a new one.", fg="#4CAF50")
+        return True
 
     def _generate_cover_letter(self, job_description, resume_path=None):
         """Generate the cover letter after confirmation"""
@@ -323,52 +451,149 @@ class MainTab(TabBase):
         self.app.root.update()
 
         # Disable generate button during generation
-        # Create a callback function to update the UI with streaming responses
         self.generate_button.config(state=tk.DISABLED)
 
-        def update_ui_with_chunk(text):
-            self.output_text.config(state=tk.NORMAL)
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert(tk.END, text)
-            # Don't disable the text widget so user can edit
-            self.app.root.update()  # Use a thread to prevent GUI freezing
+        # Streamed text is appended once per frame on the Tk thread
+        renderer = StreamingTextRenderer(self.app.root, self.output_text)
+        renderer.start()
+        force_regenerate = self.force_regenerate_var.get()
+
+        with self.tracer.span("gui.generate") as span:
+            # Reuse the letter generated earlier for identical inputs
+            cover_letter = None
+            if not force_regenerate:
+                cover_letter = self.gemini_client.get_cached_cover_letter(
+                    job_description, self.profile_manager.current_system_template, resume_path)
+            span.set_attribute("result_cache_hit", cover_letter is not None)
+        if cover_letter is not None:
+            renderer.put(cover_letter)
+            renderer.stop()
+            self.status_label.config(
+                text="Loaded previously generated cover letter. Tick 'Regenerate' for a new one.", fg="#4CAF50")
+            self.generate_button.config(state=tk.NORMAL)
+            self._auto_save(cover_letter, span)
+            return
 
-        def generate_in_thread():
-            try:
-                # Get the current profile data
-                personal_context = self.profile_manager.current_personal_context
-                system_template = self.profile_manager.current_system_template
-
-                # Use the multimodal approach with resume file if available
-                cover_letter = self.gemini_client.generate_cover_letter_with_files(
-                    job_description, personal_context, system_template, resume_path,
-                    update_ui_callback=update_ui_with_chunk
-                )
+        def on_finish(job):  # Called on a worker thread
+            self.app.root.after(0, lambda: self._on_generation_finished(job, renderer, span))
+
+        # The job is kept on disk until it finishes, so closing the app does not lose it.
+        # Its spans run on a worker thread and nest under the click that started it
+        self.job_runner.submit(
+            job_description, self.profile_manager.current_profile_name, self.gemini_client.model,
+            resume_path, force_regenerate=True,  # The cache was checked above
+            on_text=renderer.put, on_finish=on_finish, parent_span=span, priority=INTERACTIVE_PRIORITY)
+
+    def _on_generation_finished(self, job, renderer, parent_span=None):
+        """Show the outcome of a generation job started with the generate button"""
+        # Show the last pieces before reporting completion
+        renderer.stop()
+        self.generate_button.config(state=tk.NORMAL)
+        if job and job["status"] == "done":
+            self.status_label.config(
+                text="Cover letter generated successfully!", fg="#4CAF50")
+            self._auto_save(job["cover_letter"], parent_span)
+            return
 
-                # No need to update UI here as it's done by the callback during streaming
-                # Update status to show generation is complete
-                self.app.root.after(0, lambda: self.status_label.config(
-                    text="Cover letter generated successfully!", fg="#4CAF50"))
+        error_message = f"Error generating cover letter: {job['error'] if job else 'job was removed'}"
+        self._update_output(error_message, is_error=True)
+        self.status_label.config(
+            text="Generation failed! See error details above.", fg="#f44336")
 
-                # Auto-save to Word if enabled in preferences
-                save_prefs = self.profile_manager.get_save_preferences()
-                if save_prefs.get("auto_save_as_word", False) and cover_letter:
-                    self.app.root.after(
-                        100, lambda: self.save_to_word(cover_letter))
-            except Exception as e:
-                error_message = f"Error generating cover letter: {str(e)}"
-                self.app.root.after(0, lambda: self._update_output(
-                    error_message, is_error=True))
-                self.app.root.after(0, lambda: self.status_label.config(
-                    text="Generation failed! See error details above.", fg="#f44336"))
-            finally:
-                # Re-enable the generate button
-                self.app.root.after(
-                    # Start the generation thread
-                    0, lambda: self.generate_button.config(state=tk.NORMAL))
-        thread = threading.Thread(target=generate_in_thread)
-        thread.daemon = True
-        thread.start()
+    def _auto_save(self, cover_letter, parent_span=None):
+        """Save a cover letter to Word if enabled in preferences, tracing the export under a given span"""
+        save_prefs = self.profile_manager.get_save_preferences()
+        if save_prefs.get("auto_save_as_word", False) and cover_letter:
+            self.app.root.after(
+                100, lambda: self.save_to_word(cover_letter, parent_span=parent_span))
+
+    def _on_add_to_queue(self):
+        """Queue the job description for generation in the background"""
+        job_description = self.job_desc_input.get("1.0", tk.END)
+        if not job_description.strip():
+            self.job_desc_warning.pack(side=tk.LEFT, padx=10)
+            self.app.root.after(
+                3000, lambda: self.job_desc_warning.pack_forget())
+            return
+
+        job_id = self.job_runner.submit(
+            job_description, self.profile_manager.current_profile_name, self.gemini_client.model,
+            self._get_selected_resume_path(), self.force_regenerate_var.get())
+        self.job_desc_input.delete("1.0", tk.END)
+        self.status_label.config(
+            text=f"Added job {job_id} to the queue", fg="#4CAF50")
+
+    def _view_job_queue(self):
+        """Show queued, running and finished generation jobs"""
+        queue_window = tk.Toplevel(self.app.root)
+        queue_window.title("Job Queue")
+        queue_window.geometry("800x520")
+
+        tk.Label(queue_window, text="Generation Jobs",
+                 font=("Arial", 12, "bold")).pack(pady=(10, 5))
+        counts_label = tk.Label(queue_window, text="", font=("Arial", 10))
+        counts_label.pack()
+
+        columns = ("id", "status", "profile", "model", "attempts", "job")
+        headings = ("Job", "Status", "Profile", "Model", "Attempts", "Job Description")
+        widths = (50, 70, 100, 150, 70, 320)
+        tree = ttk.Treeview(queue_window, columns=columns,
+                            show="headings", height=14)
+        for column, heading, width in zip(columns, headings, widths):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width, anchor="w")
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        def refresh():
+            if not queue_window.winfo_exists():
+                return
+            selected = tree.selection()
+            tree.delete(*tree.get_children())
+            for job in self.job_runner.job_queue.list_jobs():
+                summary = " ".join(job["job_description"].split())[:80]
+                tree.insert("", tk.END, iid=str(job["id"]), values=(
+                    job["id"], job["status"], job["profile_name"], job["model"], job["attempts"], summary))
+            tree.selection_set([iid for iid in selected if tree.exists(iid)])
+            counts = self.job_runner.job_queue.get_counts()
+            counts_label.config(text="   ".join(
+                f"{status}: {counts.get(status, 0)}" for status in ("pending", "running", "done", "failed")))
+            queue_window.after(2000, refresh)
+
+        def selected_job():
+            selection = tree.selection()
+            return self.job_runner.job_queue.get_job(int(selection[0])) if selection else None
+
+        def show_letter():
+            job = selected_job()
+            if not job:
+                return
+            if job["status"] == "done":
+                self.output_text.config(state=tk.NORMAL)
+                self._update_output(job["cover_letter"])
+                self.status_label.config(
+                    text=f"Showing the cover letter of job {job['id']}", fg="#4CAF50")
+            elif job["error"]:
+                messagebox.showinfo(f"Job {job['id']}", f"Last error: {job['error']}", parent=queue_window)
+
+        def retry_job():
+            job = selected_job()
+            if job and job["status"] == "failed":
+                self.job_runner.job_queue.retry(job["id"])
+                self.job_runner.notify()
+
+        def remove_job():
+            job = selected_job()
+            if job:
+                self.job_runner.job_queue.delete(job["id"])
+
+        button_frame = tk.Frame(queue_window)
+        button_frame.pack(pady=10)
+        for text, command in (("Show Letter", show_letter), ("Retry", retry_job), ("Remove", remove_job),
+                              ("Clear Finished", self.job_runner.job_queue.clear_finished),
+                              ("Close", queue_window.destroy)):
+            tk.Button(button_frame, text=text, command=command, bg="#2196F3",
+                      fg="white", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
+        refresh()
 
     def _update_output(self, text, is_error=False):
         """Update the output text area with generated content or error"""
@@ -379,7 +604,7 @@ class MainTab(TabBase):
             self.output_text.tag_configure("error", foreground="red")
             self.output_text.tag_add("error", "1.0", tk.END)
 
-    def save_to_word(self, content):
+    def save_to_word(self, content, parent_span=None):
         """Save the generated content to a Word file."""
         # Get save preferences from the profile manager
         save_prefs = self.profile_manager.get_save_preferences()
@@ -410,9 +635,11 @@ class MainTab(TabBase):
                 counter += 1
 
         try:
-            doc = Document()
-            doc.add_paragraph(content)
-            doc.save(filepath)
+            with self.tracer.span("gui.save_to_word", parent=parent_span, chars=len(content)) as span:
+                doc = Document()
+                doc.add_paragraph(content)
+                doc.save(filepath)
+                span.set_attribute("bytes", os.path.getsize(filepath))
             self.status_label.config(
                 text=f"File saved to: {filepath}", fg="#4CAF50")
             # Don't automatically clear the status - keep it visible
@@ -530,6 +757,7 @@ class ProfileTab(TabBase):
 
             # Update the main tab
             self.app.update_tabs()
+            self.app.main_tab.prewarm_session()
 
     def _remove_resume(self):
         """Remove resume from profile"""
@@ -543,6 +771,7 @@ class ProfileTab(TabBase):
 
         # Update the main tab
         self.app.update_tabs()
+        self.app.main_tab.prewarm_session()
 
     def _update_resume_path(self):
         """Update resume path field"""
@@ -569,6 +798,7 @@ class SystemInstructionTab(TabBase):
         self.app = app
         self.profile_manager = ProfileManager()
         self.gemini_client = GeminiClient()
+        self.tracer = Tracer()
 
         tk.Label(self.frame, text="System Instruction Template:", font=(
             "Arial", 12, "bold")).pack(anchor="w", padx=10, pady=(10, 5))
@@ -713,7 +943,7 @@ class SystemInstructionTab(TabBase):
             # Create a popup window to display cache info
             cache_window = tk.Toplevel(self.app.root)
             cache_window.title("Cache Status")
-            cache_window.geometry("500x300")
+            cache_window.geometry("500x480")
 
             tk.Label(cache_window, text="Active Cache Information",
                      font=("Arial", 12, "bold")).pack(pady=(10, 5))
@@ -750,6 +980,45 @@ class SystemInstructionTab(TabBase):
                 tk.Label(cache_window, text="Caches are created when generating cover letters\nand automatically expire after 30 minutes.", font=(
                     "Arial", 10, "italic")).pack(pady=5)
 
+            # Estimated input saved by sending only the relevant parts of large personal contexts
+            pruning = self.gemini_client.get_context_pruning_stats()
+            if pruning["pruned"]:
+                tk.Label(cache_window, text=f"Context pruning: {pruning['pruned']} generations, "
+                         f"about {pruning['tokens_saved']} of {pruning['context_tokens']} context tokens saved",
+                         font=("Arial", 10)).pack(pady=(10, 0))
+
+            # Models whose quotas delayed or rejected requests
+            for model, limits in self.gemini_client.get_rate_limit_stats().items():
+                if limits["wait_s"] or limits["rate_limited"]:
+                    tk.Label(cache_window, text=f"Rate limit {model}: waited {limits['wait_s']}s, "
+                             f"{limits['rate_limited']} quota errors, {limits['concurrency']} requests at once",
+                             font=("Arial", 10)).pack()
+
+            # How profiles are spread over the API keys of several projects
+            key_stats = self.gemini_client.get_api_key_stats()
+            if len(key_stats["keys"]) > 1:
+                tk.Label(cache_window, text="API keys: " + ", ".join(
+                    f"{name} ({stats['profiles']} profiles)" for name, stats in key_stats["keys"].items()) +
+                    f", {key_stats['overflow_requests']} requests moved off a rate limited key",
+                    font=("Arial", 10)).pack()
+
+            # Requests that skipped the TCP and TLS handshakes by reusing an open connection
+            connections = self.gemini_client.get_connection_stats()
+            if connections["requests"]:
+                tk.Label(cache_window, text=f"HTTP connections: {connections['connections']} opened for "
+                         f"{connections['requests']} requests ({connections['reuse_rate']:.0%} reused)",
+                         font=("Arial", 10)).pack()
+
+            # Timings of the generation stages since the app started
+            timings = self.tracer.get_summary()
+            if timings:
+                tk.Label(cache_window, text="Stage Timings (ms)",
+                         font=("Arial", 12, "bold")).pack(pady=(10, 5))
+                timing_lines = [f"{name:<22} n={stats['count']:<4} p50={stats['p50_ms']:<9} p95={stats['p95_ms']}"
+                                for name, stats in timings.items()]
+                tk.Label(cache_window, text="\n".join(timing_lines), font=(
+                    "Courier", 9), justify=tk.LEFT).pack(padx=10)
+
             # Close button
             close_button = tk.Button(
                 cache_window, text="Close", command=cache_window.destroy, bg="#2196F3", fg="white", font=("Arial", 10))
@@ -896,6 +1165,7 @@ class ProfileManagementTab(TabBase):
             if self.profile_manager.set_current_profile(selected):
                 # Update all tabs
                 self.app.update_tabs()
+                self.app.main_tab.prewarm_session()
 
                 self.profile_status_label.config(
                     text=f"Loaded profile: {selected}")
@@ -994,6 +1264,7 @@ class ProfileManagementTab(TabBase):
                     if selected == self.profile_manager.current_profile_name:
                         self.profile_manager.current_resume_path = file_path
                         self.app.update_tabs()
+                        self.app.main_tab.prewarm_session()
 
                     self.profile_status_label.config(
                         text=f"Resume added to profile: {selected}")
@@ -1210,11 +1481,97 @@ class SettingsTab(TabBase):
                                              command=self._delete_custom_model, bg="#f44336", fg="white")
         self.delete_model_button.pack(anchor="w", pady=5)
 
+        # Token usage section
+        self.usage_frame = tk.LabelFrame(self.settings_frame, text="Token Usage", font=(
+            "Arial", 12, "bold"), padx=10, pady=10)
+        self.usage_frame.pack(fill=tk.X, pady=10)
+
+        self.usage_summary_label = tk.Label(
+            self.usage_frame, text="", justify=tk.LEFT)
+        self.usage_summary_label.pack(anchor="w", pady=5)
+        self._update_usage_summary()
+
+        self.view_usage_button = tk.Button(
+            self.usage_frame, text="View Usage Report", command=self._view_usage_report, bg="#2196F3", fg="white")
+        self.view_usage_button.pack(anchor="w", pady=5)
+
         # Status message
         self.status_label = tk.Label(
             self.settings_frame, text="", font=("Arial", 10, "italic"))
         self.status_label.pack(pady=10)
 
+    def _update_usage_summary(self):
+        """Show today's token usage"""
+        today = self.gemini_client.usage_ledger.get_totals("day").get(
+            time.strftime("%Y-%m-%d"))
+        if not today:
+            self.usage_summary_label.config(text="No API usage recorded today.")
+            return
+        self.usage_summary_label.config(
+            text=f"Today: {today['requests']} requests, {today['total_tokens']:,} tokens "
+                 f"({today['output_tokens']:,} output, {int(today['cached_share'] * 100)}% of input served from cache)")
+
+    def _view_usage_report(self):
+        """Show token usage per day, profile and model"""
+        ledger = self.gemini_client.usage_ledger
+        groupings = {
+            "Day, profile and model": None,
+            "Day": "day",
+            "Profile": "profile",
+            "Model": "model",
+        }
+        columns = ("group", "requests", "prompt_tokens", "cached_tokens",
+                   "output_tokens", "total_tokens", "cached_share")
+        headings = ("Group", "Requests", "Input", "Cached Input",
+                    "Output", "Total", "Cached %")
+
+        report_window = tk.Toplevel(self.app.root)
+        report_window.title("Token Usage Report")
+        report_window.geometry("900x420")
+
+        tk.Label(report_window, text="Token Usage",
+                 font=("Arial", 12, "bold")).pack(pady=(10, 5))
+
+        group_frame = tk.Frame(report_window)
+        group_frame.pack(fill=tk.X, padx=10)
+        tk.Label(group_frame, text="Group by:").pack(side=tk.LEFT, padx=5)
+        group_var = tk.StringVar(value="Day, profile and model")
+        group_dropdown = ttk.Combobox(group_frame, textvariable=group_var, values=list(
+            groupings), state="readonly", width=25)
+        group_dropdown.pack(side=tk.LEFT, padx=5)
+
+        tree = ttk.Treeview(report_window, columns=columns,
+                            show="headings", height=12)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=300 if column ==
+                        "group" else 90, anchor="w" if column == "group" else "e")
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        def show_usage(*args):
+            tree.delete(*tree.get_children())
+            group_by = groupings[group_var.get()]
+            if group_by:
+                rows = [{"group": name, **totals}
+                        for name, totals in ledger.get_totals(group_by).items()]
+            else:
+                rows = [{"group": f"{row['day']}   {row['profile']}   {row['model']}", **row}
+                        for row in ledger.get_rows()]
+            for row in rows:
+                cached_share = row["cached_tokens"] / \
+                    row["prompt_tokens"] if row["prompt_tokens"] else 0
+                tree.insert("", tk.END, values=(
+                    row["group"], row["requests"], f"{row['prompt_tokens']:,}", f"{row['cached_tokens']:,}",
+                    f"{row['output_tokens']:,}", f"{row['total_tokens']:,}", f"{int(cached_share * 100)}%"))
+
+        group_dropdown.bind("<<ComboboxSelected>>", show_usage)
+        show_usage()
+
+        tk.Label(report_window, text="Cached input is the part of the input served from context caches at a reduced rate.", font=(
+            "Arial", 10, "italic")).pack(pady=5)
+        tk.Button(report_window, text="Close", command=report_window.destroy,
+                  bg="#2196F3", fg="white", font=("Arial", 10)).pack(pady=10)
+
     def _toggle_key_visibility(self):
         """Toggle API key visibility"""
         if self.show_key_var.get():
@@ -1235,7 +1592,7 @@ class SettingsTab(TabBase):
         settings = load_settings()
         settings["api_key"] = new_key
         if save_settings(settings):            # Update the client
-            if self.gemini_client.update_api_key(new_key):
+            if self.gemini_client.update_api_key(new_key, settings.get("api_keys", [])):
                 self.status_label.config(
                     text="API key saved successfully!", fg="#4CAF50")
                 # Hide the API key warning frame if it's visible
@@ -1254,7 +1611,7 @@ class SettingsTab(TabBase):
             settings = load_settings()
             settings["api_key"] = ""
             if save_settings(settings):
-                self.gemini_client.update_api_key("")
+                self.gemini_client.update_api_key("", settings.get("api_keys", []))
                 self.status_label.config(text="API key cleared.", fg="#4CAF50")
             else:
                 self.status_label.config(
@@ -1451,6 +1808,9 @@ class SettingsTab(TabBase):
         # Update folder entry state
         self._toggle_folder_entry()
 
+        # Update token usage
+        self._update_usage_summary()
+
 
 class CoverLetterGeneratorApp:
     """Main application class"""
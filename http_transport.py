@@ -0,0 +1,90 @@
+import threading
+import importlib.util
+import httpx
+from config import (HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED,
+                    HTTP_TIMEOUT)
+
+
+class ConnectionMetrics:
+    """Counts the HTTP requests of the genai clients and the new connections and TLS handshakes they needed"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(ConnectionMetrics, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the counters"""
+        if not self._initialized:
+            self._lock = threading.Lock()
+            self.stats = {"requests": 0, "connections": 0, "tls_handshakes": 0}
+            self._initialized = True
+
+    def _on_trace(self, event, info):
+        """Count an httpcore trace event of a request"""
+        if event == "connection.connect_tcp.complete":
+            stat = "connections"
+        elif event == "connection.start_tls.complete":
+            stat = "tls_handshakes"
+        elif event.endswith(".send_request_headers.started"):  # http11 or http2
+            stat = "requests"
+        else:
+            return
+        with self._lock:
+            self.stats[stat] += 1
+
+    async def _on_trace_async(self, event, info):
+        """Count an httpcore trace event of a request on the async client"""
+        self._on_trace(event, info)
+
+    def on_request(self, request):
+        """httpx request hook asking the transport to report how the request was sent"""
+        request.extensions["trace"] = self._on_trace
+
+    async def on_request_async(self, request):
+        """httpx request hook of the async client"""
+        request.extensions["trace"] = self._on_trace_async
+
+    def get_stats(self):
+        """Get the request, connection and TLS handshake counts and the share of requests on a reused connection"""
+        with self._lock:
+            stats = dict(self.stats)
+        requests = stats["requests"]
+        stats["reuse_rate"] = round(1 - stats["connections"] / requests, 3) if requests else None
+        return stats
+
+
+def _use_http2():
+    """Check whether HTTP/2 is enabled and the h2 package it needs is installed"""
+    if HTTP2_ENABLED and importlib.util.find_spec("h2") is None:
+        print("HTTP/2 needs the h2 package (pip install \"httpx[http2]\"), using HTTP/1.1")
+        return False
+    return bool(HTTP2_ENABLED)
+
+
+def get_http_options():
+    """
+    Get the genai HTTP options of one API key's client
+
+    The sync and async clients of a key get the same connection limits, keep-alive and
+    protocol, and report to the shared ConnectionMetrics.
+
+    Returns:
+        Dictionary for genai.Client(http_options=...)
+    """
+    metrics = ConnectionMetrics()
+    http2 = _use_http2()
+    limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                          max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                          keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+    return {
+        # Milliseconds, applies to connecting and to each read and write of a request
+        "timeout": int(HTTP_TIMEOUT * 1000) if HTTP_TIMEOUT else None,
+        "client_args": {"limits": limits, "http2": http2, "event_hooks": {"request": [metrics.on_request]}},
+        "async_client_args": {"limits": limits, "http2": http2,
+                              "event_hooks": {"request": [metrics.on_request_async]}},
+    }
@@ -0,0 +1,426 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from config import (CACHE_DIR, JOB_QUEUE_WORKERS, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, JOB_HEARTBEAT_INTERVAL,
+                    JOB_STALE_AFTER)
+from profile_manager import ProfileManager
+
+JOB_COLUMNS = ("id", "job_description", "profile_name", "model", "resume_path", "force_regenerate",
+               "status", "attempts", "cover_letter", "error", "created", "updated", "not_before", "priority")
+# Priority of generations a user is watching, claimed before background jobs and by a reserved worker
+INTERACTIVE_PRIORITY = 1
+
+
+class JobQueue:
+    """
+    Persists pending cover letter generations in SQLite so they survive crashes and restarts
+
+    Several app instances may share the queue. Each claims jobs under its own owner id and keeps
+    a heartbeat on them, so only jobs of a process that exited are taken over. Jobs a process
+    watches are reserved for it from the start, as only that process receives their text.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(JobQueue, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Open the job database"""
+        if not self._initialized:
+            self._lock = threading.Lock()
+            # Identifies the jobs this process is running
+            self.owner = uuid.uuid4().hex
+            self._conn = self._connect()
+            self._initialized = True
+
+    def _get_db_filepath(self):
+        """Get the file path of the job database"""
+        return os.path.join(CACHE_DIR, "job_queue.db")
+
+    def _connect(self):
+        """Open the database in WAL mode and create the schema"""
+        conn = sqlite3.connect(self._get_db_filepath(),
+                               check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_description TEXT NOT NULL,
+                profile_name TEXT NOT NULL,
+                model TEXT NOT NULL,
+                resume_path TEXT,
+                force_regenerate INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                cover_letter TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                not_before REAL NOT NULL DEFAULT 0,
+                priority INTEGER NOT NULL DEFAULT 0,
+                owner TEXT
+            )""")
+        # Databases created before a column was added
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "priority" not in columns:
+            conn.execute(
+                "ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before, id)")
+        return conn
+
+    @staticmethod
+    def _to_job(row):
+        """Convert a database row to a job dictionary"""
+        if row is None:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+        job["force_regenerate"] = bool(job["force_regenerate"])
+        return job
+
+    def enqueue(self, job_description, profile_name, model, resume_path=None, force_regenerate=False, priority=0,
+                reserved=False):
+        """
+        Add a generation to the queue
+
+        Args:
+            job_description: The job description text
+            profile_name: Profile to generate the letter for
+            model: Model to generate with
+            resume_path: Optional path to a resume PDF file
+            force_regenerate: Generate a new letter even if one is cached for these inputs
+            priority: Jobs with a higher priority are claimed first, e.g. INTERACTIVE_PRIORITY
+            reserved: Let only this process claim the job until it exits, for jobs it watches
+
+        Returns:
+            The id of the new job
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """INSERT INTO jobs (job_description, profile_name, model, resume_path, force_regenerate, created, updated,
+                                    priority, owner)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (job_description, profile_name, model, resume_path, int(force_regenerate), now, now, priority,
+                 self.owner if reserved else None))
+            return cursor.lastrowid
+
+    def claim_next(self, min_priority=0):
+        """Mark the most urgent claimable job that is due and has at least a given priority as running and return it, or None"""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes never claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"""SELECT {', '.join(JOB_COLUMNS)} FROM jobs
+                        WHERE status = 'pending' AND not_before <= ? AND priority >= ? AND (owner IS NULL OR owner = ?)
+                        ORDER BY priority DESC, id LIMIT 1""",
+                    (now, min_priority, self.owner)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        """UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ?, owner = ?
+                           WHERE id = ?""",
+                        (now, self.owner, row[0]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._to_job(row)
+        if job is not None:
+            job["status"] = "running"
+            job["attempts"] += 1
+        return job
+
+    def complete(self, job_id, cover_letter):
+        """Store the letter of a job and mark it done in one transaction"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', cover_letter = ?, error = NULL, updated = ? WHERE id = ?",
+                (cover_letter, time.time(), job_id))
+
+    def fail(self, job_id, error, retryable=True, reserved=False):
+        """
+        Record a failed attempt, scheduling a retry while attempts remain
+
+        Args:
+            job_id: The id of the job
+            error: Error message shown for the job
+            retryable: False for errors another attempt cannot fix
+            reserved: Keep a retry for this process, which watches the job
+
+        Returns:
+            True if the job will be retried
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            attempts = row[0]
+            retry = retryable and attempts < JOB_MAX_ATTEMPTS
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated = ?, not_before = ?, owner = ? WHERE id = ?",
+                ("pending" if retry else "failed", error, now,
+                 now + JOB_RETRY_DELAY * 2 ** (attempts - 1) if retry else 0,
+                 self.owner if retry and reserved else None, job_id))
+        return retry
+
+    def heartbeat(self):
+        """Mark the jobs this process is running or has reserved as still alive"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET updated = ? WHERE status IN ('pending', 'running') AND owner = ?",
+                (time.time(), self.owner))
+
+    def recover(self):
+        """Return jobs left running or reserved by a process that exited to the queue, returning how many"""
+        now = time.time()
+        with self._lock:
+            # Jobs of live processes keep getting heartbeats
+            cursor = self._conn.execute(
+                """UPDATE jobs SET status = 'pending', not_before = CASE WHEN status = 'running' THEN 0 ELSE not_before END,
+                                  owner = NULL, updated = ?
+                   WHERE status IN ('pending', 'running') AND owner IS NOT NULL AND owner != ? AND updated < ?""",
+                (now, self.owner, now - JOB_STALE_AFTER))
+            released = cursor.rowcount
+            # Running jobs of databases created before owners were recorded
+            cursor = self._conn.execute(
+                """UPDATE jobs SET status = 'pending', not_before = 0, updated = ?
+                   WHERE status = 'running' AND owner IS NULL AND updated < ?""",
+                (now, now - JOB_STALE_AFTER))
+            return released + cursor.rowcount
+
+    def retry(self, job_id):
+        """Queue a failed job again with fresh attempts"""
+        with self._lock:
+            self._conn.execute(
+                """UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0, owner = NULL, updated = ?
+                   WHERE id = ? AND status = 'failed'""",
+                (time.time(), job_id))
+
+    def delete(self, job_id):
+        """Remove a job that is not running"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE id = ? AND status != 'running'", (job_id,))
+
+    def clear_finished(self):
+        """Remove all done and failed jobs"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed')")
+
+    def get_job(self, job_id):
+        """Get a job by id, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def list_jobs(self, limit=200):
+        """Get the most recent jobs, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def get_counts(self):
+        """Get the number of jobs per status"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def get_next_due_time(self, min_priority=0):
+        """Get when the next job claim_next() may return becomes due, or None if there is none"""
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT MIN(not_before) FROM jobs
+                   WHERE status = 'pending' AND priority >= ? AND (owner IS NULL OR owner = ?)""",
+                (min_priority, self.owner)).fetchone()
+        return row[0]
+
+
+class JobRunner:
+    """
+    Runs queued jobs on a bounded pool of worker threads around a GeminiClient
+
+    One more worker only runs interactive jobs, so a generation the user is watching
+    starts at once even while every other worker is busy with background jobs.
+    """
+
+    def __init__(self, gemini_client, job_queue=None, workers=JOB_QUEUE_WORKERS):
+        """Initialize the runner, start() launches the workers"""
+        self.gemini_client = gemini_client
+        self.job_queue = job_queue or JobQueue()
+        self.profile_manager = ProfileManager()
+        self.workers = max(1, workers)
+        self._wakeup = threading.Condition()
+        self._listeners = {}  # Job id -> {"on_text": callable, "on_finish": callable, "parent_span": Span}
+        self._listeners_lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+
+    def start(self):
+        """Resume jobs interrupted by the previous run and start the workers"""
+        if self._threads:
+            return
+        self._recover()
+        heartbeat = threading.Thread(
+            target=self._keep_alive, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        for index in range(self.workers + 1):
+            interactive = index == self.workers
+            thread = threading.Thread(
+                target=self._work, args=(INTERACTIVE_PRIORITY if interactive else 0,),
+                name="job-worker-interactive" if interactive else f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop taking new jobs, running ones are resumed at the next start if the process exits"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def submit(self, job_description, profile_name, model, resume_path=None, force_regenerate=False,
+               on_text=None, on_finish=None, parent_span=None, priority=0):
+        """
+        Queue a generation and wake a worker
+
+        Args:
+            on_text: Optional callback receiving each streamed piece of the letter, on a worker thread
+            on_finish: Optional callback receiving the finished job dictionary, on a worker thread
+            parent_span: Optional span the job's spans nest under, e.g. the click that submitted it
+            priority: INTERACTIVE_PRIORITY for a generation the user is waiting for, 0 for background jobs
+
+        Returns:
+            The id of the new job
+        """
+        # Only this process can report text and completion to the callbacks
+        job_id = self.job_queue.enqueue(
+            job_description, profile_name, model, resume_path, force_regenerate, priority,
+            reserved=bool(on_text or on_finish))
+        if on_text or on_finish or parent_span:
+            with self._listeners_lock:
+                self._listeners[job_id] = {
+                    "on_text": on_text, "on_finish": on_finish, "parent_span": parent_span}
+        self.notify()
+        return job_id
+
+    def _recover(self):
+        """Queue the jobs of exited processes again, returning True if there were any"""
+        try:
+            recovered = self.job_queue.recover()
+        except Exception as e:
+            print(f"Error recovering generation jobs: {str(e)}")
+            return False
+        if recovered:
+            print(f"Resuming {recovered} interrupted generation jobs")
+        return bool(recovered)
+
+    def _keep_alive(self):
+        """Heartbeat loop: keep this process's running jobs alive and take over those of exited processes"""
+        while True:
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(JOB_HEARTBEAT_INTERVAL)
+                if self._stopping:
+                    return
+            try:
+                self.job_queue.heartbeat()
+            except Exception as e:
+                print(f"Error updating generation job heartbeat: {str(e)}")
+            if self._recover():
+                self.notify()
+
+    def notify(self):
+        """Wake the workers, e.g. after a job was retried"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _wait_for_work(self, min_priority=0):
+        """Sleep until a job is submitted or the next retry a worker of a given priority may claim is due"""
+        with self._wakeup:  # Held while checking, so a submit in between still wakes the worker
+            if self._stopping:
+                return
+            next_due = self.job_queue.get_next_due_time(min_priority)
+            timeout = None if next_due is None else max(0.0, next_due - time.time())
+            self._wakeup.wait(timeout if timeout is not None else 60)
+
+    def _work(self, min_priority=0):
+        """Worker loop: claim a job of at least a given priority, run it, repeat"""
+        while not self._stopping:
+            try:
+                job = self.job_queue.claim_next(min_priority)
+            except Exception as e:
+                print(f"Error claiming generation job: {str(e)}")
+                job = None
+            if job is None:
+                self._wait_for_work(min_priority)
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job):
+        """Generate the letter of one job and commit it"""
+        with self._listeners_lock:
+            listener = self._listeners.get(job["id"], {})
+        on_text = listener.get("on_text")
+
+        profile_data = self.profile_manager.load_profile(job["profile_name"])
+        if profile_data is None:
+            retry = self.job_queue.fail(
+                job["id"], f"Profile {job['profile_name']} no longer exists", retryable=False)
+        else:
+            retry = self._generate(job, profile_data, on_text, listener.get("parent_span"))
+
+        # Unwatched jobs report once they are finished, watched ones are never retried
+        if retry:
+            return
+        with self._listeners_lock:
+            listener = self._listeners.pop(job["id"], {})
+        on_finish = listener.get("on_finish")
+        if on_finish:
+            try:
+                on_finish(self.job_queue.get_job(job["id"]))
+            except Exception as e:
+                print(f"Error reporting generation job {job['id']}: {str(e)}")
+
+    def _generate(self, job, profile_data, on_text, parent_span=None):
+        """Stream the letter of a job and commit it, returning True if a failed job will be retried"""
+        try:
+            with self.gemini_client.tracer.span("job.run", parent=parent_span, job_id=job["id"],
+                                                attempt=job["attempts"]):
+                pieces = []
+                for text in self.gemini_client.stream_cover_letter(
+                        job["job_description"], profile_data["personal_context"], profile_data["system_template"],
+                        job["resume_path"], job["force_regenerate"],
+                        profile_name=job["profile_name"], model=job["model"]):
+                    pieces.append(text)
+                    if on_text:
+                        on_text(text)
+                cover_letter = "".join(pieces)
+                if not cover_letter.strip():
+                    raise RuntimeError("The model returned an empty cover letter")
+            self.job_queue.complete(job["id"], cover_letter)
+            return False
+        except Exception as e:
+            print(f"Error running generation job {job['id']}: {str(e)}")
+            # A retry of a watched job would regenerate the letter out of the user's sight,
+            # so it fails for good and can be retried from the Job Queue window
+            with self._listeners_lock:
+                watched = bool(self._listeners.get(job["id"], {}).get("on_finish"))
+            return self.job_queue.fail(job["id"], str(e), retryable=on_text is None, reserved=watched)
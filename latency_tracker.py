@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from config import (CACHE_DIR, HEDGE_PERCENTILE, HEDGE_DEFAULT_DEADLINE, HEDGE_MIN_DEADLINE,
+                    HEDGE_MAX_DEADLINE, HEDGE_MIN_SAMPLES, HEDGE_LATENCY_PERSIST_INTERVAL)
+
+# Most recent first-chunk latencies kept per model
+LATENCY_WINDOW = 200
+
+
+class FirstChunkLatencyTracker:
+    """Learns per-model first-chunk latency percentiles that set the hedging deadline"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(FirstChunkLatencyTracker, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the latency tracker"""
+        if not self._initialized:
+            self.samples = {}  # Model -> deque of first-chunk latencies in seconds
+            self._lock = threading.Lock()
+            self._last_persist = time.time()
+            self._dirty = False  # Latencies recorded since the file was saved
+            self._load_samples()
+            atexit.register(self.flush)
+            self._initialized = True
+
+    def _get_samples_filepath(self):
+        """Get the file path of the persisted latencies"""
+        return os.path.join(CACHE_DIR, "first_chunk_latency.json")
+
+    def _load_samples(self):
+        """Load latencies observed in earlier runs"""
+        samples_file = self._get_samples_filepath()
+        try:
+            if os.path.exists(samples_file):
+                with open(samples_file, 'r') as f:
+                    self.samples = {model: deque(values, maxlen=LATENCY_WINDOW)
+                                    for model, values in json.load(f).items()}
+        except Exception as e:
+            # If there's any issue, learn from scratch
+            print(f"Error loading first chunk latencies: {str(e)}")
+            self.samples = {}
+
+    def _persist_samples(self):
+        """Save the latencies to disk, called with the lock held"""
+        samples_file = self._get_samples_filepath()
+        try:
+            with open(samples_file + ".tmp", 'w') as f:
+                json.dump({model: [round(value, 4) for value in values]
+                           for model, values in self.samples.items()}, f)
+            os.replace(samples_file + ".tmp", samples_file)
+            self._last_persist = time.time()
+            self._dirty = False
+        except Exception as e:
+            print(f"Error persisting first chunk latencies: {str(e)}")
+
+    def flush(self):
+        """Save latencies that requests have not written yet"""
+        with self._lock:
+            if self._dirty:
+                self._persist_samples()
+
+    def record(self, model, seconds):
+        """Record the first-chunk latency of a request"""
+        with self._lock:
+            self.samples.setdefault(model, deque(
+                maxlen=LATENCY_WINDOW)).append(seconds)
+            # Saved in batches, as losing a few samples only delays learning the deadline
+            if time.time() - self._last_persist >= HEDGE_LATENCY_PERSIST_INTERVAL:
+                self._persist_samples()
+            else:
+                self._dirty = True
+
+    def get_percentile(self, model, fraction):
+        """Get a percentile of the recent first-chunk latencies of a model, or None without samples"""
+        with self._lock:
+            values = sorted(self.samples.get(model, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    def get_deadline(self, model):
+        """Get the seconds to wait for a first chunk before hedging a request to a model"""
+        with self._lock:
+            sample_count = len(self.samples.get(model, ()))
+        if sample_count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DEADLINE
+        deadline = self.get_percentile(model, HEDGE_PERCENTILE)
+        return min(HEDGE_MAX_DEADLINE, max(HEDGE_MIN_DEADLINE, deadline))
+
+    def get_stats(self):
+        """Get the sample count, p50, p95 and current deadline per model"""
+        with self._lock:
+            models = list(self.samples)
+        return {
+            model: {
+                "samples": len(self.samples[model]),
+                "p50": self.get_percentile(model, 0.5),
+                "p95": self.get_percentile(model, 0.95),
+                "deadline": self.get_deadline(model),
+            }
+            for model in models
+        }
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from config import CACHE_DIR
+
+# MinHash signature length, split into LSH bands of rows.
+# 16 bands of 4 rows make pairs with Jaccard similarity above ~0.5 likely to share a bucket.
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+# Number of consecutive words per shingle
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed so signatures stay comparable across runs
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+
+class NearDuplicateIndex:
+    """Finds earlier job descriptions that are near-duplicates of a new one using MinHash with LSH banding"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(NearDuplicateIndex, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the near-duplicate index"""
+        if not self._initialized:
+            self.entries = {}  # Result key -> {"scope", "signature", "created"}
+            self.buckets = {}  # (scope, band, band rows) -> set of result keys
+            self._lock = threading.Lock()
+            self._load_index()
+            self._initialized = True
+
+    @staticmethod
+    def _shingles(text):
+        """Get the set of hashed word shingles of a text"""
+        words = re.findall(r"\w+", text.casefold())
+        if len(words) < SHINGLE_SIZE:
+            words = words + [""] * (SHINGLE_SIZE - len(words))
+        return {
+            int.from_bytes(hashlib.blake2b(
+                " ".join(words[i:i + SHINGLE_SIZE]).encode(), digest_size=4).digest(), "little")
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        }
+
+    @classmethod
+    def compute_signature(cls, text):
+        """Compute the MinHash signature of a text"""
+        shingles = cls._shingles(text)
+        return [
+            min(((a * shingle + b) % _MERSENNE_PRIME) & _MAX_HASH for shingle in shingles)
+            for a, b in _PERMUTATIONS
+        ]
+
+    @staticmethod
+    def _band_keys(scope, signature):
+        """Get the LSH bucket keys of a signature"""
+        return [(scope, band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]))
+                for band in range(LSH_BANDS)]
+
+    def _get_index_filepath(self):
+        """Get the file path of the append-only index log"""
+        return os.path.join(CACHE_DIR, "near_duplicate_index.jsonl")
+
+    def _load_index(self):
+        """Replay the index log from disk and rebuild the LSH buckets"""
+        index_file = self._get_index_filepath()
+        try:
+            if os.path.exists(index_file):
+                record_count = 0
+                with open(index_file, 'r') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        record_count += 1
+                        record = json.loads(line)
+                        if "remove" in record:
+                            self._remove_entry(record["remove"])
+                        else:
+                            self._add_entry(record["key"], record["scope"],
+                                            record["signature"], record["created"])
+                # Drop superseded and removed records once they dominate the log
+                if record_count > 2 * len(self.entries) + 100:
+                    self._compact_log()
+        except Exception as e:
+            # If there's any issue, start with an empty index
+            print(f"Error loading near-duplicate index: {str(e)}")
+            self.entries = {}
+            self.buckets = {}
+
+    def _compact_log(self):
+        """Rewrite the index log with only the live entries"""
+        index_file = self._get_index_filepath()
+        temp_file = index_file + ".tmp"
+        with open(temp_file, 'w') as f:
+            for result_key, entry in self.entries.items():
+                f.write(json.dumps({"key": result_key, "scope": entry["scope"],
+                                    "signature": entry["signature"], "created": entry["created"]}) + "\n")
+        os.replace(temp_file, index_file)
+
+    def _append_record(self, record):
+        """Append a record to the index log"""
+        try:
+            with open(self._get_index_filepath(), 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            print(f"Error persisting near-duplicate index: {str(e)}")
+
+    def _add_entry(self, result_key, scope, signature, created):
+        """Add an entry to the in-memory index"""
+        self._remove_entry(result_key)
+        self.entries[result_key] = {
+            "scope": scope,
+            "signature": signature,
+            "created": created
+        }
+        for band_key in self._band_keys(scope, signature):
+            self.buckets.setdefault(band_key, set()).add(result_key)
+
+    def _remove_entry(self, result_key):
+        """Remove an entry from the in-memory index"""
+        entry = self.entries.pop(result_key, None)
+        if entry is None:
+            return
+        for band_key in self._band_keys(entry["scope"], entry["signature"]):
+            bucket = self.buckets.get(band_key)
+            if bucket:
+                bucket.discard(result_key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def add(self, scope, result_key, job_description):
+        """Index a job description under the result key of the letter generated for it"""
+        signature = self.compute_signature(job_description)
+        created = time.time()
+        with self._lock:
+            self._add_entry(result_key, scope, signature, created)
+            self._append_record({"key": result_key, "scope": scope,
+                                 "signature": signature, "created": created})
+
+    def remove(self, result_key):
+        """Remove an entry, e.g. when its letter is no longer cached"""
+        with self._lock:
+            if result_key in self.entries:
+                self._remove_entry(result_key)
+                self._append_record({"remove": result_key})
+
+    def find_similar(self, scope, job_description, threshold):
+        """
+        Find indexed job descriptions similar to a new one
+
+        Only entries sharing at least one LSH bucket are compared, so lookups
+        do not scan the whole index.
+
+        Returns:
+            List of (result_key, estimated Jaccard similarity) at or above threshold, most similar first
+        """
+        signature = self.compute_signature(job_description)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(scope, signature):
+                candidates.update(self.buckets.get(band_key, ()))
+
+            matches = []
+            for result_key in candidates:
+                other = self.entries[result_key]["signature"]
+                similarity = sum(
+                    1 for x, y in zip(signature, other) if x == y) / MINHASH_PERMUTATIONS
+                if similarity >= threshold:
+                    matches.append((result_key, similarity))
+
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self.entries = {}
+            self.buckets = {}
+            try:
+                if os.path.exists(self._get_index_filepath()):
+                    os.remove(self._get_index_filepath())
+            except Exception as e:
+                print(f"Error clearing near-duplicate index: {str(e)}")
+        return True
@@ -0,0 +1,314 @@
+import time
+import random
+import threading
+from config import (RATE_LIMIT_ENABLED, RATE_LIMIT_BURST_SECONDS, RATE_LIMIT_MAX_CONCURRENCY, RATE_LIMIT_BASE_BACKOFF,
+                    RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_MAX_RETRIES, RATE_LIMIT_OUTPUT_TOKENS)
+
+# Weight of the latest request in the running average of tokens per request
+TOKEN_AVERAGE_WEIGHT = 0.2
+
+
+def is_rate_limit_error(error):
+    """Check whether an API error means a quota was exceeded (429 RESOURCE_EXHAUSTED)"""
+    return getattr(error, "code", None) == 429 or getattr(error, "status", None) == "RESOURCE_EXHAUSTED"
+
+
+def get_retry_delay(error):
+    """Get the seconds the API asked to wait before retrying, or None"""
+    try:
+        for detail in error.details["error"]["details"]:
+            if detail.get("@type", "").endswith("RetryInfo"):
+                return float(detail["retryDelay"].rstrip("s"))
+    except Exception:
+        pass
+    return None
+
+
+def get_total_tokens(usage_metadata):
+    """Get the total token count of a response's usage metadata, or None"""
+    return getattr(usage_metadata, "total_token_count", None) if usage_metadata is not None else None
+
+
+class _ModelLimit:
+    """Request and token buckets, concurrency limit and backoff of one model"""
+
+    def __init__(self, limits):
+        """Start with full buckets, unlimited rates if limits is None"""
+        limits = limits or {}
+        self.request_rate = limits.get("rpm", 0) / 60.0  # Per second, 0 for unlimited
+        self.token_rate = limits.get("tpm", 0) / 60.0
+        self.request_capacity = max(1.0, self.request_rate * RATE_LIMIT_BURST_SECONDS)
+        self.token_capacity = max(1.0, self.token_rate * RATE_LIMIT_BURST_SECONDS)
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.refilled = time.monotonic()
+
+        self.concurrency = float(RATE_LIMIT_MAX_CONCURRENCY)
+        self.in_flight = 0
+        self.waiting = 0
+        self.blocked_until = 0.0
+        self.consecutive_errors = 0
+        self.last_decrease = 0.0
+        self.tokens_per_request = float(RATE_LIMIT_OUTPUT_TOKENS)
+        self.stats = {"requests": 0, "rate_limited": 0, "tokens": 0, "wait_s": 0.0}
+
+    def _refill(self, now):
+        """Add the requests and tokens that accrued since the last refill"""
+        elapsed = now - self.refilled
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_rate)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_rate)
+        self.refilled = now
+
+    def get_wait(self, now, tokens):
+        """Get the seconds until a request of this many tokens may start, 0 if it may start now"""
+        self._refill(now)
+        wait = self.blocked_until - now
+        if self.request_rate and self.requests < 1:
+            wait = max(wait, (1 - self.requests) / self.request_rate)
+        # Requests larger than a burst wait for a full bucket and leave it in debt
+        needed = min(tokens, self.token_capacity)
+        if self.token_rate and self.tokens < needed:
+            wait = max(wait, (needed - self.tokens) / self.token_rate)
+        return max(0.0, wait)
+
+    def has_slot(self):
+        """Check whether the concurrency limit allows another request"""
+        return self.in_flight < max(1, int(self.concurrency))
+
+
+class _Permit:
+    """One admitted request"""
+
+    def __init__(self, limit, tokens, started):
+        """Remember what the request was charged"""
+        self.limit = limit
+        self.tokens = tokens
+        self.started = started
+
+
+class RateLimiter:
+    """Keeps requests to each model within its quotas, backing off and halving concurrency on quota errors"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(RateLimiter, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize without per-model state, see set_limits_source()"""
+        if not self._initialized:
+            self._limits = {}  # Model -> _ModelLimit
+            self._condition = threading.Condition()
+            self._get_model_limits = lambda model: None
+            self._initialized = True
+
+    def set_limits_source(self, get_model_limits):
+        """
+        Set where model quotas come from and forget the state learned for the previous source
+
+        Args:
+            get_model_limits: Callable taking a model name and returning {"rpm", "tpm"}, or None for no quota
+        """
+        with self._condition:
+            self._get_model_limits = get_model_limits
+            self._limits.clear()
+            self._condition.notify_all()
+
+    def _get_limit(self, model):
+        """Get the state of a model, creating it on first use"""
+        limit = self._limits.get(model)
+        if limit is None:
+            limit = self._limits[model] = _ModelLimit(self._get_model_limits(model))
+        return limit
+
+    def acquire(self, model, estimated_tokens=0):
+        """
+        Wait until a request to a model fits its quotas and concurrency limit
+
+        Args:
+            model: Model the request goes to
+            estimated_tokens: Estimated input tokens of the request, output tokens are added
+
+        Returns:
+            A permit to pass to release()
+        """
+        with self._condition:
+            limit = self._get_limit(model)
+            # Chats resend their history, so the average of earlier requests is often the better estimate
+            tokens = max(estimated_tokens + RATE_LIMIT_OUTPUT_TOKENS, limit.tokens_per_request)
+            started = time.monotonic()
+            limit.waiting += 1
+            try:
+                while True:
+                    if not limit.has_slot():
+                        self._condition.wait()  # Woken when a request finishes
+                        continue
+                    wait = limit.get_wait(time.monotonic(), tokens)
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+            finally:
+                limit.waiting -= 1
+
+            now = time.monotonic()
+            limit.requests -= 1
+            limit.tokens -= tokens
+            limit.in_flight += 1
+            limit.stats["requests"] += 1
+            limit.stats["wait_s"] += now - started
+            return _Permit(limit, tokens, now)
+
+    def release(self, permit, used_tokens=None, error=None, cancelled=False):
+        """
+        Finish a request, adjusting the buckets to its actual usage and the concurrency limit to its outcome
+
+        Args:
+            permit: Permit returned by acquire()
+            used_tokens: Total tokens the response reported, None if unknown
+            error: Exception the request failed with, None if it succeeded
+            cancelled: The request was abandoned before it finished, which says nothing about the quota
+        """
+        with self._condition:
+            limit = permit.limit
+            now = time.monotonic()
+            limit.in_flight -= 1
+            if used_tokens is not None:
+                limit.tokens -= used_tokens - permit.tokens  # Charge the difference to the estimate
+                limit.tokens_per_request += TOKEN_AVERAGE_WEIGHT * \
+                    (used_tokens - limit.tokens_per_request)
+                limit.stats["tokens"] += used_tokens
+
+            if error is not None and is_rate_limit_error(error):
+                limit.stats["rate_limited"] += 1
+                limit.tokens += permit.tokens  # Rejected requests use no tokens
+                limit.requests = min(limit.requests, 0.0)
+                # Requests started before the last decrease saw the old limit, count them as one signal
+                if permit.started >= limit.last_decrease:
+                    limit.concurrency = max(1.0, limit.concurrency / 2)
+                    limit.last_decrease = now
+                limit.consecutive_errors += 1
+                delay = get_retry_delay(error)
+                if delay is None:
+                    delay = min(RATE_LIMIT_MAX_BACKOFF,
+                                RATE_LIMIT_BASE_BACKOFF * 2 ** (limit.consecutive_errors - 1))
+                    delay *= 0.5 + random.random() / 2  # Jitter so waiting requests do not return together
+                limit.blocked_until = max(limit.blocked_until, now + delay)
+            elif error is None and not cancelled:
+                limit.consecutive_errors = 0
+                # About one more request in flight per window of successful requests
+                limit.concurrency = min(float(RATE_LIMIT_MAX_CONCURRENCY),
+                                        limit.concurrency + 1 / limit.concurrency)
+            self._condition.notify_all()
+
+    def call(self, model, function, estimated_tokens=0):
+        """
+        Make one request to a model within its limits, retrying it after quota errors
+
+        Args:
+            model: Model the request goes to
+            function: Callable without arguments making the request and returning a response
+            estimated_tokens: Estimated input tokens of the request
+
+        Returns:
+            The response
+        """
+        if not RATE_LIMIT_ENABLED:
+            return function()
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            permit = self.acquire(model, estimated_tokens)
+            try:
+                response = function()
+            except Exception as e:
+                self.release(permit, error=e)
+                if not is_rate_limit_error(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                print(f"Quota of {model} exceeded, retrying: {str(e)}")
+                continue
+            self.release(permit, get_total_tokens(response.usage_metadata))
+            return response
+
+    def stream(self, model, start_stream, estimated_tokens=0, on_start=None):
+        """
+        Make one streamed request to a model within its limits, retrying it after quota errors before the first chunk
+
+        Args:
+            model: Model the request goes to
+            start_stream: Callable without arguments returning an iterator of response chunks
+            estimated_tokens: Estimated input tokens of the request
+            on_start: Optional callable run each time the request is sent, after any wait for quota
+
+        Yields:
+            The response chunks
+        """
+        if not RATE_LIMIT_ENABLED:
+            if on_start:
+                on_start()
+            yield from start_stream()
+            return
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            permit = self.acquire(model, estimated_tokens)
+            if on_start:
+                on_start()
+            usage_metadata, error, delivered, cancelled = None, None, False, False
+            try:
+                for chunk in start_stream():
+                    # Counts are cumulative, the last chunk reporting usage has the totals
+                    usage_metadata = chunk.usage_metadata or usage_metadata
+                    delivered = True
+                    yield chunk
+                return
+            except GeneratorExit:
+                cancelled = True  # The consumer stopped reading, e.g. a hedge that lost the race
+                raise
+            except Exception as e:
+                error = e
+                if delivered or not is_rate_limit_error(e) or attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                print(f"Quota of {model} exceeded, retrying: {str(e)}")
+            finally:
+                # Also runs when the consumer abandons the stream, e.g. a cancelled hedge
+                self.release(permit, get_total_tokens(usage_metadata), error, cancelled)
+
+    def is_throttled(self, model):
+        """Check whether a new request to a model would have to wait"""
+        with self._condition:
+            limit = self._get_limit(model)
+            return bool(limit.waiting) or not limit.has_slot() or \
+                limit.get_wait(time.monotonic(), limit.tokens_per_request) > 0
+
+    def get_headroom(self, model):
+        """Get the fraction (0-1) of a model's burst and concurrency left for new requests, 0 while it backs off"""
+        with self._condition:
+            limit = self._get_limit(model)
+            now = time.monotonic()
+            limit.get_wait(now, 0)  # Refill the buckets
+            if limit.blocked_until > now:
+                return 0.0
+            fractions = [1 - limit.in_flight / max(1, int(limit.concurrency))]
+            if limit.request_rate:
+                fractions.append(limit.requests / limit.request_capacity)
+            if limit.token_rate:
+                fractions.append(limit.tokens / limit.token_capacity)
+            return max(0.0, min(fractions))
+
+    def get_stats(self):
+        """Get the quotas, concurrency limit and request counts per model"""
+        with self._condition:
+            now = time.monotonic()
+            return {
+                model: dict(
+                    limit.stats,
+                    wait_s=round(limit.stats["wait_s"], 2),
+                    rpm=round(limit.request_rate * 60) or None,
+                    tpm=round(limit.token_rate * 60) or None,
+                    concurrency=round(limit.concurrency, 2),
+                    in_flight=limit.in_flight,
+                    waiting=limit.waiting,
+                    backoff_s=round(max(0.0, limit.blocked_until - now), 1),
+                )
+                for model, limit in self._limits.items()
+            }
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from config import CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TOUCH_INTERVAL
+
+
+class ResultCache:
+    """Stores generated cover letters on disk, evicting the least recently used ones above a size cap"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(ResultCache, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the result cache"""
+        if not self._initialized:
+            self.results_dir = os.path.join(CACHE_DIR, "results")
+            if not os.path.exists(self.results_dir):
+                os.makedirs(self.results_dir)
+            self.max_bytes = RESULT_CACHE_MAX_BYTES
+            self.index = {}  # Result key -> {"size", "created", "last_used"}
+            self._lock = threading.Lock()
+            self._last_persist = 0.0
+            self._dirty = False  # Last-used times changed since the index was saved
+            self._load_index()
+            atexit.register(self.flush)
+            self._initialized = True
+
+    @staticmethod
+    def normalize_job_description(job_description):
+        """Normalize whitespace and case so trivially different pastes share a key"""
+        return " ".join(job_description.split()).casefold()
+
+    def get_result_key(self, profile_hash, model, system_core_rules, job_description):
+        """Generate the cache key for a generation request"""
+        job_hash = hashlib.md5(
+            self.normalize_job_description(job_description).encode()).hexdigest()
+        rules_hash = hashlib.md5(system_core_rules.encode()).hexdigest()
+        content = f"{profile_hash}|{model}|{rules_hash}|{job_hash}"
+        return hashlib.md5(content.encode()).hexdigest()
+
+    def _get_index_filepath(self):
+        """Get the file path of the persisted index"""
+        return os.path.join(self.results_dir, "index.json")
+
+    def _get_letter_filepath(self, result_key):
+        """Get the file path a cover letter is stored at"""
+        return os.path.join(self.results_dir, f"{result_key}.txt")
+
+    def _load_index(self):
+        """Load the index from disk, dropping entries whose letter file is gone"""
+        index_file = self._get_index_filepath()
+        try:
+            if os.path.exists(index_file):
+                with open(index_file, 'r') as f:
+                    self.index = json.load(f)
+                self.index = {
+                    k: v for k, v in self.index.items()
+                    if os.path.exists(self._get_letter_filepath(k))
+                }
+        except Exception as e:
+            # If there's any issue, start with an empty index
+            print(f"Error loading result cache index: {str(e)}")
+            self.index = {}
+
+    def _persist_index(self):
+        """Save the index to disk, replacing the previous file only once the new one is complete"""
+        index_file = self._get_index_filepath()
+        try:
+            with open(index_file + ".tmp", 'w') as f:
+                json.dump(self.index, f)
+            os.replace(index_file + ".tmp", index_file)
+            self._last_persist = time.time()
+            self._dirty = False
+        except Exception as e:
+            print(f"Error persisting result cache index: {str(e)}")
+
+    def flush(self):
+        """Save last-used times that cache hits have not written yet"""
+        with self._lock:
+            if self._dirty:
+                self._persist_index()
+
+    def get_letter(self, result_key):
+        """Get a cached cover letter and mark it as recently used"""
+        with self._lock:
+            if result_key not in self.index:
+                return None
+            try:
+                with open(self._get_letter_filepath(result_key), 'r', encoding='utf-8') as f:
+                    letter = f.read()
+            except Exception as e:
+                print(f"Error reading cached cover letter: {str(e)}")
+                del self.index[result_key]
+                self._persist_index()
+                return None
+
+            now = time.time()
+            self.index[result_key]["last_used"] = now
+            # Hits only reorder evictions, so their times are saved in batches
+            if now - self._last_persist >= RESULT_CACHE_TOUCH_INTERVAL:
+                self._persist_index()
+            else:
+                self._dirty = True
+            return letter
+
+    def save_letter(self, result_key, letter):
+        """Store a cover letter and evict the least recently used ones above the size cap"""
+        with self._lock:
+            filepath = self._get_letter_filepath(result_key)
+            temp_filepath = filepath + ".tmp"
+            try:
+                with open(temp_filepath, 'w', encoding='utf-8') as f:
+                    f.write(letter)
+                os.replace(temp_filepath, filepath)  # Never leave a half-written letter
+            except Exception as e:
+                print(f"Error saving cover letter to cache: {str(e)}")
+                return False
+
+            now = time.time()
+            self.index[result_key] = {
+                "size": os.path.getsize(filepath),
+                "created": now,
+                "last_used": now
+            }
+            self._evict()
+            self._persist_index()
+            return True
+
+    def _evict(self):
+        """Remove least recently used letters until the cache fits its size cap"""
+        total_size = sum(entry["size"] for entry in self.index.values())
+        by_last_use = sorted(self.index.items(),
+                             key=lambda item: item[1]["last_used"])
+        for result_key, entry in by_last_use:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(self._get_letter_filepath(result_key))
+            except OSError:
+                pass
+            del self.index[result_key]
+            total_size -= entry["size"]
+
+    def clear(self):
+        """Delete all cached cover letters"""
+        with self._lock:
+            for result_key in list(self.index):
+                try:
+                    os.remove(self._get_letter_filepath(result_key))
+                except OSError:
+                    pass
+            self.index = {}
+            self._persist_index()
+        return True
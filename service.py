@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Cover Letter Generator Service
+------------------------------
+A small HTTP service that lets several people share one generation box.
+
+Endpoints:
+    POST /generate  {"job_description": "...", "force_regenerate": false, "stream": true}
+                    Streams the letter as chunked text/plain (or returns JSON with "stream": false)
+    POST /batch     {"job_descriptions": ["...", ...], "force_regenerate": false}
+                    Streams one JSON line per letter as each one finishes
+    GET  /status    Queue depth, worker usage and shared cache statistics
+
+All requests use the profile and model the service was started with, so chat
+sessions, context caches, uploads and cached letters are shared between them.
+Requests wait in a bounded queue and get 503 when it is full.
+
+Run with: python service.py --profile Default --port 8765
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 64
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 1024 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    """Error that is reported to the client with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class GenerationJob:
+    """One queued cover letter generation and the events it produces"""
+
+    def __init__(self, job_description, force_regenerate=False):
+        """Initialize the job"""
+        self.job_description = job_description
+        self.force_regenerate = force_regenerate
+        # ("delta", text), then ("done", None) or ("error", message)
+        self.events = asyncio.Queue()
+
+
+class GenerationService:
+    """Serves cover letter generation over HTTP with a bounded request queue and a worker pool"""
+
+    def __init__(self, gemini_client, profile_manager, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        """Initialize the service around a GeminiClient and ProfileManager"""
+        self.gemini_client = gemini_client
+        self.profile_manager = profile_manager
+        self.workers = max(1, workers)
+        self.queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="cover-letter-service")
+        self.busy_workers = 0
+        self.completed = 0
+        self.failed = 0
+        self._worker_tasks = []
+        self._server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start the workers and the HTTP server, returning the bound (host, port)"""
+        self._worker_tasks = [asyncio.ensure_future(self._worker())
+                              for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Start the service and serve until cancelled"""
+        bound_host, bound_port = await self.start(host, port)
+        print(f"Cover letter service listening on http://{bound_host}:{bound_port}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop accepting requests and shut the workers down"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._worker_tasks:
+            task.cancel()
+        self.executor.shutdown(wait=False)
+
+    # Queue and workers
+
+    def _enqueue(self, job_descriptions, force_regenerate):
+        """Queue jobs for the given descriptions, or raise 503 if they do not all fit"""
+        if self.queue.maxsize - self.queue.qsize() < len(job_descriptions):
+            raise HttpError(503, "Generation queue is full, try again later")
+        jobs = [GenerationJob(text, force_regenerate)
+                for text in job_descriptions]
+        for job in jobs:
+            self.queue.put_nowait(job)
+        return jobs
+
+    async def _worker(self):
+        """Take jobs off the queue and run them on the thread pool"""
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            self.busy_workers += 1
+            try:
+                await loop.run_in_executor(self.executor, self._run_job, job, loop)
+            finally:
+                self.busy_workers -= 1
+                self.queue.task_done()
+
+    def _run_job(self, job, loop):
+        """Generate a letter on a worker thread, forwarding deltas to the event loop"""
+        def emit(kind, value):
+            loop.call_soon_threadsafe(job.events.put_nowait, (kind, value))
+
+        try:
+            for text in self.gemini_client.stream_cover_letter(
+                    job.job_description,
+                    self.profile_manager.current_personal_context,
+                    self.profile_manager.current_system_template,
+                    self._get_resume_path(),
+                    force_regenerate=job.force_regenerate):
+                emit("delta", text)
+            self.completed += 1
+            emit("done", None)
+        except Exception as e:
+            print(f"Error generating cover letter in service: {str(e)}")
+            self.failed += 1
+            emit("error", str(e))
+
+    def _get_resume_path(self):
+        """Get the profile resume if it exists"""
+        resume_path = self.profile_manager.current_resume_path
+        if resume_path and os.path.exists(resume_path):
+            return resume_path
+        return None
+
+    async def _collect(self, job):
+        """Wait for a job to finish and return its full letter"""
+        pieces = []
+        while True:
+            kind, value = await job.events.get()
+            if kind == "delta":
+                pieces.append(value)
+            elif kind == "done":
+                return "".join(pieces)
+            else:
+                raise HttpError(500, value)
+
+    # HTTP handling
+
+    async def _handle_connection(self, reader, writer):
+        """Serve one HTTP request and close the connection"""
+        try:
+            method, path, body = await self._read_request(reader)
+            await self._route(method, path, body, writer)
+        except HttpError as e:
+            await self._send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        except Exception as e:
+            print(f"Error handling service request: {str(e)}")
+            try:
+                await self._send_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Read the request line, headers and body"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HttpError(413, "Request headers too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], body
+
+    async def _route(self, method, path, body, writer):
+        """Dispatch a request to its endpoint"""
+        routes = {
+            "/generate": ("POST", self._handle_generate),
+            "/batch": ("POST", self._handle_batch),
+            "/status": ("GET", self._handle_status),
+        }
+        if path not in routes:
+            raise HttpError(404, f"Unknown endpoint: {path}")
+        expected_method, handler = routes[path]
+        if method != expected_method:
+            raise HttpError(405, f"{path} expects {expected_method}")
+        await handler(self._parse_json(body) if expected_method == "POST" else None, writer)
+
+    @staticmethod
+    def _parse_json(body):
+        """Parse a JSON object request body"""
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return payload
+
+    async def _handle_generate(self, payload, writer):
+        """Generate one letter, streaming it as it is produced"""
+        job_description = payload.get("job_description")
+        if not isinstance(job_description, str) or not job_description.strip():
+            raise HttpError(400, "job_description is required")
+        job, = self._enqueue(
+            [job_description], bool(payload.get("force_regenerate")))
+
+        if not payload.get("stream", True):
+            await self._send_json(writer, 200, {"cover_letter": await self._collect(job)})
+            return
+
+        # Report failures that happen before any text as a proper error status
+        kind, value = await job.events.get()
+        if kind == "error":
+            raise HttpError(500, value)
+
+        await self._start_chunked(writer, "text/plain; charset=utf-8")
+        while kind == "delta":
+            await self._write_chunk(writer, value.encode("utf-8"))
+            kind, value = await job.events.get()
+        if kind == "error":
+            await self._write_chunk(writer, f"\n[error: {value}]".encode("utf-8"))
+        await self._end_chunked(writer)
+
+    async def _handle_batch(self, payload, writer):
+        """Generate many letters, streaming a JSON line for each as it finishes"""
+        job_descriptions = payload.get("job_descriptions")
+        if not isinstance(job_descriptions, list) or not job_descriptions or \
+                not all(isinstance(text, str) and text.strip() for text in job_descriptions):
+            raise HttpError(
+                400, "job_descriptions must be a non-empty list of strings")
+        jobs = self._enqueue(
+            job_descriptions, bool(payload.get("force_regenerate")))
+
+        async def collect(index, job):
+            try:
+                return {"index": index, "cover_letter": await self._collect(job)}
+            except HttpError as e:
+                return {"index": index, "error": e.message}
+
+        await self._start_chunked(writer, "application/x-ndjson")
+        for result in asyncio.as_completed([collect(i, job) for i, job in enumerate(jobs)]):
+            line = json.dumps(await result) + "\n"
+            await self._write_chunk(writer, line.encode("utf-8"))
+        await self._end_chunked(writer)
+
+    async def _handle_status(self, payload, writer):
+        """Report queue, worker and shared cache state"""
+        await self._send_json(writer, 200, self.get_status())
+
+    def get_status(self):
+        """Get queue, worker and shared cache statistics"""
+        return {
+            "profile": self.profile_manager.current_profile_name,
+            "model": self.gemini_client.model,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "primed_sessions": len(self.gemini_client.chat_sessions),
+            "cached_letters": len(self.gemini_client.result_cache.index),
+            "hash_cache": self.gemini_client.get_hash_cache_stats(),
+            "session_init": self.gemini_client.session_flights.get_stats(),
+            "context_pruning": self.gemini_client.get_context_pruning_stats(),
+            "skill_index": self.gemini_client.skill_index.get_stats(),
+            "rate_limits": self.gemini_client.get_rate_limit_stats(),
+            "api_keys": self.gemini_client.get_api_key_stats(),
+            "connections": self.gemini_client.get_connection_stats(),
+            "active_context_caches": len(self.gemini_client.cache_manager.get_active_caches_info()),
+            "stage_timings_ms": self.gemini_client.tracer.get_summary(),
+            "first_chunk_latency": self.gemini_client.latency_tracker.get_stats(),
+        }
+
+    # Response writing
+
+    @staticmethod
+    async def _send_json(writer, status, payload):
+        """Send a complete JSON response"""
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _start_chunked(writer, content_type):
+        """Send the headers of a streamed response"""
+        writer.write(
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Transfer-Encoding: chunked\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+
+    @staticmethod
+    async def _write_chunk(writer, data):
+        """Send one chunk of a streamed response"""
+        if data:
+            writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+    @staticmethod
+    async def _end_chunked(writer):
+        """Finish a streamed response"""
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Serve cover letter generation over HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--profile", help="Profile to serve (defaults to Default)")
+    parser.add_argument("--model", help="Model to use (defaults to the profile's model)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of generations running at once")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Number of waiting generations before requests are rejected with 503")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Service entry point"""
+    args = parse_args(argv)
+
+    from profile_manager import ProfileManager
+    from gemini_client import GeminiClient
+
+    profile_manager = ProfileManager()
+    if args.profile and not profile_manager.set_current_profile(args.profile):
+        print(f"Profile not found: {args.profile}", file=sys.stderr)
+        return 2
+
+    gemini_client = GeminiClient()
+    if gemini_client.backend is None:
+        print("API key is missing! Add one in the Settings tab or settings.json.", file=sys.stderr)
+        return 2
+    gemini_client.update_model(args.model or profile_manager.current_model)
+
+    async def serve():
+        service = GenerationService(
+            gemini_client, profile_manager, args.workers, args.queue_size)
+        await service.serve_forever(args.host, args.port)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
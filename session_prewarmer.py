@@ -0,0 +1,138 @@
+import os
+import threading
+from config import PREWARM_ENABLED, PREWARM_DEBOUNCE_SECONDS
+
+
+class SessionPrewarmer:
+    """
+    Prepares chat sessions in the background before a generation is requested
+
+    Requests are debounced so rapid profile switching only prewarms the last
+    profile, deduplicated against the pending prewarm and, once their delay has
+    passed, against sessions that are already warm. At most one prewarm runs at
+    a time, and profile files are only read on the prewarm thread.
+    """
+
+    def __init__(self, gemini_client):
+        """Initialize the prewarmer for a GeminiClient"""
+        self.gemini_client = gemini_client
+        self._lock = threading.Lock()
+        self._timer = None
+        self._pending = None  # Latest request waiting for its debounce delay or for the running prewarm
+        self._running_key = None
+        self.stats = {"requested": 0, "completed": 0,
+                      "deduplicated": 0, "cancelled": 0, "failed": 0}
+
+    def _make_request(self, resume_path):
+        """Capture the current profile, model and resume as a prewarm request, without touching files"""
+        profile_manager = self.gemini_client.profile_manager
+        request = {
+            "profile_name": profile_manager.current_profile_name,
+            "system_template": profile_manager.current_system_template,
+            "system_core_rules": profile_manager.current_system_core_rules,
+            "resume_path": resume_path,
+            "model": self.gemini_client.model,
+        }
+        request["key"] = (request["profile_name"], request["system_template"], request["system_core_rules"],
+                          resume_path, request["model"])
+        return request
+
+    def _resolve(self, request):
+        """Drop a missing resume and hash the profile files of a request, on the prewarm thread"""
+        if request["resume_path"] and not os.path.exists(request["resume_path"]):
+            request["resume_path"] = None
+        request["profile_hash"] = self.gemini_client._get_profile_hash(
+            request["profile_name"], request["system_template"], request["system_core_rules"],
+            request["resume_path"])
+
+    def _is_stale(self, request):
+        """Check whether the profile or model changed since the request was made"""
+        profile_manager = self.gemini_client.profile_manager
+        return (request["profile_name"] != profile_manager.current_profile_name
+                or request["model"] != self.gemini_client.model)
+
+    def request(self, resume_path=None, delay=PREWARM_DEBOUNCE_SECONDS):
+        """
+        Prewarm the session of the current profile after a short delay
+
+        A newer request replaces a pending one, so only the last of several quick
+        changes is prewarmed.
+
+        Returns:
+            True if a prewarm was scheduled
+        """
+        if not PREWARM_ENABLED or self.gemini_client.backend is None:
+            return False
+        request = self._make_request(resume_path)
+
+        with self._lock:
+            self.stats["requested"] += 1
+            # Warm sessions are only checked once the delay passed, as that reads the profile files
+            if self._pending is not None and self._pending["key"] == request["key"]:
+                self.stats["deduplicated"] += 1
+                return False
+
+            self._cancel_pending_locked()
+            self._pending = request
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+        return True
+
+    def _cancel_pending_locked(self):
+        """Drop the pending request and its timer, with the lock held"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending is not None:
+            self._pending = None
+            self.stats["cancelled"] += 1
+
+    def cancel(self):
+        """Drop the pending prewarm, e.g. when a generation starts - a running one finishes on its own"""
+        with self._lock:
+            self._cancel_pending_locked()
+
+    def _on_timer(self):
+        """Run the pending request once its debounce delay has passed"""
+        with self._lock:
+            if threading.current_thread() is not self._timer:
+                return  # Replaced by a newer request while waiting for the lock
+            self._timer = None
+            if self._running_key is not None:
+                return  # Started when the running prewarm finishes
+            request, self._pending = self._pending, None
+            if request is None:
+                return
+            self._running_key = request["key"]
+        self._run(request)
+
+    def _run(self, request):
+        """Prewarm sessions one at a time until no debounced request is waiting"""
+        while request is not None:
+            outcome = "cancelled" if self._is_stale(request) else self._prewarm(request)
+            with self._lock:
+                self.stats[outcome] += 1
+                self._running_key = None
+                request = None
+                # A request whose delay already passed waited for this one
+                if self._pending is not None and self._timer is None:
+                    request, self._pending = self._pending, None
+                    self._running_key = request["key"]
+
+    def _prewarm(self, request):
+        """Prepare the session of one request unless it is already warm, returning the stat it counts towards"""
+        try:
+            self._resolve(request)
+            if self.gemini_client._has_warm_session(
+                    request["profile_hash"], request["model"], request["profile_name"]):
+                return "deduplicated"
+            with self.gemini_client.tracer.span(
+                    "session.prewarm", profile_hash=request["profile_hash"][:8], model=request["model"]):
+                self.gemini_client._initialize_chat_session(
+                    request["system_template"], request["system_core_rules"],
+                    request["resume_path"], model=request["model"])
+            return "completed"
+        except Exception as e:
+            print(f"Error prewarming chat session: {str(e)}")
+            return "failed"
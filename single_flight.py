@@ -0,0 +1,64 @@
+import threading
+
+
+class _Flight:
+    """One in-flight call and its outcome"""
+
+    def __init__(self):
+        """Initialize an unfinished flight"""
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time, concurrent callers for the same key share its outcome"""
+
+    def __init__(self):
+        """Initialize without calls in flight"""
+        self._lock = threading.Lock()
+        self._flights = {}  # Key -> _Flight
+        self.stats = {"calls": 0, "shared": 0}
+
+    def do(self, key, function):
+        """
+        Call a function unless a call for the same key is already running, then wait for that one
+
+        Args:
+            key: Identifies calls that produce the same result
+            function: Callable without arguments
+
+        Returns:
+            Tuple of the result and whether it came from another caller's call, which
+            also re-raises that call's exception
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["calls"] += 1
+            else:
+                self.stats["shared"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]  # Later callers start a new call
+            flight.done.set()
+        return flight.result, False
+
+    def get_stats(self):
+        """Get the number of calls made and of callers that shared another caller's call"""
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._flights))
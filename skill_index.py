@@ -0,0 +1,194 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from context_ranker import tokenize
+from single_flight import SingleFlight
+
+# Longest skill phrase in words, job descriptions are matched with windows up to this size
+MAX_PHRASE_WORDS = 3
+# Skill indexes kept for recently used personal contexts
+INDEX_CACHE_SIZE = 8
+# Skills listed per line of the overlap summary
+MAX_LISTED_SKILLS = 20
+
+# Common skills recognised in profiles and job descriptions, as displayed in the summary.
+# Skills that are also everyday words (Go, R, CAN) are left out or spelled unambiguously
+SKILL_LEXICON = (
+    # Languages
+    "Python", "Java", "JavaScript", "TypeScript", "C++", "C#", "Golang", "Rust", "Kotlin",
+    "Swift", "Objective-C", "Ruby", "PHP", "Scala", "MATLAB", "Perl", "Bash", "PowerShell",
+    "SQL", "HTML", "CSS", "Sass", "Dart", "Lua", "Haskell", "Elixir", "Assembly", "VHDL", "Verilog",
+    # Frameworks and libraries
+    "React", "Angular", "Vue", "Svelte", "Next.js", "Node.js", "Django", "Flask",
+    "FastAPI", "Express.js", "Spring", "Spring Boot", "Java Servlets", "Hibernate", ".NET", "ASP.NET",
+    "Ruby on Rails", "Laravel", "Flutter", "React Native", "jQuery", "Bootstrap", "Tailwind",
+    "Redux", "GraphQL", "REST", "RESTful APIs", "gRPC", "WebSockets", "Pandas", "NumPy",
+    "SciPy", "scikit-learn", "TensorFlow", "PyTorch", "Keras", "OpenCV", "Spark", "Hadoop",
+    "Kafka", "RabbitMQ", "Celery", "Qt", "Unity", "Unreal Engine",
+    # Data and infrastructure
+    "PostgreSQL", "MySQL", "SQLite", "MongoDB", "Redis", "Elasticsearch", "Cassandra",
+    "DynamoDB", "Oracle", "Firebase", "Snowflake", "BigQuery", "AWS", "Azure", "GCP",
+    "Google Cloud", "Docker", "Kubernetes", "Terraform", "Ansible", "Jenkins", "GitHub Actions",
+    "GitLab CI", "CI/CD", "Git", "Linux", "Unix", "Nginx", "Apache", "Serverless", "Microservices",
+    "DevOps", "Data Engineering", "Data Analysis", "Data Science", "ETL", "Data Pipelines",
+    "Database Design", "Machine Learning", "Deep Learning", "Computer Vision", "NLP",
+    "Natural Language Processing", "LLM", "Generative AI", "Artificial Intelligence",
+    # Embedded and hardware
+    "Embedded Systems", "Firmware", "Arduino", "ESP32", "Raspberry Pi", "STM32", "FreeRTOS",
+    "RTOS", "Microcontrollers", "IoT", "I2C", "SPI", "UART", "CAN bus", "PCB Design", "Electronics",
+    "Robotics", "Stepper Motors", "Sensors", "FPGA",
+    # Practices
+    "Agile", "Scrum", "Kanban", "TDD", "Unit Testing", "Test Automation", "Selenium", "Jest",
+    "Cypress", "Pytest", "JUnit", "Object-Oriented Programming", "OOP", "Design Patterns",
+    "System Design", "Software Architecture", "Distributed Systems", "Concurrency",
+    "Multithreading", "Performance Optimization", "Debugging", "Security", "Cybersecurity",
+    "Networking", "TCP/IP", "HTTP", "OAuth", "Full-Stack", "Front End", "Back End",
+    "Web Development", "Mobile Development", "Android", "iOS", "UI Design", "UX Design",
+    "Figma", "API Design", "Cloud Computing", "Data Structures", "Algorithms",
+    # Professional
+    "Communication", "Teamwork", "Leadership", "Mentoring", "Problem Solving",
+    "Project Management", "Stakeholder Management", "Technical Writing", "Documentation",
+    "Code Review", "Customer Service", "Time Management",
+)
+
+# Names that read like technology in a profile: digits mixed with letters (ESP32), inner
+# capitals (FreeRTOS, ArduinoJson) or symbols (C++, Node.js)
+TECH_TERM_PATTERN = re.compile(
+    r"(?<![\w.])(?=[A-Za-z0-9+#.]*[A-Za-z])[A-Za-z][A-Za-z0-9]*(?:[+#]+|(?:\.[A-Za-z0-9]+)+)?")
+
+# Last parts of dotted technology names such as Node.js and ASP.NET
+DOTTED_NAME_SUFFIXES = {"js", "net", "py", "io"}
+
+
+def _phrase_key(text):
+    """Get the lookup key of a skill phrase, normalized like job description tokens"""
+    return " ".join(tokenize(text))
+
+
+def _is_tech_term(term):
+    """Check whether a word looks like the name of a technology"""
+    if "." in term and term.rsplit(".", 1)[1].lower() not in DOTTED_NAME_SUFFIXES:
+        return False  # Domains, e-mail addresses and missing spaces after a full stop
+    has_letter_and_digit = any(c.isdigit() for c in term) and any(c.isalpha() for c in term)
+    has_inner_capital = any(c.isupper() for c in term[1:]) and any(c.islower() for c in term)
+    return has_letter_and_digit or has_inner_capital or any(c in "+#." for c in term)
+
+
+LEXICON_KEYS = {}  # Phrase key -> display name
+for _skill in SKILL_LEXICON:
+    LEXICON_KEYS.setdefault(_phrase_key(_skill), _skill)
+LEXICON_KEYS.pop("", None)
+
+
+class _ProfileSkills:
+    """Skills mentioned in one personal context"""
+
+    def __init__(self, text):
+        """Collect the lexicon skills and technology names of a personal context"""
+        self.skills = {}  # Phrase key -> display name
+        for key, display_name in _match_phrases(tokenize(text), LEXICON_KEYS):
+            self.skills.setdefault(key, display_name)
+        for term in TECH_TERM_PATTERN.findall(text):
+            key = _phrase_key(term)
+            if key and _is_tech_term(term):
+                self.skills.setdefault(key, term)
+
+
+def _match_phrases(tokens, phrases):
+    """Yield (key, display name) for every window of up to MAX_PHRASE_WORDS tokens that is a known phrase"""
+    for start in range(len(tokens)):
+        for size in range(1, MAX_PHRASE_WORDS + 1):
+            if start + size > len(tokens):
+                break
+            key = " ".join(tokens[start:start + size])
+            display_name = phrases.get(key)
+            if display_name is not None:
+                yield key, display_name
+
+
+class SkillIndex:
+    """Finds the skills a job description shares with a profile before the model is asked"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(SkillIndex, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the skill index"""
+        if not self._initialized:
+            self._profiles = OrderedDict()  # Context digest -> _ProfileSkills, least recently used first
+            self._lock = threading.Lock()
+            # Concurrent batch workers wait for one build of a profile's index
+            self._builds = SingleFlight()
+            self.stats = {"profiles_indexed": 0, "matches": 0}
+            self._initialized = True
+
+    def _get_profile_skills(self, personal_context):
+        """Get the skills of a personal context, indexing it on first use or after it was edited"""
+        digest = hashlib.md5(personal_context.encode()).hexdigest()
+        with self._lock:
+            profile = self._profiles.get(digest)
+            if profile is not None:
+                self._profiles.move_to_end(digest)
+                return profile
+
+        profile, shared = self._builds.do(
+            digest, lambda: _ProfileSkills(personal_context))
+        if not shared:
+            with self._lock:
+                self._profiles[digest] = profile
+                self.stats["profiles_indexed"] += 1
+                while len(self._profiles) > INDEX_CACHE_SIZE:
+                    self._profiles.popitem(last=False)
+        return profile
+
+    def match(self, personal_context, job_description):
+        """
+        Match a job description against the skills of a profile
+
+        Returns:
+            Tuple of the skills in both and the lexicon skills only the job description
+            mentions, each a list of display names in job description order
+        """
+        profile = self._get_profile_skills(personal_context)
+        matched, missing = OrderedDict(), OrderedDict()
+        tokens = tokenize(job_description)
+        # Profile skills take precedence so their own spelling is shown
+        for key, _ in _match_phrases(tokens, profile.skills):
+            matched.setdefault(key, profile.skills[key])
+        for key, display_name in _match_phrases(tokens, LEXICON_KEYS):
+            if key not in profile.skills:
+                missing.setdefault(key, display_name)
+
+        with self._lock:
+            self.stats["matches"] += 1
+        return list(matched.values()), list(missing.values())
+
+    def summarize_overlap(self, personal_context, job_description):
+        """
+        Get a compact skill overlap summary to send with a job description
+
+        Returns:
+            Tuple of the summary, empty if no skill was found, and the match counts
+        """
+        matched, missing = self.match(personal_context, job_description)
+        lines = []
+        if matched:
+            lines.append("Skills in both the job description and my profile: " +
+                         ", ".join(matched[:MAX_LISTED_SKILLS]))
+        if missing:
+            lines.append("Skills the job asks for that my profile does not mention (do not claim them): " +
+                         ", ".join(missing[:MAX_LISTED_SKILLS]))
+        summary = "Skill overlap found before writing:\n" + "\n".join(lines) if lines else ""
+        return summary, {"matched_skills": len(matched), "missing_skills": len(missing)}
+
+    def get_stats(self):
+        """Get the number of indexed profiles and matched job descriptions"""
+        with self._lock:
+            return dict(self.stats, cached_profiles=len(self._profiles))
@@ -0,0 +1,350 @@
+import time
+import random
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from google.genai import errors, types
+
+from generation_backend import GenerationBackend
+
+# Approximate characters per token used for stub token counts
+CHARS_PER_TOKEN = 4
+# Lifetime reported for stub uploads, matching Gemini's 48 hours
+STUB_UPLOAD_TTL = 48 * 60 * 60
+# Seconds over which simulated per-minute quotas are counted
+QUOTA_WINDOW = 60.0
+
+_LETTER_WORDS = (
+    "experience project team software design delivered built improved customer quality "
+    "reliable passionate learning collaborate role company skills python testing data "
+    "systems performance ownership growth problem solving impact product users results"
+).split()
+
+
+class StubBackend(GenerationBackend):
+    """
+    Deterministic offline backend that replays configurable latency, chunk sizes,
+    token counts and error rates, so the real GeminiClient code paths can be
+    exercised and measured without a network
+
+    Responses are real google-genai types, including usage metadata, so history
+    serialization and usage accounting behave as they do against the API.
+    """
+
+    def __init__(self, first_chunk_latency=0.4, chunk_latency=0.03, chunk_size=60, output_tokens=400,
+                 priming_latency=0.6, upload_latency=0.15, upload_bytes_per_second=5 * 1024 * 1024,
+                 cache_latency=0.3, supports_caching=False, jitter=0.0, tail_rate=0.0, tail_latency=5.0,
+                 error_rate=0.0, error_code=503, requests_per_minute=0, tokens_per_minute=0, seed=0):
+        """
+        Initialize the stub backend
+
+        Args:
+            first_chunk_latency: Seconds before the first chunk of a letter
+            chunk_latency: Seconds between streamed chunks
+            chunk_size: Characters per streamed chunk
+            output_tokens: Approximate length of each generated letter in tokens
+            priming_latency: Seconds for the "sending info" priming round trip
+            upload_latency: Fixed seconds per file upload
+            upload_bytes_per_second: Upload bandwidth added on top of upload_latency
+            cache_latency: Seconds to create a context cache
+            supports_caching: Whether context caches can be created, as on models that support them
+            jitter: Random +/- fraction applied to every latency
+            tail_rate: Fraction of requests whose first chunk takes tail_latency instead
+            tail_latency: Seconds before the first chunk of a slow request
+            error_rate: Fraction of requests that fail with error_code
+            error_code: HTTP status of injected errors (429 for quota, 503 for overload)
+            requests_per_minute: Simulated request quota of every model, 0 for none
+            tokens_per_minute: Simulated token quota of every model, 0 for none
+            seed: Seed making latencies, errors and letters reproducible
+        """
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = max(1, chunk_size)
+        self.output_tokens = output_tokens
+        self.priming_latency = priming_latency
+        self.upload_latency = upload_latency
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.cache_latency = cache_latency
+        self.supports_caching = supports_caching
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.caches = {}  # Cache name -> cached token count
+        self._quota_usage = deque()  # (time, tokens) of the requests in the last quota window
+        self.stats = {
+            "chats_created": 0,
+            "messages": 0,
+            "stream_messages": 0,
+            "generate_calls": 0,
+            "uploads": 0,
+            "bytes_uploaded": 0,
+            "caches_created": 0,
+            "errors": 0,
+            "quota_errors": 0,
+        }
+
+    # Randomness and accounting
+
+    def _random(self):
+        """Draw from the shared seeded generator"""
+        with self._lock:
+            return self._rng.random()
+
+    def _count(self, stat, amount=1):
+        """Increment a stats counter"""
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _sleep(self, seconds):
+        """Wait for a latency with jitter applied"""
+        if self.jitter:
+            seconds *= 1 + self.jitter * (2 * self._random() - 1)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _maybe_fail(self):
+        """Raise an API error for the configured fraction of requests"""
+        if self.error_rate and self._random() < self.error_rate:
+            self._count("errors")
+            status = "RESOURCE_EXHAUSTED" if self.error_code == 429 else "UNAVAILABLE"
+            response_json = {"error": {"code": self.error_code, "status": status,
+                                       "message": "Injected by StubBackend"}}
+            if self.error_code < 500:
+                raise errors.ClientError(self.error_code, response_json)
+            raise errors.ServerError(self.error_code, response_json)
+
+    def _check_quota(self, prompt_tokens):
+        """Raise RESOURCE_EXHAUSTED like the API when a request exceeds the simulated quotas"""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        tokens = prompt_tokens + self.output_tokens
+        now = time.monotonic()
+        with self._lock:
+            while self._quota_usage and self._quota_usage[0][0] <= now - QUOTA_WINDOW:
+                self._quota_usage.popleft()
+            over_requests = self.requests_per_minute and len(
+                self._quota_usage) >= self.requests_per_minute
+            over_tokens = self.tokens_per_minute and sum(
+                used for _, used in self._quota_usage) + tokens > self.tokens_per_minute
+            if not over_requests and not over_tokens:
+                self._quota_usage.append((now, tokens))
+                return
+            self.stats["quota_errors"] += 1
+            retry_delay = QUOTA_WINDOW - (now - self._quota_usage[0][0]) if self._quota_usage else 0
+        raise errors.ClientError(429, {"error": {
+            "code": 429, "status": "RESOURCE_EXHAUSTED",
+            "message": "Simulated quota exceeded by StubBackend",
+            "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                         "retryDelay": f"{max(1, int(retry_delay + 1))}s"}]}})
+
+    def _first_chunk_delay(self):
+        """Get the wait before the first chunk, occasionally a slow tail request"""
+        if self.tail_rate and self._random() < self.tail_rate:
+            return self.tail_latency
+        return self.first_chunk_latency
+
+    # Content helpers
+
+    @staticmethod
+    def _to_content(message, role="user"):
+        """Convert a message as accepted by chats into a types.Content"""
+        items = message if isinstance(message, list) else [message]
+        parts = []
+        for item in items:
+            if isinstance(item, str):
+                parts.append(types.Part.from_text(text=item))
+            elif isinstance(item, types.File):
+                parts.append(types.Part.from_uri(
+                    file_uri=item.uri, mime_type=item.mime_type))
+            elif isinstance(item, types.Part):
+                parts.append(item)
+            elif isinstance(item, types.Content):
+                parts.extend(item.parts or [])
+        return types.Content(role=role, parts=parts)
+
+    @staticmethod
+    def _count_tokens(contents):
+        """Estimate the tokens of text parts, counting each file part as a fixed size"""
+        tokens = 0
+        for content in contents:
+            for part in content.parts or []:
+                if part.text:
+                    tokens += len(part.text) // CHARS_PER_TOKEN + 1
+                elif part.file_data:
+                    tokens += 1000
+        return tokens
+
+    def _compose_letter(self):
+        """Build a deterministic letter of roughly output_tokens tokens"""
+        with self._lock:
+            words = ["Dear", "Hiring", "Manager,\n\n"]
+            length = 0
+            while length < self.output_tokens * CHARS_PER_TOKEN:
+                word = self._rng.choice(_LETTER_WORDS)
+                words.append(word)
+                length += len(word) + 1
+        return " ".join(words) + "\n\nSincerely,\nApplicant"
+
+    def _reply_text(self, content):
+        """Get the reply to a user turn, acknowledging the app's priming message"""
+        texts = [part.text for part in content.parts or [] if part.text]
+        if texts and texts[0] == "sending info":
+            return "ok to proceed"
+        return self._compose_letter()
+
+    @staticmethod
+    def _response(text, prompt_tokens, cached_tokens=0, usage_text=""):
+        """Build a GenerateContentResponse carrying text and the usage of usage_text (None for no usage)"""
+        usage = None
+        if usage_text is not None:
+            output_tokens = len(usage_text or text) // CHARS_PER_TOKEN + 1
+            usage = types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens + cached_tokens,
+                cached_content_token_count=cached_tokens or None,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + cached_tokens + output_tokens,
+            )
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(
+                role="model", parts=[types.Part.from_text(text=text)]))],
+            usage_metadata=usage,
+        )
+
+    # GenerationBackend implementation
+
+    def get_rate_limits(self, model):
+        """Get the simulated quotas, or None if requests are not limited"""
+        limits = {"rpm": self.requests_per_minute, "tpm": self.tokens_per_minute}
+        return {name: value for name, value in limits.items() if value} or None
+
+    def create_chat(self, model, config, history=None):
+        """Create a chat session supporting send_message, send_message_stream and get_history"""
+        self._count("chats_created")
+        cached_tokens = 0
+        if config is not None and config.cached_content:
+            if config.cached_content not in self.caches:
+                raise errors.ClientError(404, {"error": {
+                    "code": 404, "status": "NOT_FOUND", "message": "Cached content not found"}})
+            cached_tokens = self.caches[config.cached_content]
+        return StubChat(self, history, cached_tokens)
+
+    def upload_file(self, file, mime_type):
+        """Upload a file-like object, returning a types.File"""
+        self._maybe_fail()
+        size = len(file.read())
+        delay = self.upload_latency
+        if self.upload_bytes_per_second:
+            delay += size / self.upload_bytes_per_second
+        self._sleep(delay)
+        self._count("uploads")
+        self._count("bytes_uploaded", size)
+
+        name = f"files/stub-{next(self._ids)}"
+        return types.File(
+            name=name,
+            uri=f"stub://{name}",
+            mime_type=mime_type,
+            size_bytes=size,
+            expiration_time=datetime.now(timezone.utc) +
+            timedelta(seconds=STUB_UPLOAD_TTL),
+        )
+
+    def create_cache(self, model, config):
+        """Create a context cache from a types.CreateCachedContentConfig, returning a types.CachedContent"""
+        if not self.supports_caching:
+            raise errors.ClientError(400, {"error": {
+                "code": 400, "status": "INVALID_ARGUMENT",
+                "message": f"Context caching is not supported for {model}"}})
+        self._maybe_fail()
+        self._sleep(self.cache_latency)
+        contents = [self._to_content(content.parts, content.role)
+                    for content in config.contents or []]
+        tokens = self._count_tokens(contents)
+        if config.system_instruction:
+            tokens += len(config.system_instruction) // CHARS_PER_TOKEN + 1
+
+        name = f"cachedContents/stub-{next(self._ids)}"
+        with self._lock:
+            self.caches[name] = tokens
+        self._count("caches_created")
+        return types.CachedContent(name=name, model=model)
+
+    def delete_cache(self, name):
+        """Delete a context cache by name"""
+        with self._lock:
+            self.caches.pop(name, None)
+
+    def generate_content(self, model, contents, config):
+        """Generate a response without chat history, returning a types.GenerateContentResponse"""
+        self._count("generate_calls")
+        self._maybe_fail()
+        prompt_tokens = self._count_tokens([self._to_content(contents)])
+        self._check_quota(prompt_tokens)
+        self._sleep(self._first_chunk_delay())
+        text = self._compose_letter()
+        self._sleep(self.chunk_latency * (len(text) // self.chunk_size))
+        return self._response(text, prompt_tokens)
+
+
+class StubChat:
+    """Chat session of the StubBackend mirroring the google-genai Chat methods the app uses"""
+
+    def __init__(self, backend, history=None, cached_tokens=0):
+        """Initialize the chat from an optional history"""
+        self.backend = backend
+        self.history = list(history or [])
+        self.cached_tokens = cached_tokens
+
+    def get_history(self):
+        """Get a copy of the chat history"""
+        return list(self.history)
+
+    def send_message(self, message):
+        """Send a message and wait for the whole reply"""
+        self.backend._count("messages")
+        self.backend._maybe_fail()
+        content = self.backend._to_content(message)
+        self.backend._check_quota(
+            self.backend._count_tokens(self.history + [content]) + self.cached_tokens)
+        text = self.backend._reply_text(content)
+        if text == "ok to proceed":
+            self.backend._sleep(self.backend.priming_latency)
+        else:
+            self.backend._sleep(self.backend._first_chunk_delay())
+            self.backend._sleep(self.backend.chunk_latency *
+                                (len(text) // self.backend.chunk_size))
+
+        response = self.backend._response(
+            text, self.backend._count_tokens(self.history + [content]), self.cached_tokens)
+        self.history.extend([content, response.candidates[0].content])
+        return response
+
+    def send_message_stream(self, message):
+        """Send a message and yield the reply in chunks, with usage metadata on the last one"""
+        self.backend._count("stream_messages")
+        self.backend._maybe_fail()
+        content = self.backend._to_content(message)
+        text = self.backend._reply_text(content)
+        prompt_tokens = self.backend._count_tokens(self.history + [content])
+        self.backend._check_quota(prompt_tokens + self.cached_tokens)
+        chunk_size = self.backend.chunk_size
+
+        self.backend._sleep(self.backend._first_chunk_delay())
+        for start in range(0, len(text), chunk_size):
+            if start:
+                self.backend._sleep(self.backend.chunk_latency)
+            last = start + chunk_size >= len(text)
+            yield self.backend._response(text[start:start + chunk_size], prompt_tokens,
+                                         self.cached_tokens, usage_text=text if last else None)
+
+        self.history.extend([content, types.Content(
+            role="model", parts=[types.Part.from_text(text=text)])])
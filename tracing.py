@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from config import CACHE_DIR, TRACING_ENABLED, TRACE_MAX_BYTES, TRACE_BACKUP_COUNT
+
+TRACE_DIR = os.path.join(CACHE_DIR, "traces")
+# Most recent durations kept per span name for the in-memory percentiles
+SUMMARY_WINDOW = 200
+
+
+class Span:
+    """A timed unit of work with attributes, nested under the span that was active when it started"""
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        """Start the span"""
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        """Set one attribute"""
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        """Set several attributes"""
+        self.attributes.update(attributes)
+
+    def elapsed_ms(self):
+        """Get the milliseconds since the span started"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def finish(self):
+        """Stop the span clock"""
+        self.duration_ms = round(self.elapsed_ms(), 3)
+
+    def to_record(self):
+        """Get the span as a JSON-serializable dictionary"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": self.duration_ms,
+            "thread": threading.current_thread().name,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """Records nested timing spans to a rotating JSONL file and keeps per-span statistics in memory"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(Tracer, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the tracer"""
+        if not self._initialized:
+            self.enabled = TRACING_ENABLED
+            self._local = threading.local()  # Stack of active spans per thread
+            self._lock = threading.Lock()
+            self._summary = {}  # Span name -> {"count", "errors", "total_ms", "max_ms", "recent"}
+            self._logger = None
+            self._initialized = True
+
+    def _get_logger(self):
+        """Get the logger writing the rotating trace file, creating it on first use"""
+        if self._logger is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            logger = logging.getLogger("cover_letter.trace")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            if not logger.handlers:
+                handler = RotatingFileHandler(
+                    os.path.join(TRACE_DIR, "trace.jsonl"), maxBytes=TRACE_MAX_BYTES,
+                    backupCount=TRACE_BACKUP_COUNT, encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def _stack(self):
+        """Get the active span stack of the current thread"""
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current_span(self):
+        """Get the innermost active span of the current thread, or None"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None, **attributes):
+        """
+        Time a block of work as a span
+
+        Args:
+            name: Span name, e.g. "session.init"
+            parent: Span to nest under when the work runs on another thread than its parent
+            **attributes: Initial span attributes
+
+        Yields:
+            The Span, so attributes can be added while it runs
+        """
+        parent = parent or self.current_span()
+        span = Span(name, parent.trace_id if parent else uuid.uuid4().hex[:16],
+                    parent.span_id if parent else None, attributes)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        except GeneratorExit:
+            span.set_attribute("cancelled", True)  # Consumer stopped a traced generator
+            raise
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            if span in stack:
+                stack.remove(span)
+            span.finish()
+            self._record(span)
+
+    def _record(self, span):
+        """Add a finished span to the summary and the trace file"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._summary.setdefault(span.name, {
+                "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "recent": deque(maxlen=SUMMARY_WINDOW)})
+            stats["count"] += 1
+            stats["errors"] += 1 if span.error else 0
+            stats["total_ms"] += span.duration_ms
+            stats["max_ms"] = max(stats["max_ms"], span.duration_ms)
+            stats["recent"].append(span.duration_ms)
+
+        try:
+            self._get_logger().info(json.dumps(span.to_record(), default=str))
+        except Exception as e:
+            print(f"Error writing trace span: {str(e)}")
+
+    def get_summary(self):
+        """Get count, errors, mean, p50, p95 and max milliseconds per span name"""
+        with self._lock:
+            summary = {}
+            for name, stats in sorted(self._summary.items()):
+                recent = sorted(stats["recent"])
+                summary[name] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 2),
+                    "p50_ms": round(recent[len(recent) // 2], 2),
+                    "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2),
+                    "max_ms": round(stats["max_ms"], 2),
+                }
+            return summary
+
+    def clear_summary(self):
+        """Reset the in-memory statistics"""
+        with self._lock:
+            self._summary = {}
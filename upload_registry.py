@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import threading
+from config import CACHE_DIR
+
+
+class UploadRegistry:
+    """Tracks files uploaded to the Gemini API by content hash so they can be reused until they expire"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(UploadRegistry, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the upload registry"""
+        if not self._initialized:
+            self.registry = {}
+            self._lock = threading.Lock()
+            self._load_registry()
+            self._initialized = True
+
+    def _get_registry_filepath(self):
+        """Get the file path of the persisted registry"""
+        return os.path.join(CACHE_DIR, "upload_registry.json")
+
+    def _load_registry(self):
+        """Load the registry from disk, dropping expired uploads"""
+        registry_file = self._get_registry_filepath()
+        try:
+            if os.path.exists(registry_file):
+                with open(registry_file, 'r') as f:
+                    self.registry = json.load(f)
+                self._clean_expired_uploads()
+        except Exception as e:
+            # If there's any issue, start with an empty registry
+            print(f"Error loading upload registry: {str(e)}")
+            self.registry = {}
+
+    def _persist_registry(self):
+        """Save the registry to disk"""
+        try:
+            with open(self._get_registry_filepath(), 'w') as f:
+                json.dump(self.registry, f)
+        except Exception as e:
+            print(f"Error persisting upload registry: {str(e)}")
+
+    def _clean_expired_uploads(self):
+        """Remove expired uploads from the registry"""
+        current_time = time.time()
+        self.registry = {
+            k: v for k, v in self.registry.items()
+            if v.get("expiry", 0) > current_time
+        }
+
+    def get_upload(self, content_hash):
+        """Get the upload info for a content hash if it is still valid"""
+        with self._lock:
+            upload = self.registry.get(content_hash)
+            if upload and upload.get("expiry", 0) > time.time():
+                return upload
+        return None
+
+    def save_upload(self, content_hash, name, uri, mime_type, expiry_time):
+        """Record an uploaded file under the hash of its content"""
+        with self._lock:
+            self._clean_expired_uploads()
+            self.registry[content_hash] = {
+                "name": name,
+                "uri": uri,
+                "mime_type": mime_type,
+                "expiry": expiry_time
+            }
+            self._persist_registry()
+
+    def forget_uploads(self, names):
+        """Drop uploads by remote file name, e.g. after the API rejected them"""
+        names = set(names)
+        with self._lock:
+            self.registry = {
+                k: v for k, v in self.registry.items()
+                if v.get("name") not in names
+            }
+            self._persist_registry()
+
+    def clear(self):
+        """Forget all uploads"""
+        with self._lock:
+            self.registry = {}
+            self._persist_registry()
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import atexit
+import threading
+from config import CACHE_DIR, USAGE_LEDGER_PERSIST_INTERVAL
+
+USAGE_FIELDS = ("requests", "prompt_tokens", "cached_tokens",
+                "output_tokens", "total_tokens")
+
+
+class UsageLedger:
+    """Aggregates the token usage reported by the API per day, profile and model"""
+
+    _instance = None
+
+    def __new__(cls):
+        """Implement singleton pattern"""
+        if cls._instance is None:
+            cls._instance = super(UsageLedger, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """Initialize the usage ledger"""
+        if not self._initialized:
+            self.totals = {}  # "day|profile|model" -> usage counters
+            self._lock = threading.Lock()
+            self._last_persist = 0.0
+            self._dirty = False  # Usage recorded since the ledger was saved
+            self._load_ledger()
+            atexit.register(self.flush)
+            self._initialized = True
+
+    def _get_ledger_filepath(self):
+        """Get the file path of the persisted ledger"""
+        return os.path.join(CACHE_DIR, "usage_ledger.json")
+
+    def _load_ledger(self):
+        """Load the ledger from disk"""
+        ledger_file = self._get_ledger_filepath()
+        try:
+            if os.path.exists(ledger_file):
+                with open(ledger_file, 'r') as f:
+                    self.totals = json.load(f)
+        except Exception as e:
+            # If there's any issue, start with an empty ledger
+            print(f"Error loading usage ledger: {str(e)}")
+            self.totals = {}
+
+    def _persist_ledger(self):
+        """Save the ledger to disk, called with the lock held"""
+        ledger_file = self._get_ledger_filepath()
+        try:
+            with open(ledger_file + ".tmp", 'w') as f:
+                json.dump(self.totals, f, separators=(",", ":"))
+            os.replace(ledger_file + ".tmp", ledger_file)
+            self._last_persist = time.time()
+            self._dirty = False
+        except Exception as e:
+            print(f"Error persisting usage ledger: {str(e)}")
+
+    def flush(self):
+        """Save usage that responses have not written yet"""
+        with self._lock:
+            if self._dirty:
+                self._persist_ledger()
+
+    def record(self, profile_name, model, usage_metadata):
+        """
+        Add the usage metadata of one response to today's totals
+
+        Args:
+            profile_name: Profile the request was made for
+            model: Model that served the request
+            usage_metadata: GenerateContentResponseUsageMetadata of the response
+
+        Returns:
+            True if usage was recorded
+        """
+        if usage_metadata is None:
+            return False
+        # The prompt count includes cached tokens, which are billed at a reduced rate
+        usage = {
+            "requests": 1,
+            "prompt_tokens": usage_metadata.prompt_token_count or 0,
+            "cached_tokens": usage_metadata.cached_content_token_count or 0,
+            "output_tokens": usage_metadata.candidates_token_count or 0,
+            "total_tokens": usage_metadata.total_token_count or 0,
+        }
+        key = f"{time.strftime('%Y-%m-%d')}|{profile_name}|{model}"
+        with self._lock:
+            totals = self.totals.setdefault(
+                key, {field: 0 for field in USAGE_FIELDS})
+            for field in USAGE_FIELDS:
+                totals[field] += usage[field]
+            # Rewriting the whole ledger on each response would grow with its history
+            if time.time() - self._last_persist >= USAGE_LEDGER_PERSIST_INTERVAL:
+                self._persist_ledger()
+            else:
+                self._dirty = True
+        return True
+
+    def get_rows(self):
+        """Get one usage row per day, profile and model, most recent day first"""
+        with self._lock:
+            rows = []
+            for key, totals in self.totals.items():
+                day, profile_name, model = key.split("|", 2)
+                rows.append({"day": day, "profile": profile_name,
+                             "model": model, **totals})
+        rows.sort(key=lambda row: (row["day"], row["profile"], row["model"]))
+        rows.sort(key=lambda row: row["day"], reverse=True)
+        return rows
+
+    def get_totals(self, group_by):
+        """
+        Sum usage by "day", "profile" or "model"
+
+        Returns:
+            Dictionary of group value -> usage counters, including the share of
+            prompt tokens served from context caches as "cached_share"
+        """
+        grouped = {}
+        for row in self.get_rows():
+            totals = grouped.setdefault(
+                row[group_by], {field: 0 for field in USAGE_FIELDS})
+            for field in USAGE_FIELDS:
+                totals[field] += row[field]
+        for totals in grouped.values():
+            totals["cached_share"] = round(
+                totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0
+        return grouped
+
+    def clear(self):
+        """Delete all recorded usage"""
+        with self._lock:
+            self.totals = {}
+            self._persist_ledger()
+        return True